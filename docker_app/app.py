@@ -1,5 +1,4 @@
 import streamlit as st
-import boto3
 from PIL import Image
 import io
 import base64
@@ -11,31 +10,36 @@ import pickle
 
 # Import custom modules and functions
 from utils.auth import Auth
+from utils.aws_clients import get_client
 from config_file import Config
 from models.stability import StabilityModel
 from models.titan import TitanModel
 from models.claude_chatbot import ClaudeChatbot
 from models.claude_prompt_checker import ClaudePromptChecker
 from models.chat_image_editor import ChatImageEditor
+from models.conversation_window import ConversationWindow
 from page_ui.home import render_home
 from page_ui.stability import render_stability
 from page_ui.titan import render_titan
 from page_ui.prompt_engineering import render_prompt_engineering
 from page_ui.chatbot import render_chatbot
 from page_ui.chat_image_editor import render_chat_image_editor
-from utils.s3_operations import save_to_s3, load_from_s3, delete_from_s3
+from utils.s3_operations import save_to_s3, load_from_s3, delete_from_s3, flush_session_stores, SESSION_KEYS
+from utils.session_store import SessionStore
 
 # Set up initial session state
 def initialize_session_state():
     # Load or initialize various session states
     if 'stability_sessions' not in st.session_state:
-        st.session_state.stability_sessions = load_from_s3('stability_sessions') or {}
+        st.session_state.stability_sessions = load_from_s3('stability_sessions') or SessionStore('stability_sessions')
     if 'titan_sessions' not in st.session_state:
-        st.session_state.titan_sessions = load_from_s3('titan_sessions') or {}
+        st.session_state.titan_sessions = load_from_s3('titan_sessions') or SessionStore('titan_sessions')
     if 'current_session' not in st.session_state:
         st.session_state.current_session = None
     if 'chat_history' not in st.session_state:
         st.session_state.chat_history = load_from_s3('chat_history') or []
+    if 'conversation_window' not in st.session_state:
+        st.session_state.conversation_window = ConversationWindow.from_messages(st.session_state.chat_history)
     if 'logged_out' not in st.session_state:
         st.session_state.logged_out = False
     if 'selected_image_index' not in st.session_state:
@@ -86,8 +90,8 @@ def main():
         st.session_state.current_page = "Home"  # Reset to home page on logout
 
     # Initialize AWS clients and models
-    client = boto3.client('bedrock-runtime', region_name='us-east-1')
-    s3_client = boto3.client('s3')
+    client = get_client('bedrock-runtime', region_name='us-east-1')
+    s3_client = get_client('s3')
 
     stability_model = StabilityModel(client, s3_client, Config.S3_BUCKET_NAME)
     titan_model = TitanModel(client, s3_client, Config.S3_BUCKET_NAME)
@@ -108,18 +112,23 @@ def main():
             st.rerun()
 
     # Render the appropriate page based on the current selection
-    if st.session_state.current_page == "Home":
-        render_home()
-    elif st.session_state.current_page == "Stability.ai SDXL 1.0 Image Generator":
-        render_stability(stability_model)
-    elif st.session_state.current_page == "Amazon Titan Image Generator G1":
-        render_titan(titan_model)
-    elif st.session_state.current_page == "Amazon Titan Image Chat Editor":
-        render_chat_image_editor(chat_image_editor)
-    elif st.session_state.current_page == "Prompt Engineering: Best Practices":
-        render_prompt_engineering(claude_prompt_checker)
-    elif st.session_state.current_page == "Claude Chatbot Assistant":
-        render_chatbot(claude_chatbot)
+    try:
+        if st.session_state.current_page == "Home":
+            render_home()
+        elif st.session_state.current_page == "Stability.ai SDXL 1.0 Image Generator":
+            render_stability(stability_model)
+        elif st.session_state.current_page == "Amazon Titan Image Generator G1":
+            render_titan(titan_model)
+        elif st.session_state.current_page == "Amazon Titan Image Chat Editor":
+            render_chat_image_editor(chat_image_editor)
+        elif st.session_state.current_page == "Prompt Engineering: Best Practices":
+            render_prompt_engineering(claude_prompt_checker)
+        elif st.session_state.current_page == "Claude Chatbot Assistant":
+            render_chatbot(claude_chatbot)
+    finally:
+        # Write the sessions saved during this run once, also when the page
+        # ended the run early with st.rerun()
+        flush_session_stores(st.session_state.get(key) for key in SESSION_KEYS)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,55 @@
+# Benchmark: batched deletes versus one delete request per key
+#
+# Run from the docker_app directory:
+#   python -m benchmarks.bench_bulk_delete [--objects N] [--baseline-objects N] [--memory-latency SECONDS | --s3]
+#
+# By default an in-memory backend simulates a round-trip of --memory-latency
+# seconds. With --s3 the configured storage backend is used (the S3 bucket by
+# default): small throw-away objects are written under benchmarks/bulk_delete/
+# and deleted again, so the bucket is left as it was.
+
+import time
+import uuid
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from config_file import Config
+from utils.storage import get_storage, set_storage, MemoryStorage
+from utils.bulk_delete import delete_prefix
+
+def create_objects(prefix, count):
+    storage = get_storage()
+    keys = [f"{prefix}{i:06d}" for i in range(count)]
+    with ThreadPoolExecutor(max_workers=Config.S3_MAX_WORKERS) as executor:
+        list(executor.map(lambda key: storage.put(key, b"x"), keys))
+    return keys
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure objects deleted per second")
+    parser.add_argument("--objects", type=int, default=2500)
+    parser.add_argument("--baseline-objects", type=int, default=200)
+    parser.add_argument("--memory-latency", type=float, default=0.02)
+    parser.add_argument("--s3", action="store_true", help="Write to and delete from the configured storage backend")
+    args = parser.parse_args()
+    if not args.s3:
+        set_storage(MemoryStorage(latency=args.memory_latency))
+
+    storage = get_storage()
+    run_prefix = f"benchmarks/bulk_delete/{uuid.uuid4().hex}/"
+
+    # Baseline: what delete_from_s3 used to do
+    keys = create_objects(f"{run_prefix}baseline/", args.baseline_objects)
+    start = time.perf_counter()
+    for key in keys:
+        storage.delete(key)
+    baseline_elapsed = time.perf_counter() - start
+
+    create_objects(f"{run_prefix}batched/", args.objects)
+    start = time.perf_counter()
+    deleted = delete_prefix(f"{run_prefix}batched/")
+    batched_elapsed = time.perf_counter() - start
+
+    print(f"delete per key:  {args.baseline_objects:6d} objects in {baseline_elapsed:7.2f} s = {args.baseline_objects / baseline_elapsed:9.1f} objects/s")
+    print(f"batched deletes: {deleted:6d} objects in {batched_elapsed:7.2f} s = {deleted / batched_elapsed:9.1f} objects/s")
+
+if __name__ == "__main__":
+    main()
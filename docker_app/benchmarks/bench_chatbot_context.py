@@ -0,0 +1,56 @@
+# Benchmark: chatbot input size and retrieval time with selected context
+#
+# Run from the docker_app directory:
+#   python -m benchmarks.bench_chatbot_context [--top-k K] [--repeat N]
+#
+# Builds the chatbot input for a set of typical questions once with every
+# reference section and once with the top K sections picked by the BM25
+# index, and reports the estimated input tokens of both and the time the
+# retrieval took per query. No request is sent to Bedrock.
+
+import time
+import types
+import argparse
+from config_file import Config
+from models.chatbot_knowledge import KNOWLEDGE_SECTIONS, select_context, estimate_tokens
+from models.claude_chatbot import ClaudeChatbot
+
+QUERIES = [
+    ("answer_questions", "What seed range does Titan support?"),
+    ("answer_questions", "How much does a premium SDXL image cost?"),
+    ("answer_questions", "Which samplers can I use with Stability?"),
+    ("answer_questions", "Can Titan do outpainting and what modes are there?"),
+    ("improve_prompt", "A cat sitting on a windowsill"),
+    ("improve_prompt", "How should I describe the lighting in a portrait?"),
+    ("generate_idea", "A coffee brand that wants cozy autumn ads"),
+    ("generate_idea", "yes"),
+]
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure context selection for the chatbot")
+    parser.add_argument("--top-k", type=int, default=Config.CHATBOT_CONTEXT_TOP_K)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+    Config.BEDROCK_BACKEND = "local"
+    chatbot = ClaudeChatbot(types.SimpleNamespace(meta=types.SimpleNamespace(region_name="us-east-1")), None, None)
+
+    print(f"{len(KNOWLEDGE_SECTIONS)} sections, top {args.top_k} selected")
+    total_full = total_selected = 0
+    for mode, query in QUERIES:
+        Config.CHATBOT_CONTEXT_TOP_K = 0
+        full = estimate_tokens(chatbot.build_input(query, [], mode))
+        Config.CHATBOT_CONTEXT_TOP_K = args.top_k
+        selected = estimate_tokens(chatbot.build_input(query, [], mode))
+
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            select_context(query, args.top_k)
+        elapsed = (time.perf_counter() - start) / args.repeat
+
+        total_full += full
+        total_selected += selected
+        print(f"{mode:17s} {query[:45]:45s} {full:6d} -> {selected:5d} tokens ({1 - selected / full:4.0%} less)  retrieval {elapsed * 1e6:7.1f} us")
+    print(f"average input {total_full // len(QUERIES)} -> {total_selected // len(QUERIES)} tokens ({1 - total_selected / total_full:.0%} less)")
+
+if __name__ == "__main__":
+    main()
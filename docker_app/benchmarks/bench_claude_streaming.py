@@ -0,0 +1,45 @@
+# Benchmark: time to first token of streamed versus blocking Claude calls
+#
+# Run from the docker_app directory:
+#   python -m benchmarks.bench_claude_streaming [--backend local|bedrock] [--repeat N]
+#
+# Sends the same prompt checker request through invoke() and invoke_stream()
+# and reports when the first text was available to the page and when the
+# answer was complete. With the default local backend no AWS access is needed;
+# its simulated delays are set by the BEDROCK_LOCAL_* options below.
+
+import time
+import types
+import argparse
+from config_file import Config
+from models.bedrock import get_stream_stats
+from models.claude_prompt_checker import ClaudePromptChecker
+
+PROMPT = "A lighthouse on a cliff at dusk, oil painting"
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare streamed and blocking Claude calls")
+    parser.add_argument("--backend", choices=["local", "bedrock"], default="local")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--first-token-delay", type=float, default=Config.BEDROCK_LOCAL_FIRST_TOKEN_DELAY)
+    parser.add_argument("--chunk-delay", type=float, default=Config.BEDROCK_LOCAL_CHUNK_DELAY)
+    args = parser.parse_args()
+    Config.BEDROCK_BACKEND = args.backend
+    Config.BEDROCK_LOCAL_FIRST_TOKEN_DELAY = args.first_token_delay
+    Config.BEDROCK_LOCAL_CHUNK_DELAY = args.chunk_delay
+
+    checker = ClaudePromptChecker(types.SimpleNamespace(meta=types.SimpleNamespace(region_name="us-east-1")), None, None)
+    input_text = checker.build_input(PROMPT)
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        checker.invoke(input_text)
+        blocking = time.perf_counter() - start
+
+        stream = checker.invoke_stream(input_text)
+        characters = sum(len(chunk.get('completion', '')) for chunk in stream)
+        print(f"blocking: first text {blocking:6.2f} s  complete {blocking:6.2f} s   "
+              f"streamed: first text {stream.first_token_latency:6.2f} s  complete {stream.latency:6.2f} s  ({characters} characters)")
+    print(get_stream_stats().stats())
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+# Benchmark: chat history size and formatting time as a conversation grows
+#
+# Run from the docker_app directory:
+#   python -m benchmarks.bench_conversation_window [--turns 10 50 200 1000]
+#
+# Replays a synthetic chat and reports, at each turn count, the estimated
+# tokens of the history sent with the next message and the time to format
+# it: rebuilt from the whole chat on every turn, as before, and kept by a
+# ConversationWindow within CHATBOT_HISTORY_TOKEN_BUDGET.
+
+import time
+import argparse
+from models.chatbot_knowledge import estimate_tokens
+from models.conversation_window import ConversationWindow
+
+USER_MESSAGE = "Could you make the lighthouse prompt moodier, maybe with fog rolling in from the sea and a single warm light in the window?"
+ASSISTANT_MESSAGE = ("Here is a refined version of your prompt that leans into the atmosphere you described. " * 12).strip()
+
+# Format the whole history by concatenation, as every turn used to
+def format_full(messages):
+    formatted_history = ""
+    for msg in messages:
+        if msg["role"] == "user":
+            formatted_history += f"Human: {msg['content']}\n\n"
+        else:
+            formatted_history += f"Assistant: {msg['content']}\n\n"
+    return formatted_history
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure chat history formatting as a chat grows")
+    parser.add_argument("--turns", type=int, nargs="+", default=[10, 50, 200, 1000])
+    args = parser.parse_args()
+
+    messages = []
+    window = ConversationWindow()
+    for turn in range(1, max(args.turns) + 1):
+        for role, content in (("user", f"{turn}: {USER_MESSAGE}"), ("assistant", ASSISTANT_MESSAGE)):
+            messages.append({"role": role, "content": content})
+            window.append(role, content)
+        if turn not in args.turns:
+            continue
+
+        start = time.perf_counter()
+        full = format_full(messages)
+        full_elapsed = time.perf_counter() - start
+        start = time.perf_counter()
+        windowed = window.formatted()
+        window_elapsed = time.perf_counter() - start
+        print(f"{turn:5d} turns  full {estimate_tokens(full):7d} tokens {full_elapsed * 1e3:8.3f} ms   "
+              f"window {estimate_tokens(windowed):5d} tokens {window_elapsed * 1e3:8.3f} ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+# Benchmark: cost of a generation cache lookup
+#
+# Run from the docker_app directory:
+#   python -m benchmarks.bench_generation_cache [--image-mb 0 1 4] [--repeat N]
+#
+# A lookup fingerprints the request body and probes the in-process cache, so
+# its cost is dominated by hashing the base64 input images. Reports the time
+# to fingerprint a Stability inpainting request carrying an init image and a
+# mask of the given size, and the time of a cache hit on that fingerprint.
+
+import os
+import time
+import base64
+import argparse
+from utils.generation_cache import GenerationCache, request_fingerprint
+
+def make_request(image_mb):
+    image = base64.b64encode(os.urandom(int(image_mb * 1024 * 1024))).decode('ascii')
+    return {
+        "text_prompts": [{"text": "a lighthouse at dusk", "weight": 1}, {"text": "blurry", "weight": -1}],
+        "init_image": image,
+        "mask_source": "MASK_IMAGE_WHITE",
+        "mask_image": image,
+        "cfg_scale": 7,
+        "samples": 1,
+        "seed": 42,
+        "steps": 30,
+        "sampler": "K_EULER",
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure generation cache lookups")
+    parser.add_argument("--image-mb", type=float, nargs="+", default=[0, 1, 4])
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    cache = GenerationCache(max_entries=1000, ttl=3600)
+    for image_mb in args.image_mb:
+        body = make_request(image_mb)
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            fingerprint = request_fingerprint("stability.stable-diffusion-xl-v1", body)
+        fingerprint_elapsed = (time.perf_counter() - start) / args.repeat
+
+        cache.put(fingerprint, [f"blobs/{fingerprint[:32]}.png"], latency=10.0)
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            cache.get(fingerprint)
+        lookup_elapsed = (time.perf_counter() - start) / args.repeat
+        print(f"{image_mb:4.1f} MiB images  fingerprint {fingerprint_elapsed * 1e3:8.3f} ms  hit {lookup_elapsed * 1e6:8.1f} us")
+    print(cache.stats())
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+# Benchmark: stored size and encode/decode time of the image storage codecs
+#
+# Run from the docker_app directory:
+#   python -m benchmarks.bench_image_codecs [--images DIR] [--repeat N]
+#
+# Every PNG/JPEG/WebP file in DIR is stored with each codec. The default
+# DIR is the bundled images/ folder, which holds SDXL and Titan outputs.
+# Each codec is measured on two inputs, as encode_for_storage() sees them:
+#   model   - the encoded bytes a model returned; PNGs are stored as they are
+#             when the codec is png or original, so no encode runs
+#   edited  - decoded pixels, e.g. a canvas edit, which are always re-encoded
+
+import io
+import os
+import time
+import argparse
+from PIL import Image
+from config_file import Config
+from utils.encoded_image import EncodedImage
+from utils.image_codecs import encode_for_storage
+
+CODECS = [
+    ("png level 1", {"IMAGE_STORAGE_FORMAT": "png", "PNG_COMPRESS_LEVEL": 1}),
+    ("png level 6", {"IMAGE_STORAGE_FORMAT": "png", "PNG_COMPRESS_LEVEL": 6}),
+    ("png level 9", {"IMAGE_STORAGE_FORMAT": "png", "PNG_COMPRESS_LEVEL": 9}),
+    ("webp lossless", {"IMAGE_STORAGE_FORMAT": "webp", "WEBP_METHOD": 4}),
+    ("original", {"IMAGE_STORAGE_FORMAT": "original"}),
+]
+
+def load_images(directory):
+    images = []
+    for file_name in sorted(os.listdir(directory)):
+        if file_name.lower().endswith(('.png', '.jpg', '.jpeg', '.webp')):
+            with open(os.path.join(directory, file_name), 'rb') as f:
+                images.append(EncodedImage(f.read()))
+    return images
+
+# Apply Config settings and return the values they replaced
+def apply_settings(settings):
+    previous = {name: getattr(Config, name) for name in settings}
+    for name, value in settings.items():
+        setattr(Config, name, value)
+    return previous
+
+def measure(images, settings, edited, repeat):
+    previous = apply_settings(settings)
+    total_bytes = 0
+    encode_elapsed = 0.0
+    decode_elapsed = 0.0
+    for encoded in images:
+        if edited:
+            # Decode up front so only the encode is timed, as for a canvas
+            # edit whose pixels are already in memory
+            source = Image.open(io.BytesIO(encoded.data))
+            source.load()
+        else:
+            source = EncodedImage(encoded.data)
+        start = time.perf_counter()
+        for _ in range(repeat):
+            data, _, _ = encode_for_storage(source)
+        encode_elapsed += (time.perf_counter() - start) / repeat
+        start = time.perf_counter()
+        for _ in range(repeat):
+            Image.open(io.BytesIO(data)).load()
+        decode_elapsed += (time.perf_counter() - start) / repeat
+        total_bytes += len(data)
+    apply_settings(previous)
+    return total_bytes, encode_elapsed / len(images), decode_elapsed / len(images)
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare image storage codecs")
+    parser.add_argument("--images", default="images", help="Directory of sample images")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    images = load_images(args.images)
+    if not images:
+        print(f"No images found in {args.images}")
+        return
+    print(f"{len(images)} images")
+    for name, settings in CODECS:
+        for source_name, edited in [("model", False), ("edited", True)]:
+            total_bytes, encode_elapsed, decode_elapsed = measure(images, settings, edited, args.repeat)
+            print(f"{name:14s} {source_name:6s} {total_bytes / (1024 * 1024):8.2f} MiB  encode {encode_elapsed * 1000:8.1f} ms  decode {decode_elapsed * 1000:8.1f} ms per image")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+# Benchmark: CPU time of the image path with and without PNG re-encoding
+#
+# Run from the docker_app directory:
+#   python -m benchmarks.bench_image_path [--repeat N]
+#
+# For each output size a synthetic PNG stands in for a model response. The
+# "decode + re-encode" path is what happened before EncodedImage: the
+# response was decoded into a PIL image and encoded to PNG again to hash and
+# upload it, and init images read from the cache were decoded and re-encoded
+# for the next request. The "encoded bytes" path keeps the original bytes.
+# Preview generation decodes the pixels in both paths and is not included.
+
+import io
+import time
+import base64
+import hashlib
+import argparse
+import numpy as np
+from PIL import Image
+from utils.encoded_image import EncodedImage, png_bytes
+
+SIZES = [(1024, 1024), (1536, 640)]
+
+# Gradient plus noise, which compresses roughly like a generated image
+def make_response(width, height):
+    x = np.linspace(0, 255, width, dtype=np.float32)
+    y = np.linspace(0, 255, height, dtype=np.float32)[:, None]
+    noise = np.random.default_rng(0).normal(0, 12, (height, width, 3))
+    pixels = np.stack([x + 0 * y, y + 0 * x, (x + y) / 2], axis=-1) + noise
+    buffered = io.BytesIO()
+    Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8)).save(buffered, format='PNG')
+    return base64.b64encode(buffered.getvalue()).decode('utf-8')
+
+# Response -> stored key -> init image of the next request, as before
+def recode_path(response):
+    img = Image.open(io.BytesIO(base64.b64decode(response)))
+    buffered = io.BytesIO()
+    img.save(buffered, format='PNG')
+    stored = buffered.getvalue()
+    hashlib.md5(stored).hexdigest()
+    init_image = Image.open(io.BytesIO(stored))
+    buffered = io.BytesIO()
+    init_image.save(buffered, format='PNG')
+    return base64.b64encode(buffered.getvalue()).decode('utf-8')
+
+# The same steps with EncodedImage
+def encoded_path(response):
+    img = EncodedImage.from_base64(response)
+    stored = png_bytes(img)
+    hashlib.md5(stored).hexdigest()
+    return EncodedImage(stored).to_base64()
+
+def cpu_time(fn, response, repeat):
+    start = time.process_time()
+    for _ in range(repeat):
+        fn(response)
+    return (time.process_time() - start) / repeat
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure CPU time saved by keeping encoded image bytes")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    for width, height in SIZES:
+        response = make_response(width, height)
+        recode = cpu_time(recode_path, response, args.repeat)
+        encoded = cpu_time(encoded_path, response, args.repeat)
+        print(f"{width}x{height}: decode + re-encode {recode * 1000:8.1f} ms  encoded bytes {encoded * 1000:8.1f} ms  saved {(recode - encoded) * 1000:8.1f} ms per generation")
+
+if __name__ == "__main__":
+    main()
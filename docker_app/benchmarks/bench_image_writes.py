@@ -0,0 +1,50 @@
+# Benchmark: storage round-trips per stored image
+#
+# Run from the docker_app directory:
+#   python -m benchmarks.bench_image_writes [--images N] [--memory-latency SECONDS]
+#
+# Stores synthetic images through store_image() on an in-memory backend that
+# simulates the given round-trip, and compares it with the HEAD + PUT that
+# was used before conditional puts. Repeated saves of an image are answered
+# by the known-key index without touching storage.
+
+import os
+import time
+import argparse
+from utils.storage import Storage, MemoryStorage, set_storage
+from utils.s3_operations import store_image
+
+def make_images(prefix, count):
+    return [(f"{prefix}/{os.urandom(16).hex()}.png", os.urandom(1024), os.urandom(128)) for _ in range(count)]
+
+def timed(fn, images):
+    start = time.perf_counter()
+    for image in images:
+        fn(*image)
+    return (time.perf_counter() - start) / len(images)
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure write latency per stored image")
+    parser.add_argument("--images", type=int, default=200)
+    parser.add_argument("--memory-latency", type=float, default=0.02)
+    args = parser.parse_args()
+    storage = MemoryStorage(latency=args.memory_latency)
+    set_storage(storage)
+
+    # Baseline: HEAD, then PUT the image and its preview
+    def head_then_put(image_key, img_data, preview_data):
+        if Storage.put_if_absent(storage, image_key, img_data):
+            storage.put(f"{image_key}.preview", preview_data)
+
+    images = make_images("benchmarks/image_writes/baseline", args.images)
+    baseline = timed(head_then_put, images)
+    images = make_images("benchmarks/image_writes/conditional", args.images)
+    conditional = timed(store_image, images)
+    repeated = timed(store_image, images)
+
+    print(f"HEAD + PUT:       {baseline * 1000:8.2f} ms per image")
+    print(f"conditional PUT:  {conditional * 1000:8.2f} ms per image")
+    print(f"known key:        {repeated * 1000:8.2f} ms per image")
+
+if __name__ == "__main__":
+    main()
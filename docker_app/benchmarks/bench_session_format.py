@@ -0,0 +1,61 @@
+# Benchmark: pickle versus the versioned JSON session format
+#
+# Run from the docker_app directory:
+#   python -m benchmarks.bench_session_format [--images 10 100 1000] [--repeat N]
+#
+# Builds synthetic sessions holding the given number of image keys per image
+# list and reports encode/decode time and encoded size for pickle, JSON and,
+# if the zstandard package is installed, JSON with zstd compression.
+
+import time
+import uuid
+import pickle
+import argparse
+from config_file import Config
+from utils import session_format
+
+def make_session(image_count):
+    prefix = f"stability_sessions/Session {uuid.uuid4().hex[:8]}"
+    return {
+        'timestamp': '2024-01-01 12:00:00',
+        'step': 3,
+        'base_images': [f"{prefix}/base_images/{uuid.uuid4().hex}.png" for _ in range(image_count)],
+        'variation_images': [f"{prefix}/variation_images/{uuid.uuid4().hex}.png" for _ in range(image_count)],
+        'editing_images': [f"{prefix}/editing_images/{uuid.uuid4().hex}.png" for _ in range(image_count)],
+    }
+
+def measure(encode, decode, session, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        encoded = encode(session)
+    encode_elapsed = (time.perf_counter() - start) / repeat
+    start = time.perf_counter()
+    for _ in range(repeat):
+        decode(encoded)
+    decode_elapsed = (time.perf_counter() - start) / repeat
+    return encode_elapsed, decode_elapsed, len(encoded)
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare session encodings")
+    parser.add_argument("--images", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    formats = [
+        ("pickle", None, pickle.dumps, pickle.loads),
+        ("json", None, session_format.encode_session, session_format.decode_session),
+    ]
+    if session_format.zstandard is not None:
+        formats.append(("json+zstd", "zstd", session_format.encode_session, session_format.decode_session))
+    else:
+        print("zstandard is not installed; skipping json+zstd")
+
+    for image_count in args.images:
+        session = make_session(image_count)
+        for name, compression, encode, decode in formats:
+            Config.SESSION_COMPRESSION = compression
+            encode_elapsed, decode_elapsed, size = measure(encode, decode, session, args.repeat)
+            print(f"{image_count:5d} images  {name:10s} encode {encode_elapsed * 1e6:9.1f} us  decode {decode_elapsed * 1e6:9.1f} us  {size:8d} bytes")
+
+if __name__ == "__main__":
+    main()
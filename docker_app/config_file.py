@@ -15,3 +15,142 @@ class Config:
     
     #Put in your bucket name created on the AWS Console
     S3_BUCKET_NAME = "##S3_PLACEHOLDER##"
+
+    # Maximum number of pooled HTTP connections per shared boto3 client.
+    # Raise this if many users browse large galleries at the same time.
+    AWS_MAX_POOL_CONNECTIONS = 50
+
+    # Number of S3 requests issued in parallel when loading or deleting many
+    # objects at once. Keep this at or below AWS_MAX_POOL_CONNECTIONS.
+    S3_MAX_WORKERS = 16
+
+    # Budgets of the image cache in front of S3 reads. Decoded images are kept
+    # in memory and encoded bytes on local disk; set a budget to 0 to disable
+    # that tier.
+    IMAGE_CACHE_MEMORY_BYTES = 256 * 1024 * 1024
+    IMAGE_CACHE_DISK_BYTES = 2 * 1024 * 1024 * 1024
+    IMAGE_CACHE_DIR = "/tmp/image_cache"
+
+    # Gallery previews written next to every stored image. The grid shows
+    # three columns, so previews are sized for a third of the page width at
+    # 2x pixel density. PREVIEW_FORMAT is "WEBP" or "JPEG".
+    PREVIEW_MAX_SIZE = 448
+    PREVIEW_FORMAT = "WEBP"
+    PREVIEW_QUALITY = 80
+
+    # Lifetime in seconds of the presigned URLs handed to the browser
+    PRESIGNED_URL_EXPIRY = 3600
+
+    # How gallery images reach the browser. "proxy" streams them through the
+    # app server; "presigned" renders lazy-loading <img> tags pointing at
+    # short-lived presigned S3 URLs, so image bytes skip the app server.
+    # Run tools.backfill_previews before switching an existing bucket to
+    # "presigned", since previews are not generated on display in that mode.
+    IMAGE_DELIVERY = "proxy"
+
+    # Where session data and images are stored: "s3" (S3_BUCKET_NAME),
+    # "filesystem" (files under STORAGE_ROOT) or "memory" (in-process, lost on
+    # restart). The local backends let the app be profiled without AWS;
+    # STORAGE_LATENCY adds a simulated round-trip in seconds to every
+    # request of the memory backend.
+    STORAGE_BACKEND = "s3"
+    STORAGE_ROOT = "/tmp/storage"
+    STORAGE_LATENCY = 0.0
+
+    # Compression of stored session documents: None or "zstd" (needs the
+    # zstandard package). Both kinds are always readable.
+    SESSION_COMPRESSION = None
+    SESSION_COMPRESSION_LEVEL = 3
+
+    # Background persistence of images and sessions. With WRITE_BEHIND on,
+    # results are shown before they reach storage and the writes are made by
+    # WRITE_BEHIND_WORKERS threads. Submitting blocks once
+    # WRITE_BEHIND_MAX_PENDING writes are waiting; failed writes are retried
+    # WRITE_BEHIND_RETRIES times, starting WRITE_BEHIND_BACKOFF seconds apart.
+    WRITE_BEHIND = True
+    WRITE_BEHIND_WORKERS = 8
+    WRITE_BEHIND_MAX_PENDING = 256
+    WRITE_BEHIND_RETRIES = 3
+    WRITE_BEHIND_BACKOFF = 0.5
+
+    # Maximum number of object keys remembered as already stored, which lets
+    # repeated saves of an image skip S3 altogether. Keys are remembered for
+    # KNOWN_KEYS_TTL seconds after they were written; keep this well below
+    # GC_GRACE_HOURS, or a key may still be remembered after tools.gc_orphans
+    # deleted its object.
+    KNOWN_KEYS_MAX_ENTRIES = 100000
+    KNOWN_KEYS_TTL = 60 * 60
+
+    # Objects younger than this are never deleted by tools.gc_orphans, so
+    # writes still in flight are not mistaken for garbage
+    GC_GRACE_HOURS = 24
+
+    # Encoding of stored images: "png" (PNG_COMPRESS_LEVEL 0-9), "webp"
+    # (lossless WebP, WEBP_METHOD 0-6 trades encode time for size) or
+    # "original" (keep the bytes images arrive in, e.g. uploaded JPEGs).
+    # Images are still sent to the models as PNG. Images already in the
+    # storage format, such as model PNGs stored as "png", are kept as they
+    # are, so PNG_COMPRESS_LEVEL and WEBP_METHOD only affect re-encoded
+    # images, such as canvas edits and uploads in other formats.
+    IMAGE_STORAGE_FORMAT = "png"
+    PNG_COMPRESS_LEVEL = 6
+    WEBP_METHOD = 4
+
+    # Maximum number of Bedrock image requests the app runs at the same time,
+    # shared by all users. Multi-image Stability requests fan out into one
+    # request per image, up to STABILITY_MAX_IMAGES images per click.
+    BEDROCK_MAX_CONCURRENCY = 8
+    STABILITY_MAX_IMAGES = 4
+
+    # Maximum number of Titan images per click. Titan returns at most 5
+    # images per request, so larger jobs are split into concurrent requests.
+    TITAN_MAX_IMAGES = 20
+
+    # Results of image requests with a seed set by the user are cached, so
+    # repeating a request returns the stored images instead of calling
+    # Bedrock again. Requests left on seed 0 (random) are not cached. At
+    # most GENERATION_CACHE_MAX_ENTRIES requests are remembered, each for
+    # GENERATION_CACHE_TTL seconds; 0 entries turns the cache off.
+    GENERATION_CACHE_MAX_ENTRIES = 1000
+    GENERATION_CACHE_TTL = 24 * 60 * 60
+
+    # Connect and read timeouts in seconds of Bedrock requests, per model.
+    # Image models can take well over a minute on large requests; Claude
+    # answers faster. Models not listed use BEDROCK_DEFAULT_TIMEOUTS.
+    BEDROCK_TIMEOUTS = {
+        "stability.stable-diffusion-xl-v1": (5, 120),
+        "amazon.titan-image-generator-v1": (5, 120),
+        "anthropic.claude-v2": (5, 60),
+    }
+    BEDROCK_DEFAULT_TIMEOUTS = (5, 60)
+
+    # Throttled, timed-out and unreachable Bedrock requests are retried up to
+    # BEDROCK_MAX_ATTEMPTS times in total, waiting a random delay of up to
+    # BEDROCK_RETRY_BASE_DELAY * 2^attempt seconds (at most
+    # BEDROCK_RETRY_MAX_DELAY) between attempts. Throttling also slows down
+    # all other requests to the same model until it succeeds again.
+    BEDROCK_MAX_ATTEMPTS = 6
+    BEDROCK_RETRY_BASE_DELAY = 0.5
+    BEDROCK_RETRY_MAX_DELAY = 20
+
+    # Where Bedrock requests go: "bedrock" (AWS) or "local", a stand-in that
+    # streams canned Claude answers without AWS, waiting
+    # BEDROCK_LOCAL_FIRST_TOKEN_DELAY seconds before the first chunk and
+    # BEDROCK_LOCAL_CHUNK_DELAY between chunks. Image models are not
+    # available locally.
+    BEDROCK_BACKEND = "bedrock"
+    BEDROCK_LOCAL_FIRST_TOKEN_DELAY = 0.5
+    BEDROCK_LOCAL_CHUNK_DELAY = 0.02
+
+    # Number of reference sections (see models/chatbot_knowledge.py) sent to
+    # the chatbot with each message, chosen by how well they match the
+    # user's recent messages. 0 sends all of them.
+    CHATBOT_CONTEXT_TOP_K = 6
+
+    # Chat history sent to the chatbot with each message. The last
+    # CHATBOT_RECENT_MESSAGES messages are sent as they are, older ones cut
+    # to CHATBOT_COMPACTED_MESSAGE_CHARS characters, and the oldest are left
+    # out once the history exceeds CHATBOT_HISTORY_TOKEN_BUDGET tokens.
+    CHATBOT_HISTORY_TOKEN_BUDGET = 2000
+    CHATBOT_RECENT_MESSAGES = 6
+    CHATBOT_COMPACTED_MESSAGE_CHARS = 200
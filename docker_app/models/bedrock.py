@@ -0,0 +1,283 @@
+import json
+import time
+import hashlib
+import random
+import threading
+from concurrent.futures import Future
+from botocore.exceptions import ClientError, BotoCoreError, ConnectTimeoutError, EndpointConnectionError
+from config_file import Config
+from utils.aws_clients import get_client
+from models.local_bedrock import LocalBedrockClient
+
+# Error codes worth retrying: the request was rejected or timed out before a
+# result was produced, so sending it again is safe
+RETRYABLE_ERROR_CODES = {'ThrottlingException', 'ModelTimeoutException', 'ServiceUnavailableException', 'ModelNotReadyException'}
+THROTTLING_ERROR_CODES = {'ThrottlingException'}
+
+# Outcome of a successful invocation
+class InvocationResult:
+    def __init__(self, model_id, body, attempts, latency):
+        self.model_id = model_id
+        self.body = body
+        self.attempts = attempts
+        self.latency = latency
+
+# Raised when an invocation fails for good. `code` is the Bedrock error code
+# (e.g. ThrottlingException, ValidationException) or the name of the botocore
+# exception for errors that never reached the service.
+class BedrockInvocationError(Exception):
+    def __init__(self, model_id, code, message, attempts):
+        super().__init__(f"{code} - {message}")
+        self.model_id = model_id
+        self.code = code
+        self.message = message
+        self.attempts = attempts
+
+    @property
+    def retryable(self):
+        return self.code in RETRYABLE_ERROR_CODES
+
+    # Message the pages show when a request failed
+    @property
+    def user_message(self):
+        if self.retryable:
+            return "The model is busy right now. Please try again in a moment."
+        return f"The model request failed: {self.message}"
+
+# Timings of streamed responses: how long callers waited for the first chunk
+# and for the whole response
+class StreamStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {'streams': 0, 'first_token_seconds': 0.0, 'first_token_max': 0.0, 'total_seconds': 0.0}
+
+    def record(self, first_token_latency, latency):
+        with self._lock:
+            self._stats['streams'] += 1
+            self._stats['first_token_seconds'] += first_token_latency
+            self._stats['first_token_max'] = max(self._stats['first_token_max'], first_token_latency)
+            self._stats['total_seconds'] += latency
+
+    # Return the counters and the mean time to first token and to completion
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        streams = stats['streams']
+        stats['first_token_mean'] = stats['first_token_seconds'] / streams if streams else 0.0
+        stats['total_mean'] = stats['total_seconds'] / streams if streams else 0.0
+        return stats
+
+_stream_stats = StreamStats()
+
+# Return the process-wide timings of streamed responses
+def get_stream_stats():
+    return _stream_stats
+
+# The chunks of a streamed response, as parsed JSON, in the order the model
+# sent them
+#
+# first_token_latency is set when the first chunk arrives and latency when
+# the stream ends, both in seconds since the request was made. Errors the
+# service sends inside the stream are raised as BedrockInvocationError.
+class ResponseStream:
+    def __init__(self, model_id, events, attempts, start):
+        self.model_id = model_id
+        self.attempts = attempts
+        self.first_token_latency = None
+        self.latency = None
+        self._events = events
+        self._start = start
+
+    def __iter__(self):
+        try:
+            for event in self._events:
+                chunk = event.get('chunk')
+                if chunk is None:
+                    continue
+                if self.first_token_latency is None:
+                    self.first_token_latency = time.perf_counter() - self._start
+                yield json.loads(chunk['bytes'])
+        except ClientError as e:
+            raise BedrockInvocationError(self.model_id, e.response['Error']['Code'], e.response['Error']['Message'], self.attempts) from e
+        except BotoCoreError as e:
+            raise BedrockInvocationError(self.model_id, type(e).__name__, str(e), self.attempts) from e
+        self.latency = time.perf_counter() - self._start
+        if self.first_token_latency is not None:
+            get_stream_stats().record(self.first_token_latency, self.latency)
+
+# Shared backoff state of one model
+#
+# Every throttled request raises a penalty that all later requests to the
+# model wait out before they are sent, and every success halves it again, so
+# the app backs off as a whole instead of each request hammering the endpoint
+# with its own retries.
+class AdaptiveBackoff:
+    def __init__(self, base_delay, max_delay):
+        self._base_delay = base_delay
+        self._max_delay = max_delay
+        self._penalty = 0.0
+        self._lock = threading.Lock()
+
+    # Wait out the current penalty, with jitter
+    def wait(self):
+        with self._lock:
+            penalty = self._penalty
+        if penalty > 0:
+            time.sleep(random.uniform(penalty / 2, penalty))
+
+    def throttled(self):
+        with self._lock:
+            self._penalty = min(self._max_delay, max(self._base_delay, self._penalty * 2))
+
+    def succeeded(self):
+        with self._lock:
+            self._penalty = self._penalty / 2 if self._penalty >= self._base_delay else 0.0
+
+    # Delay before retry number `attempt` (1-based): exponential with full jitter
+    def retry_delay(self, attempt):
+        return random.uniform(0, min(self._max_delay, self._base_delay * 2 ** attempt))
+
+_backoffs = {}
+_backoffs_lock = threading.Lock()
+
+def _backoff_for(model_id):
+    with _backoffs_lock:
+        if model_id not in _backoffs:
+            _backoffs[model_id] = AdaptiveBackoff(Config.BEDROCK_RETRY_BASE_DELAY, Config.BEDROCK_RETRY_MAX_DELAY)
+        return _backoffs[model_id]
+
+# Coalesces identical requests that are in flight at the same time
+#
+# The first caller of a key runs the call; callers arriving with the same key
+# before it finishes wait on its Future and get the same result or exception,
+# so a double-click, a rerun while a spinner is up or several users sending
+# the same showcase prompt cost one Bedrock call.
+class SingleFlight:
+    def __init__(self):
+        self._in_flight = {}
+        self._lock = threading.Lock()
+        self._stats = {'calls': 0, 'executions': 0, 'coalesced': 0}
+
+    def do(self, key, fn):
+        with self._lock:
+            self._stats['calls'] += 1
+            future = self._in_flight.get(key)
+            leader = future is None
+            if leader:
+                future = self._in_flight[key] = Future()
+                self._stats['executions'] += 1
+            else:
+                self._stats['coalesced'] += 1
+        if not leader:
+            return future.result()
+
+        try:
+            result = fn()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+
+    # Return a copy of the counters and the number of calls in flight
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['in_flight'] = len(self._in_flight)
+        return stats
+
+_single_flight = SingleFlight()
+
+# Return the process-wide single-flight group of Bedrock requests
+def get_single_flight():
+    return _single_flight
+
+# Invocation core shared by all model classes
+#
+# Sends a JSON body to one Bedrock model and returns the parsed JSON response
+# as an InvocationResult. Each model gets a client with its own connect and
+# read timeouts (Config.BEDROCK_TIMEOUTS). Throttling, model timeouts and
+# connection failures are retried up to BEDROCK_MAX_ATTEMPTS times with
+# jittered exponential backoff; everything else fails at once. Failures are
+# raised as BedrockInvocationError and pass through the model classes to the
+# pages, which show the error's user_message.
+#
+# Identical requests in flight at the same time, as fingerprinted by the
+# model ID and the canonical JSON body, share one call. Callers pass
+# coalesce=False for requests that must each get their own answer, such as
+# image requests that ask the model for a random seed. With BEDROCK_BACKEND
+# set to "local", requests go to LocalBedrockClient instead of AWS.
+class BedrockInvoker:
+    def __init__(self, model_id, region_name=None):
+        self.model_id = model_id
+        self._backoff = _backoff_for(model_id)
+        if Config.BEDROCK_BACKEND == "local":
+            self.client = LocalBedrockClient(Config.BEDROCK_LOCAL_FIRST_TOKEN_DELAY, Config.BEDROCK_LOCAL_CHUNK_DELAY)
+            return
+        connect_timeout, read_timeout = Config.BEDROCK_TIMEOUTS.get(model_id, Config.BEDROCK_DEFAULT_TIMEOUTS)
+        # Retries are handled here, so botocore's own are turned off
+        self.client = get_client(
+            'bedrock-runtime',
+            region_name=region_name,
+            connect_timeout=connect_timeout,
+            read_timeout=read_timeout,
+            retries={'mode': 'standard', 'total_max_attempts': 1}
+        )
+
+    def invoke(self, body, coalesce=True):
+        payload = json.dumps(body, sort_keys=True).encode('utf-8')
+        if not coalesce:
+            return self._invoke(payload)
+        fingerprint = (self.model_id, hashlib.sha256(payload).hexdigest())
+        return get_single_flight().do(fingerprint, lambda: self._invoke(payload))
+
+    # Send a request with a streamed response and return a ResponseStream of
+    # its chunks. Opening the stream is retried like invoke(); once chunks
+    # flow, a failure is raised from the iteration. Streams are not coalesced.
+    def invoke_stream(self, body):
+        payload = json.dumps(body, sort_keys=True).encode('utf-8')
+        start = time.perf_counter()
+        events, attempts = self._call_with_retries(lambda: self.client.invoke_model_with_response_stream(
+            modelId=self.model_id,
+            contentType="application/json",
+            accept="application/json",
+            body=payload
+        )["body"])
+        return ResponseStream(self.model_id, events, attempts, start)
+
+    def _invoke(self, payload):
+        start = time.perf_counter()
+        response_body, attempts = self._call_with_retries(lambda: json.loads(self.client.invoke_model(
+            modelId=self.model_id,
+            contentType="application/json",
+            accept="application/json",
+            body=payload
+        )["body"].read()))
+        return InvocationResult(self.model_id, response_body, attempts, time.perf_counter() - start)
+
+    # Return (call(), number of attempts), retrying retryable failures
+    def _call_with_retries(self, call):
+        for attempt in range(1, Config.BEDROCK_MAX_ATTEMPTS + 1):
+            self._backoff.wait()
+            try:
+                value = call()
+            except ClientError as e:
+                error = BedrockInvocationError(self.model_id, e.response['Error']['Code'], e.response['Error']['Message'], attempt)
+                if error.code in THROTTLING_ERROR_CODES:
+                    self._backoff.throttled()
+            except (ConnectTimeoutError, EndpointConnectionError) as e:
+                # The request never reached the model, so it is safe to resend
+                error = BedrockInvocationError(self.model_id, 'ServiceUnavailableException', str(e), attempt)
+            except BotoCoreError as e:
+                raise BedrockInvocationError(self.model_id, type(e).__name__, str(e), attempt) from e
+            else:
+                self._backoff.succeeded()
+                return value, attempt
+
+            if not error.retryable or attempt == Config.BEDROCK_MAX_ATTEMPTS:
+                raise error
+            time.sleep(self._backoff.retry_delay(attempt))
@@ -1,8 +1,6 @@
-import json
 import base64
-from botocore.exceptions import ClientError
-import io
-from PIL import Image
+from models.bedrock import BedrockInvoker
+from utils.encoded_image import EncodedImage, png_bytes
 
 class ChatImageEditor:
     def __init__(self, client, s3_client, bucket_name):
@@ -10,34 +8,26 @@ class ChatImageEditor:
         self.s3_client = s3_client
         self.bucket_name = bucket_name
         self.model_id = "amazon.titan-image-generator-v1"
+        self.invoker = BedrockInvoker(self.model_id, client.meta.region_name)
     
-    # Convert a PIL Image object to a base64 encoded string
+    # Convert an image (PIL Image or EncodedImage) to a base64 encoded PNG string
     def image_to_base64(self, image):
-        buffered = io.BytesIO()
-        image.save(buffered, format="PNG")
-        return base64.b64encode(buffered.getvalue()).decode('utf-8')
+        return base64.b64encode(png_bytes(image)).decode('utf-8')
 
-    # Convert a base64 encoded string to a PIL Image object
+    # Wrap a base64 encoded image without decoding it
     def base64_to_image(self, base64_string):
-        return Image.open(io.BytesIO(base64.b64decode(base64_string)))
+        return EncodedImage.from_base64(base64_string)
 
-    # Call the Titan model and handle the response
+    # Call the Titan model and return the generated images. Raises
+    # BedrockInvocationError if the request fails.
+    #
+    # The editor always asks for a random seed (0) and makes one image per
+    # click, so an identical request still in flight is the same click
+    # repeated by a double-click or a rerun. Such requests are coalesced on
+    # the full payload, unlike the seed 0 requests of the image pages.
     def invoke_titan_model(self, input_params):
-        try:
-            response = self.client.invoke_model(
-                modelId=self.model_id,
-                contentType="application/json",
-                accept="application/json",
-                body=json.dumps(input_params).encode('utf-8')
-            )
-            response_body = json.loads(response.get("body").read())
-            return [self.base64_to_image(img) for img in response_body.get("images", [])]
-        except ClientError as e:
-            print(f"ERROR: {e.response['Error']['Code']} - {e.response['Error']['Message']}")
-            raise
-        except Exception as e:
-            print(f"ERROR: {e}")
-            raise
+        result = self.invoker.invoke(input_params, coalesce=True)
+        return [self.base64_to_image(img) for img in result.body.get("images", [])]
    
     # Create images from a text description
     def generate_image(self, prompt, num_images=1, width=512, height=512, seed=0, cfg_scale=8.0):
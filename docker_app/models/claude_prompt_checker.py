@@ -1,4 +1,4 @@
-import json
+from models.bedrock import BedrockInvoker
 
 class ClaudePromptChecker:
     def __init__(self, client, s3_client, bucket_name):
@@ -6,33 +6,29 @@ class ClaudePromptChecker:
         self.s3_client = s3_client
         self.bucket_name = bucket_name
         self.model_id = "anthropic.claude-v2"
+        self.invoker = BedrockInvoker(self.model_id, client.meta.region_name)
 
-    # Send a message to the Claude model and get a response
-    def invoke(self, input_text):
-        prompt = f"\n\nHuman: {input_text}\n\nAssistant:"
-        body = {
-            "prompt": prompt,
+    # Return the request body for a message to the Claude model
+    def request_body(self, input_text):
+        return {
+            "prompt": f"\n\nHuman: {input_text}\n\nAssistant:",
             "max_tokens_to_sample": 800,
             "temperature": 0.3,
         }
-        body = json.dumps(body)
-        try:
-            response = self.client.invoke_model(
-                body=body,
-                modelId=self.model_id,
-                accept='application/json',
-                contentType='application/json'
-            )
-            return response
-        except Exception as e:
-            print(f"ERROR: {e}")
-            return None
+
+    # Send a message to the Claude model and return the InvocationResult.
+    # Raises BedrockInvocationError if the request fails.
+    def invoke(self, input_text):
+        return self.invoker.invoke(self.request_body(input_text))
+
+    # Send a message to the Claude model and return a ResponseStream of the
+    # completion chunks. Raises BedrockInvocationError if the request fails.
+    def invoke_stream(self, input_text):
+        return self.invoker.invoke_stream(self.request_body(input_text))
    
-    # Analyze a given prompt and provide feedback
-    def check_prompt(self, prompt):
-        try:
-            # Prepare the input for the model, including best practices and instructions
-            input_text = f"""As an expert in prompt engineering for image generation models Stability.ai SDXL 1.0 Image Generator and Amazon Titan Image Generator G1, analyze the following prompt:
+    # Build the model input for a prompt, including best practices and instructions
+    def build_input(self, prompt):
+        return f"""As an expert in prompt engineering for image generation models Stability.ai SDXL 1.0 Image Generator and Amazon Titan Image Generator G1, analyze the following prompt:
 
 "{prompt}"
 
@@ -223,12 +219,16 @@ Explanation:
 [Briefly explain the changes made in the improved prompt, referencing the principles of effective prompt engineering. Also, explain the purpose of the suggested negative prompts.]
 
 Be specific, constructive, and provide actionable advice. Ensure your improved prompt example is significantly enhanced and showcases best practices in prompt engineering for both Stability.ai SDXL 1.0 Image Generator and Amazon Titan Image Generator G1."""
-            
-            # Get the response from the model
-            response = self.invoke(input_text)
-            if response is None:
-                return "I'm sorry, but I'm having trouble analyzing the prompt right now. Please try again later."
-            return json.loads(response['body'].read())['completion']
-        except Exception as e:
-            print(f"Error in check_prompt: {str(e)}")
-            return f"An error occurred while analyzing the prompt: {str(e)}"
\ No newline at end of file
+
+    # Analyze a given prompt and provide feedback. Raises
+    # BedrockInvocationError if the request fails.
+    def check_prompt(self, prompt):
+        return self.invoke(self.build_input(prompt)).body['completion']
+
+    # Yield the feedback on a prompt in pieces as the model produces them.
+    # Raises BedrockInvocationError if the request fails, also mid-stream.
+    def stream_check_prompt(self, prompt):
+        for chunk in self.invoke_stream(self.build_input(prompt)):
+            text = chunk.get('completion', '')
+            if text:
+                yield text
@@ -0,0 +1,89 @@
+from collections import deque
+from config_file import Config
+from models.chatbot_knowledge import CHARS_PER_TOKEN
+
+# Return a message as it appears in the model input
+def format_message(role, content):
+    speaker = "Human" if role == "user" else "Assistant"
+    return f"{speaker}: {content}\n\n"
+
+# Shorten a message to its first max_chars characters on one line
+def compact_message(content, max_chars):
+    text = " ".join(content.split())
+    if len(text) <= max_chars:
+        return text
+    return text[:max_chars].rstrip() + "..."
+
+# Token-budgeted view of a chat, as sent to the model
+#
+# The latest recent_messages messages are kept verbatim. Older ones are
+# compacted to their first compacted_chars characters, and once the window
+# is over its token budget the oldest compacted messages are dropped, leaving
+# a note of how many were left out. If the verbatim messages alone are over
+# the budget, the oldest of them are compacted too; the newest message is
+# always kept whole. The window is updated as messages are appended and the
+# formatted text is cached, so building the model input costs the same
+# however long the chat has grown. Its length is tracked in characters, so
+# the token estimate is exactly that of the formatted text.
+class ConversationWindow:
+    def __init__(self, token_budget=None, recent_messages=None, compacted_chars=None):
+        self._token_budget = Config.CHATBOT_HISTORY_TOKEN_BUDGET if token_budget is None else token_budget
+        self._recent_messages = Config.CHATBOT_RECENT_MESSAGES if recent_messages is None else recent_messages
+        self._compacted_chars = Config.CHATBOT_COMPACTED_MESSAGE_CHARS if compacted_chars is None else compacted_chars
+        self._recent = deque()
+        self._compacted = deque()
+        self._omitted = 0
+        self._chars = 0
+        self._formatted = ""
+
+    # Build a window from a list of {"role", "content"} messages
+    @classmethod
+    def from_messages(cls, messages, **options):
+        window = cls(**options)
+        for message in messages:
+            window.append(message["role"], message["content"])
+        return window
+
+    # Add a message to the end of the chat
+    def append(self, role, content):
+        text = format_message(role, content)
+        self._recent.append((role, content, text))
+        self._chars += len(text)
+        while len(self._recent) > max(1, self._recent_messages):
+            self._compact_oldest_recent()
+        while self.tokens > self._token_budget and (self._compacted or len(self._recent) > 1):
+            if self._compacted:
+                self._chars -= len(self._compacted.popleft())
+                self._omitted += 1
+            else:
+                self._compact_oldest_recent()
+        self._formatted = None
+
+    # Return the chat as it goes into the model input
+    def formatted(self):
+        if self._formatted is None:
+            parts = [self._omitted_note()] if self._omitted else []
+            parts += list(self._compacted)
+            parts += [text for _, _, text in self._recent]
+            self._formatted = "".join(parts)
+        return self._formatted
+
+    # Return the last count messages of the user that are kept verbatim
+    def recent_user_messages(self, count):
+        messages = [content for role, content, _ in self._recent if role == "user"]
+        return messages[-count:] if count > 0 else []
+
+    # Estimated number of tokens of formatted()
+    @property
+    def tokens(self):
+        chars = self._chars + (len(self._omitted_note()) if self._omitted else 0)
+        return chars // CHARS_PER_TOKEN
+
+    def _omitted_note(self):
+        return f"[{self._omitted} earlier messages omitted]\n\n"
+
+    def _compact_oldest_recent(self):
+        role, content, text = self._recent.popleft()
+        compacted = format_message(role, compact_message(content, self._compacted_chars))
+        self._compacted.append(compacted)
+        self._chars += len(compacted) - len(text)
@@ -0,0 +1,51 @@
+import io
+import json
+import time
+from botocore.exceptions import ClientError
+
+# Text of the stand-in answer, repeated to fill max_tokens_to_sample
+LOCAL_COMPLETION = (
+    "This is a local stand-in answer, streamed without calling Bedrock. "
+    "It arrives in small chunks so the chat pages can be exercised and "
+    "profiled offline, with a simulated wait for the first token. "
+)
+
+# Stand-in for the bedrock-runtime client, used with BEDROCK_BACKEND "local"
+#
+# Claude requests are answered with LOCAL_COMPLETION, cut to roughly
+# max_tokens_to_sample tokens (4 characters each) and returned in chunks of
+# chunk_size characters, in the event format of
+# invoke_model_with_response_stream. The first chunk is sent after
+# first_token_delay seconds and every further one chunk_delay seconds later;
+# invoke_model waits for all of them and returns the whole completion. Image
+# models are not simulated and fail with a ValidationException.
+class LocalBedrockClient:
+    def __init__(self, first_token_delay, chunk_delay, chunk_size=16):
+        self._first_token_delay = first_token_delay
+        self._chunk_delay = chunk_delay
+        self._chunk_size = chunk_size
+
+    def invoke_model(self, modelId, body, contentType=None, accept=None):
+        completion = "".join(event['chunk']['completion'] for event in self._completion_events(modelId, body))
+        return {'body': io.BytesIO(json.dumps({'completion': completion, 'stop_reason': 'stop_sequence'}).encode('utf-8'))}
+
+    def invoke_model_with_response_stream(self, modelId, body, contentType=None, accept=None):
+        events = self._completion_events(modelId, body)
+        return {'body': ({'chunk': {'bytes': json.dumps(event['chunk']).encode('utf-8')}} for event in events)}
+
+    # Yield the chunks of the completion, sleeping like a model would
+    def _completion_events(self, model_id, body):
+        if not model_id.startswith("anthropic."):
+            raise ClientError({'Error': {'Code': 'ValidationException', 'Message': f"{model_id} is not available locally"}}, 'InvokeModel')
+        request = json.loads(body)
+        length = request.get("max_tokens_to_sample", 300) * 4
+        text = (LOCAL_COMPLETION * (length // len(LOCAL_COMPLETION) + 1))[:length]
+        return self._timed_chunks(text)
+
+    def _timed_chunks(self, text):
+        time.sleep(self._first_token_delay)
+        for start in range(0, len(text), self._chunk_size):
+            if start:
+                time.sleep(self._chunk_delay)
+            last = start + self._chunk_size >= len(text)
+            yield {'chunk': {'completion': text[start:start + self._chunk_size], 'stop_reason': 'stop_sequence' if last else None}}
@@ -1,8 +1,9 @@
-import json
 import base64
-from botocore.exceptions import ClientError
-import io
-from PIL import Image
+from config_file import Config
+from models.bedrock import BedrockInvoker
+from utils.encoded_image import EncodedImage, png_bytes
+from utils.fan_out import fan_out, derive_seeds
+from utils.generation_cache import cached_generation
 
 class StabilityModel:
     def __init__(self, client, s3_client, bucket_name):
@@ -10,40 +11,43 @@ class StabilityModel:
         self.s3_client = s3_client
         self.bucket_name = bucket_name
         self.model_id = "stability.stable-diffusion-xl-v1"
+        self.invoker = BedrockInvoker(self.model_id, client.meta.region_name)
 
-    # Convert an image to a base64 string
+    # Convert an image (PIL Image or EncodedImage) to a base64 PNG string
     def image_to_base64(self, image):
-        buffered = io.BytesIO()
-        image.save(buffered, format="PNG")
-        return base64.b64encode(buffered.getvalue()).decode('utf-8')
+        return base64.b64encode(png_bytes(image)).decode('utf-8')
     
-    # Convert a base64 string to an image
+    # Wrap a base64 encoded image without decoding it
     def base64_to_image(self, base64_string):
-        return Image.open(io.BytesIO(base64.b64decode(base64_string)))
+        return EncodedImage.from_base64(base64_string)
 
-    # Call the Stability model and handle the response
-    def invoke_stability_model(self, input_params):
-        try:
-            if input_params.get('style_preset') is None:
-                input_params.pop('style_preset', None)
-            response = self.client.invoke_model(
-                modelId=self.model_id,
-                contentType="application/json",
-                accept="application/json",
-                body=json.dumps(input_params).encode('utf-8')
-            )
-            response_body = json.loads(response.get("body").read())
-            image_data = response_body.get("artifacts", [])[0]
-            return self.base64_to_image(image_data["base64"])
-        except ClientError as e:
-            print(f"ERROR: {e.response['Error']['Code']} - {e.response['Error']['Message']}")
-            return None
-        except Exception as e:
-            print(f"ERROR: {e}")
-            return None
+    # Call the Stability model and return the image. Raises
+    # BedrockInvocationError if the request fails. Requests with a seed the user set (fixed_seed) are answered from the
+    # generation cache when the same request was made before.
+    def invoke_stability_model(self, input_params, fixed_seed=False):
+        if input_params.get('style_preset') is None:
+            input_params.pop('style_preset', None)
+        images = cached_generation(self.model_id, input_params, fixed_seed and input_params.get('seed', 0) != 0,
+                                   lambda: self.invoke_stability_model_uncached(input_params))
+        return images[0] if images else None
 
-    # Generate an image from a text prompt
-    def invoke_text_to_image(self, prompt, negative_prompt, width, height, style_preset, clip_guidance_preset, seed, cfg_scale, steps, sampler):
+    # Call the Stability model and return the generated image in a list
+    def invoke_stability_model_uncached(self, input_params):
+        result = self.invoker.invoke(input_params, coalesce=input_params.get('seed', 0) != 0)
+        return [self.base64_to_image(artifact["base64"]) for artifact in result.body.get("artifacts", [])[:1]]
+
+    # Call the Stability model once per image with distinct seeds, concurrently,
+    # and return the generated images in order. Failed images are left out;
+    # if every image failed, the first error is raised.
+    def invoke_stability_model_batch(self, input_params, num_images, fixed_seed=False):
+        if not 1 <= num_images <= Config.STABILITY_MAX_IMAGES:
+            raise ValueError(f"Number of images must be between 1 and {Config.STABILITY_MAX_IMAGES}: {num_images}")
+        seeds = derive_seeds(input_params["seed"], num_images)
+        images = fan_out(self.invoke_stability_model, [({**input_params, "seed": seed}, fixed_seed) for seed in seeds])
+        return [image for image in images if image is not None]
+
+    # Generate images from a text prompt
+    def invoke_text_to_image(self, prompt, negative_prompt, width, height, style_preset, clip_guidance_preset, seed, cfg_scale, steps, sampler, num_images=1, fixed_seed=False):
         input_params = {
             "text_prompts": [
                 {"text": prompt, "weight": 1},
@@ -59,10 +63,10 @@ class StabilityModel:
             "seed": seed,
             "sampler": sampler
         }
-        return self.invoke_stability_model(input_params)
+        return self.invoke_stability_model_batch(input_params, num_images, fixed_seed)
 
-    # Create a variation of an existing image
-    def invoke_image_variation(self, prompt, negative_prompt, init_image, image_strength, style_preset, clip_guidance_preset, seed, cfg_scale, steps, sampler):
+    # Create variations of an existing image
+    def invoke_image_variation(self, prompt, negative_prompt, init_image, image_strength, style_preset, clip_guidance_preset, seed, cfg_scale, steps, sampler, num_images=1, fixed_seed=False):
         input_params = {
             "text_prompts": [
                 {"text": prompt, "weight": 1},
@@ -79,10 +83,10 @@ class StabilityModel:
             "seed": seed,
             "sampler": sampler
         }
-        return self.invoke_stability_model(input_params)
+        return self.invoke_stability_model_batch(input_params, num_images, fixed_seed)
 
     # Perform inpainting on an image
-    def invoke_image_inpainting(self, prompt, negative_prompt, init_image, mask_image, style_preset, clip_guidance_preset, seed, cfg_scale, steps, sampler):
+    def invoke_image_inpainting(self, prompt, negative_prompt, init_image, mask_image, style_preset, clip_guidance_preset, seed, cfg_scale, steps, sampler, num_images=1, fixed_seed=False):
         input_params = {
             "text_prompts": [
                 {"text": prompt, "weight": 1},
@@ -99,4 +103,4 @@ class StabilityModel:
             "clip_guidance_preset": clip_guidance_preset,
             "sampler": sampler
         }
-        return self.invoke_stability_model(input_params)
\ No newline at end of file
+        return self.invoke_stability_model_batch(input_params, num_images, fixed_seed)
\ No newline at end of file
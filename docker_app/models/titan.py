@@ -1,8 +1,22 @@
-import json
 import base64
-from botocore.exceptions import ClientError
-import io
-from PIL import Image
+from config_file import Config
+from models.bedrock import BedrockInvoker
+from utils.encoded_image import EncodedImage, png_bytes
+from utils.fan_out import fan_out, derive_seeds
+from utils.generation_cache import cached_generation
+
+# Titan returns at most this many images per request
+MAX_IMAGES_PER_REQUEST = 5
+MAX_SEED = 2147483646
+
+# Split a job of num_images into (number of images, seed) sub-requests of at
+# most max_per_request images. The first sub-request keeps the requested seed,
+# so jobs that fit in one request give the same images as before; the others
+# use the following seeds (see derive_seeds), so a whole job is reproducible
+# from one seed.
+def plan_image_batches(num_images, seed, max_per_request=MAX_IMAGES_PER_REQUEST):
+    counts = [min(max_per_request, num_images - start) for start in range(0, num_images, max_per_request)]
+    return list(zip(counts, derive_seeds(seed, len(counts), MAX_SEED)))
 
 class TitanModel:
     def __init__(self, client, s3_client, bucket_name):
@@ -10,37 +24,46 @@ class TitanModel:
         self.s3_client = s3_client
         self.bucket_name = bucket_name
         self.model_id = "amazon.titan-image-generator-v1"
+        self.invoker = BedrockInvoker(self.model_id, client.meta.region_name)
 
-    # Convert an image to a base64 string
+    # Convert an image (PIL Image or EncodedImage) to a base64 PNG string
     def image_to_base64(self, image):
-        buffered = io.BytesIO()
-        image.save(buffered, format="PNG")
-        return base64.b64encode(buffered.getvalue()).decode('utf-8')
+        return base64.b64encode(png_bytes(image)).decode('utf-8')
 
-    # Convert a base64 string to an image
+    # Wrap a base64 encoded image without decoding it
     def base64_to_image(self, base64_string):
-        return Image.open(io.BytesIO(base64.b64decode(base64_string)))
+        return EncodedImage.from_base64(base64_string)
+
+    # Call the Titan model and return the generated images. Raises
+    # BedrockInvocationError if the request fails. Requests with a seed the
+    # user set (fixed_seed) are answered from the generation cache when the
+    # same request was made before.
+    def invoke_titan_model(self, input_params, fixed_seed=False):
+        return cached_generation(self.model_id, input_params, fixed_seed,
+                                 lambda: self.invoke_titan_model_uncached(input_params))
 
     # Call the Titan model and handle the response
-    def invoke_titan_model(self, input_params):
-        try:
-            response = self.client.invoke_model(
-                modelId=self.model_id,
-                contentType="application/json",
-                accept="application/json",
-                body=json.dumps(input_params).encode('utf-8')
-            )
-            response_body = json.loads(response.get("body").read())
-            return [self.base64_to_image(img) for img in response_body.get("images", [])]
-        except ClientError as e:
-            print(f"ERROR: {e.response['Error']['Code']} - {e.response['Error']['Message']}")
-            return None
-        except Exception as e:
-            print(f"ERROR: {e}")
-            return None
+    def invoke_titan_model_uncached(self, input_params):
+        result = self.invoker.invoke(input_params, coalesce=input_params["imageGenerationConfig"].get("seed", 0) != 0)
+        return [self.base64_to_image(img) for img in result.body.get("images", [])]
+
+    # Call the Titan model for any number of images. Jobs larger than the API
+    # allows per request are split by plan_image_batches() into sub-requests
+    # that run concurrently; their images are merged in plan order. Images of
+    # failed sub-requests are left out; if every sub-request failed, the first
+    # error is raised.
+    def invoke_titan_model_batches(self, input_params, num_images, fixed_seed=False):
+        if not 1 <= num_images <= Config.TITAN_MAX_IMAGES:
+            raise ValueError(f"Number of images must be between 1 and {Config.TITAN_MAX_IMAGES}: {num_images}")
+        calls = []
+        for count, seed in plan_image_batches(num_images, input_params["imageGenerationConfig"]["seed"]):
+            generation_config = {**input_params["imageGenerationConfig"], "numberOfImages": count, "seed": seed}
+            calls.append(({**input_params, "imageGenerationConfig": generation_config}, fixed_seed))
+        batches = fan_out(self.invoke_titan_model, calls)
+        return [image for batch in batches if batch is not None for image in batch]
 
     # Generate images from a text prompt
-    def invoke_titan_text_to_image(self, prompt, negative_prompt, num_images, width, height, seed, cfg_scale):
+    def invoke_titan_text_to_image(self, prompt, negative_prompt, num_images, width, height, seed, cfg_scale, fixed_seed=False):
         input_params = {
             "taskType": "TEXT_IMAGE",
             "textToImageParams": {
@@ -56,10 +79,10 @@ class TitanModel:
         }
         if negative_prompt:
             input_params["textToImageParams"]["negativeText"] = negative_prompt
-        return self.invoke_titan_model(input_params)
+        return self.invoke_titan_model_batches(input_params, num_images, fixed_seed)
 
     # Create variations of an existing image
-    def invoke_titan_image_variation(self, prompt, negative_prompt, init_image, similarity_strength, num_images, seed, cfg_scale):
+    def invoke_titan_image_variation(self, prompt, negative_prompt, init_image, similarity_strength, num_images, seed, cfg_scale, fixed_seed=False):
         input_params = {
             "taskType": "IMAGE_VARIATION",
             "imageVariationParams": {
@@ -75,10 +98,10 @@ class TitanModel:
         }
         if negative_prompt:
             input_params["imageVariationParams"]["negativeText"] = negative_prompt
-        return self.invoke_titan_model(input_params)
+        return self.invoke_titan_model_batches(input_params, num_images, fixed_seed)
     
     # Perform inpainting on an image
-    def invoke_titan_inpainting(self, prompt, negative_prompt, init_image, mask_image, num_images, seed, cfg_scale):
+    def invoke_titan_inpainting(self, prompt, negative_prompt, init_image, mask_image, num_images, seed, cfg_scale, fixed_seed=False):
         input_params = {
             "taskType": "INPAINTING",
             "inPaintingParams": {
@@ -94,10 +117,10 @@ class TitanModel:
         }
         if negative_prompt:
             input_params["inPaintingParams"]["negativeText"] = negative_prompt
-        return self.invoke_titan_model(input_params)
+        return self.invoke_titan_model_batches(input_params, num_images, fixed_seed)
     
     # Perform outpainting on an image
-    def invoke_titan_outpainting(self, prompt, negative_prompt, init_image, mask_image, num_images, seed, cfg_scale, outpainting_mode):
+    def invoke_titan_outpainting(self, prompt, negative_prompt, init_image, mask_image, num_images, seed, cfg_scale, outpainting_mode, fixed_seed=False):
         input_params = {
             "taskType": "OUTPAINTING",
             "outPaintingParams": {
@@ -114,4 +137,4 @@ class TitanModel:
         }
         if negative_prompt:
             input_params["outPaintingParams"]["negativeText"] = negative_prompt
-        return self.invoke_titan_model(input_params)
\ No newline at end of file
+        return self.invoke_titan_model_batches(input_params, num_images, fixed_seed)
\ No newline at end of file
@@ -1,18 +1,23 @@
 import streamlit as st
-from PIL import Image
-import io
+import html
 import numpy as np
 from datetime import datetime
 import time
-import boto3
 from config_file import Config
-from utils.s3_operations import save_image_to_s3, delete_image_from_s3, save_to_s3, load_from_s3, delete_from_s3
+from utils.image_cache import load_image, load_image_bytes, load_encoded_image
+from utils.image_codecs import image_content_type, download_file_name
+from models.bedrock import BedrockInvocationError
+from utils.s3_operations import save_image_to_s3, save_to_s3, load_from_s3, delete_from_s3, get_download_url, get_presigned_url, release_image
+from utils.session_store import SessionStore
 
 # Function to display an image stored in S3
 def display_s3_image(image_key):
-    s3 = boto3.client('s3')
-    img_data = s3.get_object(Bucket=Config.S3_BUCKET_NAME, Key=image_key)['Body'].read()
-    img = Image.open(io.BytesIO(img_data))
+    if Config.IMAGE_DELIVERY == "presigned":
+        url = get_presigned_url(image_key)
+        if url is not None:
+            st.markdown(f'<img src="{html.escape(url)}" loading="lazy" style="width: 100%;">', unsafe_allow_html=True)
+            return
+    img = load_image(image_key)
     st.image(img, use_column_width=True)
 
 # Main function to render the chat image editor interface
@@ -21,7 +26,7 @@ def render_chat_image_editor(chat_image_editor):
     
     # Load or initialize chat image editor sessions
     if 'chat_image_editor_sessions' not in st.session_state:
-        st.session_state.chat_image_editor_sessions = load_from_s3('chat_image_editor_sessions') or {}
+        st.session_state.chat_image_editor_sessions = load_from_s3('chat_image_editor_sessions') or SessionStore('chat_image_editor_sessions')
 
     sessions = st.session_state.chat_image_editor_sessions
     
@@ -39,15 +44,17 @@ def render_chat_image_editor(chat_image_editor):
         elif entry['type'] == 'image':
             display_s3_image(entry['content'])
             # Provide download button for the image
-            s3 = boto3.client('s3')
-            img_data = s3.get_object(Bucket=Config.S3_BUCKET_NAME, Key=entry['content'])['Body'].read()
-            st.download_button(
-                label="Download Image",
-                data=img_data,
-                file_name=f"image_{i}.png",
-                mime="image/png",
-                key=f"download_{i}"
-            )
+            download_url = get_download_url(entry['content'], download_file_name(entry['content'], f"image_{i}"))
+            if download_url is not None:
+                st.link_button(label="Download Image", url=download_url)
+            else:
+                st.download_button(
+                    label="Download Image",
+                    data=load_image_bytes(entry['content']),
+                    file_name=download_file_name(entry['content'], f"image_{i}"),
+                    mime=image_content_type(entry['content']),
+                    key=f"download_{i}"
+                )
     
     # Determine if there's a current image to edit
     current_image_entry = next((entry for entry in reversed(session['chat_history']) if entry['type'] == 'image'), None)
@@ -67,9 +74,9 @@ def render_chat_image_editor(chat_image_editor):
                             session['chat_history'].append({'type': 'image', 'content': image_key})
                         else:
                             session['chat_history'].append({'type': 'assistant', 'content': "Sorry, I couldn't generate the image. Please try again."})
-                except Exception as e:
-                    st.error(f"An error occurred: {str(e)}")
-                    session['chat_history'].append({'type': 'assistant', 'content': f"An error occurred: {str(e)}"})
+                except BedrockInvocationError as e:
+                    st.error(e.user_message)
+                    session['chat_history'].append({'type': 'assistant', 'content': e.user_message})
                 save_to_s3(st.session_state.chat_image_editor_sessions, "chat_image_editor_sessions")
                 st.rerun()
     else:
@@ -83,9 +90,7 @@ def render_chat_image_editor(chat_image_editor):
                 session['chat_history'].append({'type': 'user', 'content': f"Mode: {edit_mode}\nMask: {mask_prompt}\nEdit: {edit_prompt}"})
                 try:
                     with st.spinner("Editing image..."):
-                        s3 = boto3.client('s3')
-                        img_data = s3.get_object(Bucket=Config.S3_BUCKET_NAME, Key=current_image_entry['content'])['Body'].read()
-                        current_image = Image.open(io.BytesIO(img_data))
+                        current_image = load_encoded_image(current_image_entry['content'])
                         images = chat_image_editor.edit_image(
                             prompt=edit_prompt,
                             init_image=current_image,
@@ -98,14 +103,16 @@ def render_chat_image_editor(chat_image_editor):
                             session['chat_history'].append({'type': 'image', 'content': image_key})
                         else:
                             session['chat_history'].append({'type': 'assistant', 'content': "Sorry, I couldn't edit the image. Please try again."})
-                except Exception as e:
-                    st.error(f"An error occurred: {str(e)}")
-                    session['chat_history'].append({'type': 'assistant', 'content': f"An error occurred: {str(e)}"})
+                except BedrockInvocationError as e:
+                    st.error(e.user_message)
+                    session['chat_history'].append({'type': 'assistant', 'content': e.user_message})
                 save_to_s3(st.session_state.chat_image_editor_sessions, "chat_image_editor_sessions")
                 st.rerun()
                 
     # Button to clear chat history
     if st.button("Clear Chat"):
+        for image_key in {entry['content'] for entry in session['chat_history'] if entry['type'] == 'image'}:
+            release_image(image_key, f"chat_image_editor_sessions/{st.session_state.current_session}/images")
         session['chat_history'] = []
         session['current_image'] = None
         save_to_s3(st.session_state.chat_image_editor_sessions, "chat_image_editor_sessions")
@@ -133,7 +140,7 @@ def handle_model_session(model, sessions, model_instance):
                     st.error("No current session to delete.")
         # Create a list of session names, sorted by timestamp
         session_names = list(sessions.keys())
-        session_names.sort(key=lambda x: sessions[x].get('timestamp', ''), reverse=True)
+        session_names.sort(key=lambda x: sessions.summary(x).get('timestamp', ''), reverse=True)
         session_names.append("New Session")
 
         # Format function for session names
@@ -193,8 +200,8 @@ def display_all_sessions(model, sessions):
     if not sessions:
         st.write("No sessions found.")
     else:
-        for session_name, session_data in sorted(sessions.items(), key=lambda x: x[1].get('timestamp', ''), reverse=True):
-            timestamp = datetime.fromisoformat(session_data.get('timestamp', ''))
+        for session_name, summary in sorted(sessions.summaries().items(), key=lambda x: x[1].get('timestamp', ''), reverse=True):
+            timestamp = datetime.fromisoformat(summary.get('timestamp', ''))
             formatted_time = timestamp.strftime("%m/%d/%Y, %H:%M UTC")
             
             st.markdown(f"""
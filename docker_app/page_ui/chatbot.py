@@ -1,6 +1,14 @@
 import streamlit as st
 import pandas as pd
 from utils.s3_operations import save_to_s3
+from models.bedrock import BedrockInvocationError
+from models.conversation_window import ConversationWindow
+
+# Return the HTML of one chat message
+def message_html(role, content):
+    name = "You" if role == "user" else "AI"
+    bg_color = "#4a4a4a" if role == "user" else "#1e88e5"
+    return f"<div style='background-color: {bg_color}; color: #ffffff; padding: 10px; border-radius: 5px; margin-bottom: 10px;'><strong>{name}:</strong> {content}</div>"
 
 def render_chatbot(claude_chatbot):
     st.title("🤖 Claude Chatbot Assistant")
@@ -46,9 +54,7 @@ def render_chatbot(claude_chatbot):
     chat_container = st.container()
     with chat_container:
         for message in st.session_state.chat_history:
-            role = "You" if message["role"] == "user" else "AI"
-            bg_color = "#4a4a4a" if message["role"] == "user" else "#1e88e5"
-            st.markdown(f"<div style='background-color: {bg_color}; color: #ffffff; padding: 10px; border-radius: 5px; margin-bottom: 10px;'><strong>{role}:</strong> {message['content']}</div>", unsafe_allow_html=True)
+            st.markdown(message_html(message["role"], message["content"]), unsafe_allow_html=True)
 
     # User input
     user_input = st.text_input("Your message:", key="user_input")
@@ -60,16 +66,31 @@ def render_chatbot(claude_chatbot):
             if st.session_state.conversation_mode is None:
                 st.warning("Please select a mode before sending a message.")
             else:
-                st.session_state.chat_history.append({"role": "user", "content": user_input})
-                bot_response = claude_chatbot.get_chatbot_response(user_input, st.session_state.chat_history, st.session_state.conversation_mode)
-                st.session_state.chat_history.append({"role": "assistant", "content": bot_response})
-                save_to_s3(st.session_state.chat_history, 'chat_history')
-                st.rerun()
+                # Show the answer while it is being written
+                with chat_container:
+                    st.markdown(message_html("user", user_input), unsafe_allow_html=True)
+                    response_placeholder = st.empty()
+                bot_response = ""
+                try:
+                    for chunk in claude_chatbot.stream_chatbot_response(user_input, st.session_state.conversation_window, st.session_state.conversation_mode):
+                        bot_response += chunk
+                        response_placeholder.markdown(message_html("assistant", bot_response), unsafe_allow_html=True)
+                except BedrockInvocationError as e:
+                    # The message is not added to the conversation, so it can be sent again
+                    st.error(e.user_message)
+                else:
+                    st.session_state.chat_history.append({"role": "user", "content": user_input})
+                    st.session_state.chat_history.append({"role": "assistant", "content": bot_response})
+                    st.session_state.conversation_window.append("user", user_input)
+                    st.session_state.conversation_window.append("assistant", bot_response)
+                    save_to_s3(st.session_state.chat_history, 'chat_history')
+                    st.rerun()
 
     with col2:
         # New Conversation button
         if st.button("New Conversation"):
             st.session_state.chat_history = []
+            st.session_state.conversation_window = ConversationWindow()
             st.session_state.conversation_mode = None
             save_to_s3(st.session_state.chat_history, 'chat_history')
             st.rerun()
@@ -1,5 +1,6 @@
 import streamlit as st
 import pandas as pd
+from config_file import Config
 
 def render_home():
     st.title("🎨 AWS Bedrock Image Generation")
@@ -166,7 +167,7 @@ def render_home():
                 '✅ Supported',
                 '❌ Not available',
                 '✅ Supported',
-                '✅ Fixed at 1',
+                f'✅ 1-{Config.STABILITY_MAX_IMAGES} (one request per image, run in parallel)',
                 '✅ 1024x1024, 1152x896, 1216x832, 1344x768, 1536x640, 640x1536, 768x1344, 832x1216, 896x1152',
                 '✅ Up to 2000 chars',
                 '✅ Up to 2000 chars',
@@ -185,7 +186,7 @@ def render_home():
                 '✅ Supported with Inpainting and Outpainting (Default and Precise)',
                 '✅ Supported',               
                 '✅ Supported',
-                '✅ 1-5',
+                f'✅ 1-{Config.TITAN_MAX_IMAGES} (up to 5 per request, larger jobs run in parallel)',
                 '✅ 1024x1024, 768x768, 512x512, 1152x896, 1216x832, 1344x768, 1536x640, 1280x768, 1152x640, 1173x640, 896x1152, 832x1216, 768x1344, 640x1536, 768x1280, 640x1152, 640x1173',
                 '✅ Up to 512 chars',
                 '✅ Up to 512 chars',
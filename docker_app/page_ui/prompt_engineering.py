@@ -1,5 +1,6 @@
 import streamlit as st
 import pandas as pd
+from models.bedrock import BedrockInvocationError
 
 def render_prompt_engineering(claude_prompt_checker):
     st.title("Prompt Engineering: Best Practices")
@@ -31,13 +32,13 @@ def render_prompt_engineering(claude_prompt_checker):
     
     # Text area for user to input their prompt
     prompt = st.text_area("Enter your prompt", height=150)
+    check_requested = False
     col1, col2 = st.columns([1, 1])
     with col1:
         # Button to check the prompt
         if st.button("Check Prompt"):
             if prompt:
-                st.session_state.prompt_feedback = claude_prompt_checker.check_prompt(prompt)
-                st.rerun()
+                check_requested = True
             else:
                 st.warning("Please enter a prompt to check.")
     with col2:
@@ -45,6 +46,20 @@ def render_prompt_engineering(claude_prompt_checker):
         if st.button("Clear Feedback"):
             st.session_state.prompt_feedback = ""
             st.rerun()
+    # Show the feedback while it is being written
+    if check_requested:
+        st.subheader("Feedback:")
+        feedback_placeholder = st.empty()
+        feedback = ""
+        try:
+            for chunk in claude_prompt_checker.stream_check_prompt(prompt):
+                feedback += chunk
+                feedback_placeholder.markdown(feedback)
+        except BedrockInvocationError as e:
+            st.error(e.user_message)
+        else:
+            st.session_state.prompt_feedback = feedback
+            st.rerun()
     # Display feedback if available
     if st.session_state.prompt_feedback:
         st.subheader("Feedback:")
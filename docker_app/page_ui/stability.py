@@ -1,29 +1,38 @@
 import streamlit as st
+import html
 from PIL import Image
 import random
-import io
 import numpy as np
 from streamlit_drawable_canvas import st_canvas
 from datetime import datetime
 import time
-import boto3
 from config_file import Config
-from utils.s3_operations import save_image_to_s3, delete_image_from_s3, save_to_s3, load_from_s3, delete_from_s3
+from utils.image_cache import load_image, load_image_bytes, load_encoded_image
+from utils.encoded_image import EncodedImage
+from utils.image_codecs import image_content_type, download_file_name
+from utils.previews import load_preview, preview_key
+from models.bedrock import BedrockInvocationError
+from utils.s3_operations import save_image_to_s3, save_images_to_s3, save_to_s3, load_from_s3, delete_from_s3, get_download_url, get_presigned_url, release_image
 import cv2
 
 # Helper function to display an image stored in S3
 # 
 # This function retrieves an image from the S3 bucket and displays it in the Streamlit app.
-# It uses the boto3 client to fetch the image data, converts it to a PIL Image object,
-# and then uses Streamlit's image display function to show it.
+# It reads the decoded image through the shared image cache, which only goes to S3 on a miss,
+# and then uses Streamlit's image display function to show it. In presigned delivery mode
+# the browser loads the image straight from S3 instead.
 #
 # Parameters:
 # - image_key: The S3 key of the image to be displayed
-
-def display_s3_image(image_key):
-    s3 = boto3.client('s3')
-    img_data = s3.get_object(Bucket=Config.S3_BUCKET_NAME, Key=image_key)['Body'].read()
-    img = Image.open(io.BytesIO(img_data))
+# - preview: Show the small gallery preview instead of the full resolution image
+
+def display_s3_image(image_key, preview=False):
+    if Config.IMAGE_DELIVERY == "presigned":
+        url = get_presigned_url(preview_key(image_key) if preview else image_key)
+        if url is not None:
+            st.markdown(f'<img src="{html.escape(url)}" loading="lazy" style="width: 100%;">', unsafe_allow_html=True)
+            return
+    img = load_preview(image_key) if preview else load_image(image_key)
     st.image(img, use_column_width=True)
 
 # Function to display multiple images with selection and removal options
@@ -59,7 +68,7 @@ def display_images(image_keys, key_prefix, allow_select=True, allow_remove=True)
             if idx < len(image_keys):
                 image_key = image_keys[idx]
                 with cols[col]:
-                    display_s3_image(image_key)
+                    display_s3_image(image_key, preview=True)
                     col1, col2, col3 = st.columns([1, 1, 2])
                     with col1:
                         if allow_select:
@@ -72,14 +81,17 @@ def display_images(image_keys, key_prefix, allow_select=True, allow_remove=True)
                                 selected_index = idx
                                 st.rerun()
                     with col2:
-                        s3 = boto3.client('s3')
-                        img_data = s3.get_object(Bucket=Config.S3_BUCKET_NAME, Key=image_key)['Body'].read()
-                        st.download_button("⬇️", img_data, f"image_{idx}.png", "image/png")
+                        download_url = get_download_url(image_key, download_file_name(image_key, f"image_{idx}"))
+                        if download_url is not None:
+                            st.link_button("⬇️", download_url)
+                        else:
+                            st.download_button("⬇️", load_image_bytes(image_key), download_file_name(image_key, f"image_{idx}"), image_content_type(image_key), key=f"{key_prefix}_download_{idx}")
                     with col3:
                         if allow_remove and st.button("🗑️", key=f"{key_prefix}_remove_{idx}"):
                             session = st.session_state[f'{st.session_state.current_model}_sessions'][st.session_state.current_session]
                             session[f'{key_prefix}_images'].remove(image_key)
-                            delete_image_from_s3(image_key)
+                            if image_key not in session[f'{key_prefix}_images']:
+                                release_image(image_key, f"{st.session_state.current_model}_sessions/{st.session_state.current_session}/{key_prefix}_images")
                             
                             # Remove the corresponding uploaded file
                             if 'uploaded_files' in st.session_state:
@@ -108,6 +120,27 @@ def display_images(image_keys, key_prefix, allow_select=True, allow_remove=True)
 
     return selected_image_key, selected_index
 
+# Function to run a model request for images
+#
+# This function calls the model and reports failures on the page: an error if the
+# request failed, and a warning if only some of the requested images came back.
+#
+# Parameters:
+# - invoke: The model method to call
+# - params: Keyword arguments of the call, including num_images
+#
+# Returns:
+# - The generated images, or an empty list if the request failed
+def generate_images(invoke, **params):
+    try:
+        images = invoke(**params)
+    except BedrockInvocationError as e:
+        st.error(e.user_message)
+        return []
+    if len(images) < params['num_images']:
+        st.warning(f"Only {len(images)} of {params['num_images']} images could be generated.")
+    return images
+
 # Main function to render the Stability.ai interface
 #
 # This function sets up the main interface for the Stability.ai SDXL 1.0 Image Generator.
@@ -180,8 +213,12 @@ def display_base_step(session, stability_model):
         # Seed selection
         seed = st.number_input("Seed", value=0, min_value=0, max_value=4294967295, key=key_prefix+"seed",
                                help="Set a seed for reproducible results. Use 0 for random seed. Default: 0")
-        if seed == 0:
+        fixed_seed = seed != 0
+        if not fixed_seed:
             seed = random.randint(0, 4294967295)
+        # Number of images
+        num_images = st.slider("Number of Images", 1, Config.STABILITY_MAX_IMAGES, 1, key=key_prefix+"number_of_images",
+                               help="Select how many images to generate. Each image is generated with its own seed, in parallel. Default: 1")
 
     # Advanced settings
     with st.expander("Advanced Settings"):
@@ -209,7 +246,7 @@ def display_base_step(session, stability_model):
     if uploaded_files:
         for uploaded_file in uploaded_files:
             if uploaded_file not in st.session_state.uploaded_files:
-                image = Image.open(uploaded_file)
+                image = EncodedImage(uploaded_file.getvalue())
                 width, height = image.size
                 if f"{width}x{height}" in [size.split()[0] for size in sizes]:
                     image_key = save_image_to_s3(image, f"{st.session_state.current_model}_sessions/{st.session_state.current_session}/base_images")
@@ -223,21 +260,22 @@ def display_base_step(session, stability_model):
     # Generate base image button
     if st.button("Generate Base Image", disabled=not prompt, help="Missing text prompt" if not prompt else ""):
         with st.spinner("Generating image..."):
-            image = stability_model.invoke_text_to_image(
+            images = generate_images(stability_model.invoke_text_to_image,
                 prompt=prompt,
                 negative_prompt=negative_prompt,
                 width=width,
                 height=height,
                 style_preset=style_preset,
                 seed=seed,
+                fixed_seed=fixed_seed,
                 clip_guidance_preset=clip_guidance_preset,
                 cfg_scale=cfg_scale,
                 steps=steps,
-                sampler=sampler
+                sampler=sampler,
+                num_images=num_images
             )
-            if image:
-                image_key = save_image_to_s3(image, f"stability_sessions/{st.session_state.current_session}/base_images")
-                session['base_images'].append(image_key)
+            session['base_images'].extend(save_images_to_s3(images, f"stability_sessions/{st.session_state.current_session}/base_images"))
+            if images:
                 save_to_s3(st.session_state.stability_sessions, "stability_sessions")
 
     # Display generated and uploaded images
@@ -311,8 +349,11 @@ def display_variation_step(session, stability_model):
         with col2:
             seed = st.number_input("Seed", value=0, min_value=0, max_value=4294967295, key=key_prefix+"seed",
                                    help="Set a seed for reproducible results. Use 0 for random seed. Default: 0")
-            if seed == 0:
+            fixed_seed = seed != 0
+            if not fixed_seed:
                 seed = random.randint(0, 4294967295)
+            num_images = st.slider("Number of Images", 1, Config.STABILITY_MAX_IMAGES, 1, key=key_prefix+"number_of_images",
+                                   help="Select how many images to generate. Each image is generated with its own seed, in parallel. Default: 1")
         image_strength = st.slider("Image Strength", 0.0, 1.0, 0.35, key=key_prefix+"image_strength",
                                    help="Controls how similar the variation is to the original. Higher values = more similar. Default: 0.35")
         
@@ -336,10 +377,8 @@ def display_variation_step(session, stability_model):
     with col1:
         if st.button("Generate Variations", key="generate_variations"):
             with st.spinner("Generating variations..."):
-                s3 = boto3.client('s3')
-                img_data = s3.get_object(Bucket=Config.S3_BUCKET_NAME, Key=session['selected_base_image'])['Body'].read()
-                init_image = Image.open(io.BytesIO(img_data))
-                image = stability_model.invoke_image_variation(
+                init_image = load_encoded_image(session['selected_base_image'])
+                images = generate_images(stability_model.invoke_image_variation,
                     prompt=prompt,
                     negative_prompt=negative_prompt,
                     init_image=init_image,
@@ -347,13 +386,14 @@ def display_variation_step(session, stability_model):
                     style_preset=style_preset,
                     clip_guidance_preset=clip_guidance_preset,
                     seed=seed,
+                    fixed_seed=fixed_seed,
                     cfg_scale=cfg_scale,
                     steps=steps,
-                    sampler=sampler
+                    sampler=sampler,
+                    num_images=num_images
                 )
-                if image:
-                    image_key = save_image_to_s3(image, f"stability_sessions/{st.session_state.current_session}/variation_images")
-                    session['variation_images'].append(image_key)
+                session['variation_images'].extend(save_images_to_s3(images, f"stability_sessions/{st.session_state.current_session}/variation_images"))
+                if images:
                     save_to_s3(st.session_state.stability_sessions, "stability_sessions")
             st.rerun()
     
@@ -460,8 +500,11 @@ def display_editing_step(session, stability_model):
         with col2:
             seed = st.number_input("Seed", value=0, min_value=0, max_value=4294967295, key=key_prefix+"seed",
                                    help="Set a seed for reproducible results. Use 0 for random seed. Default: 0")
-            if seed == 0:
+            fixed_seed = seed != 0
+            if not fixed_seed:
                 seed = random.randint(0, 4294967295)
+            num_images = st.slider("Number of Images", 1, Config.STABILITY_MAX_IMAGES, 1, key=key_prefix+"number_of_images",
+                                   help="Select how many images to generate. Each image is generated with its own seed, in parallel. Default: 1")
         drawing_mode = st.selectbox(
             "Drawing Tool", ("freedraw", "line", "rect", "circle", "transform"), key=key_prefix+"drawing_mode",
             help="Choose the drawing tool for creating your mask."
@@ -493,9 +536,7 @@ def display_editing_step(session, stability_model):
 
     # Create a canvas for drawing the mask
     st.write("Draw on the image below:")
-    s3 = boto3.client('s3')
-    img_data = s3.get_object(Bucket=Config.S3_BUCKET_NAME, Key=session['editing_image'])['Body'].read()
-    background_image = Image.open(io.BytesIO(img_data))
+    background_image = load_encoded_image(session['editing_image'])
 
 
     # Calculate the scaling factor and new height
@@ -527,7 +568,7 @@ def display_editing_step(session, stability_model):
                 mask = cv2.resize(mask, (original_width, original_height), interpolation=cv2.INTER_NEAREST)
                 mask_image = Image.fromarray(mask)
 
-                image = stability_model.invoke_image_inpainting(
+                images = generate_images(stability_model.invoke_image_inpainting,
                     prompt=prompt,
                     negative_prompt=negative_prompt,
                     init_image=background_image,
@@ -535,13 +576,14 @@ def display_editing_step(session, stability_model):
                     style_preset=style_preset,
                     clip_guidance_preset=clip_guidance_preset,
                     seed=seed,
+                    fixed_seed=fixed_seed,
                     cfg_scale=cfg_scale,
                     steps=steps,
-                    sampler=sampler
+                    sampler=sampler,
+                    num_images=num_images
                 )
-                if image:
-                    image_key = save_image_to_s3(image, f"stability_sessions/{st.session_state.current_session}/editing_images")
-                    session['editing_images'].append(image_key)
+                session['editing_images'].extend(save_images_to_s3(images, f"stability_sessions/{st.session_state.current_session}/editing_images"))
+                if images:
                     save_to_s3(st.session_state.stability_sessions, "stability_sessions")
 
     st.subheader("Edited Images")
@@ -588,7 +630,7 @@ def display_editing_step(session, stability_model):
 #
 # Parameters:
 # - model: String identifier for the current model (e.g., "stability" or "titan")
-# - sessions: Dictionary containing all sessions for the current model
+# - sessions: SessionStore containing all sessions for the current model
 # - model_instance: An instance of the model class (e.g., StabilityModel or TitanModel)
 #
 # Returns:
@@ -614,7 +656,7 @@ def handle_model_session(model, sessions, model_instance):
                     st.error("No current session to delete.")
 
         session_names = list(sessions.keys())
-        session_names.sort(key=lambda x: sessions[x].get('timestamp', ''), reverse=True)
+        session_names.sort(key=lambda x: sessions.summary(x).get('timestamp', ''), reverse=True)
         session_names.append("New Session")
 
         def format_func(session_name):
@@ -672,14 +714,14 @@ def handle_model_session(model, sessions, model_instance):
 #
 # Parameters:
 # - model: String identifier for the current model (e.g., "stability" or "titan")
-# - sessions: Dictionary containing all sessions for the current model
+# - sessions: SessionStore containing all sessions for the current model
 def display_all_sessions(model, sessions):
     st.subheader(f"All {model.capitalize()} Sessions")
     if not sessions:
         st.write("No sessions found.")
     else:
-        for session_name, session_data in sorted(sessions.items(), key=lambda x: x[1].get('timestamp', ''), reverse=True):
-            timestamp = datetime.fromisoformat(session_data.get('timestamp', ''))
+        for session_name, summary in sorted(sessions.summaries().items(), key=lambda x: x[1].get('timestamp', ''), reverse=True):
+            timestamp = datetime.fromisoformat(summary.get('timestamp', ''))
             formatted_time = timestamp.strftime("%m/%d/%Y, %H:%M UTC")
             
             st.markdown(f"""
@@ -0,0 +1,59 @@
+# Generate gallery previews for images stored before previews existed
+#
+# Run from the docker_app directory:
+#   python -m tools.backfill_previews [--workers N] [--dry-run]
+#
+# The bucket is listed once; every image without a preview is decoded,
+# downscaled and re-encoded in a pool of worker processes, since that work
+# is CPU bound.
+
+import os
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from utils.storage import get_storage
+from utils.previews import preview_key, is_preview_key, generate_preview
+from utils.s3_operations import SESSION_KEYS
+from utils.blob_store import BLOB_PREFIX
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.webp')
+
+# Return the images under the session and blob prefixes that have no preview yet
+def find_missing_previews():
+    images = []
+    previews = set()
+    for key in SESSION_KEYS + [BLOB_PREFIX]:
+        for obj in get_storage().list(f"{key}/"):
+            if is_preview_key(obj.key):
+                previews.add(obj.key)
+            elif obj.key.lower().endswith(IMAGE_EXTENSIONS):
+                images.append(obj.key)
+    return [image_key for image_key in images if preview_key(image_key) not in previews]
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate missing gallery previews")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Number of worker processes")
+    parser.add_argument("--dry-run", action="store_true", help="Only report the images that need a preview")
+    args = parser.parse_args()
+
+    missing = find_missing_previews()
+    print(f"{len(missing)} images without a preview")
+    if args.dry_run or not missing:
+        return
+
+    # Worker processes must not inherit the parent's boto3 clients. The
+    # memory backend is per process, so it cannot be backfilled this way.
+    context = multiprocessing.get_context("spawn")
+    generated = 0
+    with ProcessPoolExecutor(max_workers=args.workers, mp_context=context) as executor:
+        futures = {executor.submit(generate_preview, image_key): image_key for image_key in missing}
+        for future in futures:
+            try:
+                future.result()
+                generated += 1
+            except Exception as e:
+                print(f"Failed to generate preview: {futures[future]}. Error: {str(e)}")
+    print(f"Generated {generated} previews")
+
+if __name__ == "__main__":
+    main()
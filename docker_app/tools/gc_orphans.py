@@ -0,0 +1,248 @@
+# Delete images no session references and reconcile blob references
+#
+# Run from the docker_app directory:
+#   python -m tools.gc_orphans [--dry-run] [--grace-hours H] [--workers N]
+#                              [--backend s3|filesystem|memory] [--root DIR]
+#
+# The session prefixes and the blob store are listed with parallel paginated
+# scans and every session body is read to build the set of referenced image
+# keys. Then:
+#   - reference markers missing for an image a session holds are written,
+#     and markers of session folders that no longer hold the image removed,
+#     as are generation cache markers older than GENERATION_CACHE_TTL (left
+#     behind by processes that exited before their cache entries expired);
+#   - blobs without any reference, images in session folders that their
+#     session does not list, and previews of images that are gone are
+#     deleted in batches.
+# Only objects older than the grace period are touched, so images and
+# sessions still waiting in a write-behind queue are never collected. Blobs
+# are checked for new references again right before they are deleted, since
+# an app process may have saved the same image again during the run. With
+# --dry-run nothing is changed and the report lists what would be done.
+#
+# collect_garbage() works on whatever backend get_storage() returns, so it
+# can also be run against a MemoryStorage populated by a load test.
+
+import posixpath
+import argparse
+from datetime import datetime, timedelta, timezone
+from concurrent.futures import ThreadPoolExecutor
+from config_file import Config
+from utils.storage import get_storage, set_storage, create_storage, ObjectNotFound
+from utils.bulk_delete import delete_keys
+from utils.previews import PREVIEW_EXTENSIONS, is_preview_key
+from utils.image_codecs import image_content_type
+from utils.blob_store import BLOB_PREFIX, REFS_PREFIX, blob_hash, is_blob_key, ref_key
+from utils.generation_cache import GENERATION_CACHE_OWNER
+from utils.session_format import SESSION_FILE, LEGACY_SESSION_FILE
+from utils.s3_operations import SESSION_KEYS, load_session, session_image_refs
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.webp')
+HEX_DIGITS = '0123456789abcdef'
+
+# Number of blobs whose references are checked again and that are deleted together
+RECHECK_BATCH_SIZE = 100
+
+# List every object under the given prefixes, one scan per prefix in parallel
+def scan(prefixes, workers):
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        listings = executor.map(lambda prefix: list(get_storage().list(prefix)), prefixes)
+        return [obj for listing in listings for obj in listing]
+
+# Return the keys of every preview an image may have
+def possible_preview_keys(image_key):
+    folder, file_name = posixpath.split(image_key)
+    image_hash = file_name.rsplit('.', 1)[0]
+    return [f"{folder}/previews/{image_hash}.{extension}" for extension in PREVIEW_EXTENSIONS.values()]
+
+# Return the image a preview belongs to, as a (folder, hash) pair
+def preview_owner(key):
+    folder, file_name = posixpath.split(key)
+    return posixpath.dirname(folder), file_name.rsplit('.', 1)[0]
+
+# Return the content hash of a blob or of a blob's preview, or None for
+# objects outside the blob store
+def blob_store_hash(key):
+    if is_preview_key(key):
+        folder, image_hash = preview_owner(key)
+        return image_hash if folder == BLOB_PREFIX else None
+    return blob_hash(key) if is_blob_key(key) else None
+
+# Return True if any owner references the blob with the given content hash
+def has_references(image_hash):
+    return next(iter(get_storage().list(f"{REFS_PREFIX}/{image_hash}/")), None) is not None
+
+# Return the bytes of an object, or None if it is gone
+def read_object(key):
+    try:
+        return get_storage().get(key)
+    except ObjectNotFound:
+        return None
+
+# Delete unreferenced blobs and their previews and return the number of
+# objects deleted, blobs kept and blobs restored
+#
+# The listing find_garbage() worked from may be minutes old by now. An app
+# process that saves an image again writes the reference marker first and
+# then skips the upload if the blob exists, so a blob is only deleted if it
+# still has no reference right before the delete. Its bytes are read first,
+# and put back if a reference appeared while the delete was in flight.
+def delete_blobs(objects, workers):
+    keys_by_hash = {}
+    for obj in objects:
+        keys_by_hash.setdefault(blob_store_hash(obj.key), []).append(obj.key)
+    image_hashes = sorted(keys_by_hash)
+    storage = get_storage()
+    deleted = kept = restored = 0
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for i in range(0, len(image_hashes), RECHECK_BATCH_SIZE):
+            batch = image_hashes[i:i + RECHECK_BATCH_SIZE]
+            unreferenced = [image_hash for image_hash, referenced in zip(batch, executor.map(has_references, batch)) if not referenced]
+            kept += len(batch) - len(unreferenced)
+            keys = [key for image_hash in unreferenced for key in keys_by_hash[image_hash]]
+            contents = dict(zip(keys, executor.map(read_object, keys)))
+            deleted += delete_keys(keys)
+            for image_hash, referenced in zip(unreferenced, executor.map(has_references, unreferenced)):
+                if referenced:
+                    restored += 1
+                    for key in keys_by_hash[image_hash]:
+                        if contents[key] is not None:
+                            storage.put_if_absent(key, contents[key], content_type=image_content_type(key))
+    return deleted, kept, restored
+
+# Read every session and return {session folder: session data}. Raises if a
+# session cannot be read, since its references would be unknown.
+def load_all_sessions(objects, workers):
+    session_folders = set()
+    for obj in objects:
+        folder, file_name = posixpath.split(obj.key)
+        if file_name in (SESSION_FILE, LEGACY_SESSION_FILE) and folder.split('/')[0] in SESSION_KEYS:
+            session_folders.add(folder)
+
+    def load(session_folder):
+        key, session_name = session_folder.split('/', 1)
+        loaded = load_session(key, session_name)
+        return None if loaded is None else loaded[0]
+
+    session_folders = sorted(session_folders)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        bodies = list(executor.map(load, session_folders))
+    return {folder: body for folder, body in zip(session_folders, bodies) if body is not None}
+
+# Work out what to delete and which reference markers to fix
+def find_garbage(grace_period, workers):
+    cutoff = datetime.now(timezone.utc) - grace_period
+    cache_cutoff = cutoff - timedelta(seconds=Config.GENERATION_CACHE_TTL)
+    prefixes = [f"{key}/" for key in SESSION_KEYS]
+    prefixes += [f"{BLOB_PREFIX}/{digit}" for digit in HEX_DIGITS]
+    prefixes += [f"{BLOB_PREFIX}/previews/", f"{REFS_PREFIX}/"]
+    objects = scan(prefixes, workers)
+    sessions = load_all_sessions(objects, workers)
+
+    # References held by the sessions, as image keys and expected markers
+    referenced = set()
+    expected_markers = set()
+    for session_folder, session_data in sessions.items():
+        for folder, image_key in session_image_refs(session_data):
+            referenced.add(image_key)
+            if is_blob_key(image_key):
+                expected_markers.add(ref_key(image_key, f"{session_folder}/{folder}"))
+    protected_previews = {preview for image_key in referenced for preview in possible_preview_keys(image_key)}
+
+    markers = [obj for obj in objects if obj.key.startswith(f"{REFS_PREFIX}/")]
+    marker_keys = {obj.key for obj in markers}
+    session_owner_prefixes = tuple(f"{key}/" for key in SESSION_KEYS)
+
+    # Markers kept by owners other than sessions count as references as well,
+    # generation cache markers only until they outlive the cache TTL; session
+    # markers count only if the session agrees
+    referenced_hashes = set()
+    stale_markers = []
+    for obj in markers:
+        image_hash, owner = obj.key[len(REFS_PREFIX) + 1:].split('/', 1)
+        if owner.startswith(f"{GENERATION_CACHE_OWNER}/") and obj.last_modified < cache_cutoff:
+            stale_markers.append(obj)
+        elif not owner.startswith(session_owner_prefixes) or obj.key in expected_markers:
+            referenced_hashes.add(image_hash)
+        elif obj.last_modified < cutoff:
+            stale_markers.append(obj)
+        else:
+            referenced_hashes.add(image_hash)
+    missing_markers = sorted(expected_markers - marker_keys)
+    referenced_hashes.update(marker_key[len(REFS_PREFIX) + 1:].split('/', 1)[0] for marker_key in expected_markers)
+
+    orphans = []
+    for obj in objects:
+        if obj.key.startswith(f"{REFS_PREFIX}/") or obj.last_modified >= cutoff:
+            continue
+        if is_preview_key(obj.key):
+            folder, image_hash = preview_owner(obj.key)
+            if obj.key in protected_previews:
+                continue
+            if folder == BLOB_PREFIX and image_hash in referenced_hashes:
+                continue
+            orphans.append(obj)
+        elif is_blob_key(obj.key):
+            if blob_hash(obj.key) not in referenced_hashes and obj.key not in referenced:
+                orphans.append(obj)
+        elif obj.key.lower().endswith(IMAGE_EXTENSIONS) and obj.key not in referenced:
+            orphans.append(obj)
+
+    return {
+        'objects': len(objects),
+        'sessions': len(sessions),
+        'orphans': orphans,
+        'stale_markers': stale_markers,
+        'missing_markers': missing_markers,
+    }
+
+# Collect garbage and return the report. Stale markers are removed before
+# blobs are deleted, so they do not keep their blobs alive in the recheck.
+def collect_garbage(grace_period, workers, dry_run=False):
+    report = find_garbage(grace_period, workers)
+    if not dry_run:
+        storage = get_storage()
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            list(executor.map(lambda marker_key: storage.put(marker_key, b''), report['missing_markers']))
+        blobs = [obj for obj in report['orphans'] if blob_store_hash(obj.key) is not None]
+        others = [obj.key for obj in report['orphans'] if blob_store_hash(obj.key) is None]
+        report['deleted'] = delete_keys([obj.key for obj in report['stale_markers']] + others)
+        deleted, report['kept'], report['restored'] = delete_blobs(blobs, workers)
+        report['deleted'] += deleted
+    return report
+
+def print_report(report, dry_run):
+    orphan_bytes = sum(obj.size for obj in report['orphans'])
+    print(f"Scanned {report['objects']} objects and {report['sessions']} sessions")
+    print(f"{len(report['orphans'])} unreferenced images and previews ({orphan_bytes / (1024 * 1024):.1f} MiB)")
+    print(f"{len(report['stale_markers'])} stale reference markers")
+    print(f"{len(report['missing_markers'])} missing reference markers")
+    if dry_run:
+        for obj in report['orphans']:
+            print(f"  would delete {obj.key} ({obj.size} bytes, {obj.last_modified.isoformat()})")
+        for obj in report['stale_markers']:
+            print(f"  would remove reference {obj.key}")
+        for marker_key in report['missing_markers']:
+            print(f"  would add reference {marker_key}")
+    else:
+        print(f"Deleted {report['deleted']} objects")
+        print(f"Kept {report['kept']} blobs referenced again during the run, restored {report['restored']}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Delete unreferenced images and reconcile blob references")
+    parser.add_argument("--dry-run", action="store_true", help="Only report what would be changed")
+    parser.add_argument("--grace-hours", type=float, default=Config.GC_GRACE_HOURS, help="Leave objects younger than this alone")
+    parser.add_argument("--workers", type=int, default=Config.S3_MAX_WORKERS, help="Number of parallel scans and reads")
+    parser.add_argument("--backend", choices=["s3", "filesystem", "memory"], default=None, help="Storage backend (default: Config.STORAGE_BACKEND)")
+    parser.add_argument("--root", default=None, help="Directory of the filesystem backend (default: Config.STORAGE_ROOT)")
+    args = parser.parse_args()
+    if args.root is not None:
+        Config.STORAGE_ROOT = args.root
+    if args.backend is not None:
+        set_storage(create_storage(args.backend))
+
+    report = collect_garbage(timedelta(hours=args.grace_hours), args.workers, dry_run=args.dry_run)
+    print_report(report, args.dry_run)
+
+if __name__ == "__main__":
+    main()
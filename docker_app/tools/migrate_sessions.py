@@ -0,0 +1,87 @@
+# Rewrite pickled sessions and chat history in the versioned JSON format
+#
+# Run from the docker_app directory:
+#   python -m tools.migrate_sessions [--workers N] [--dry-run] [--keep-pickles]
+#
+# The app reads legacy pickles and rewrites a session the next time it is
+# saved, so running this is optional; it converts everything at once so the
+# pickle fallback is no longer needed. Sessions are converted concurrently.
+
+import pickle
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from config_file import Config
+from utils.storage import get_storage, ObjectNotFound
+from utils.session_format import encode_document, encode_session, SESSION_FILE, LEGACY_SESSION_FILE
+from utils.s3_operations import SESSION_KEYS
+
+# Return the (key, session name) pairs that still only have a pickled body
+def find_legacy_sessions():
+    storage = get_storage()
+    legacy = []
+    for key in SESSION_KEYS:
+        files = {}
+        for obj in storage.list(f"{key}/"):
+            parts = obj.key[len(key) + 1:].split('/')
+            if len(parts) == 2:
+                files.setdefault(parts[0], set()).add(parts[1])
+        for session_name, names in files.items():
+            if LEGACY_SESSION_FILE in names:
+                legacy.append((key, session_name, SESSION_FILE in names))
+    return legacy
+
+# Convert one session and return its encoded size
+def migrate_session(key, session_name, converted, keep_pickles):
+    storage = get_storage()
+    legacy_key = f"{key}/{session_name}/{LEGACY_SESSION_FILE}"
+    size = 0
+    if not converted:
+        serialized = encode_session(pickle.loads(storage.get(legacy_key)))
+        storage.put(f"{key}/{session_name}/{SESSION_FILE}", serialized)
+        size = len(serialized)
+    if not keep_pickles:
+        storage.delete(legacy_key)
+    return size
+
+# Convert the pickled chatbot history, if there is one
+def migrate_chat_history(keep_pickles):
+    storage = get_storage()
+    try:
+        chat_history = pickle.loads(storage.get('chat_history'))
+    except ObjectNotFound:
+        return False
+    storage.put('chat_history.json', encode_document(chat_history))
+    if not keep_pickles:
+        storage.delete('chat_history')
+    return True
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert pickled sessions to the versioned JSON format")
+    parser.add_argument("--workers", type=int, default=Config.S3_MAX_WORKERS, help="Number of concurrent conversions")
+    parser.add_argument("--dry-run", action="store_true", help="Only report the sessions that need converting")
+    parser.add_argument("--keep-pickles", action="store_true", help="Leave the pickled objects in place")
+    args = parser.parse_args()
+
+    legacy = find_legacy_sessions()
+    print(f"{len(legacy)} pickled sessions")
+    if args.dry_run:
+        return
+
+    migrated = 0
+    total_size = 0
+    with ThreadPoolExecutor(max_workers=args.workers) as executor:
+        futures = {executor.submit(migrate_session, key, session_name, converted, args.keep_pickles): (key, session_name)
+                   for key, session_name, converted in legacy}
+        for future in futures:
+            try:
+                total_size += future.result()
+                migrated += 1
+            except Exception as e:
+                print(f"Failed to migrate session: {'/'.join(futures[future])}. Error: {str(e)}")
+    print(f"Migrated {migrated} sessions ({total_size} bytes written)")
+
+    if migrate_chat_history(args.keep_pickles):
+        print("Migrated chat history")
+
+if __name__ == "__main__":
+    main()
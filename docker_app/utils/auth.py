@@ -1,4 +1,4 @@
-import boto3
+from utils.aws_clients import get_client
 import json
 from streamlit_cognito_auth import CognitoAuthenticator
 
@@ -12,7 +12,7 @@ class Auth:
         returns a CognitoAuthenticator object.
         """
         # Get Cognito parameters from Secrets Manager
-        secretsmanager_client = boto3.client("secretsmanager")
+        secretsmanager_client = get_client("secretsmanager")
         response = secretsmanager_client.get_secret_value(
             SecretId=secret_id,
         )
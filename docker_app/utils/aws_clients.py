@@ -0,0 +1,37 @@
+import threading
+import boto3
+from botocore.config import Config as BotoConfig
+from config_file import Config
+
+# Process-wide registry of boto3 clients, keyed by service name and region.
+# boto3 clients are thread-safe once created, so every Streamlit session and
+# worker thread can share the same client and its connection pool instead of
+# re-resolving credentials and endpoints on every call.
+_clients = {}
+_lock = threading.Lock()
+
+# Return the shared client for a service, creating it on first use. Extra
+# keyword arguments are botocore Config options such as read_timeout; each
+# distinct set of options gets its own client.
+def get_client(service_name, region_name=None, **config_options):
+    key = (service_name, region_name, repr(sorted(config_options.items())))
+    client = _clients.get(key)
+    if client is None:
+        with _lock:
+            client = _clients.get(key)
+            if client is None:
+                # boto3.client() uses the default session, which is not thread-safe,
+                # so each client gets its own session
+                session = boto3.session.Session()
+                client = session.client(
+                    service_name,
+                    region_name=region_name,
+                    config=BotoConfig(max_pool_connections=Config.AWS_MAX_POOL_CONNECTIONS, **config_options)
+                )
+                _clients[key] = client
+    return client
+
+# Drop all cached clients, e.g. after credentials have been rotated
+def reset_clients():
+    with _lock:
+        _clients.clear()
@@ -0,0 +1,75 @@
+import posixpath
+from utils.storage import get_storage
+from utils.write_behind import get_write_behind
+from utils.known_keys import get_known_keys
+
+# Global content-addressed image store
+#
+# Every image is stored once as blobs/<hash>.<ext>, whichever session or
+# image list it belongs to. References are recorded as one empty marker
+# object per owner under blobs/refs/<hash>/<owner>, where the owner is the
+# folder the image was saved for, e.g. stability_sessions/s1/base_images.
+# Adding a reference is a single idempotent PUT and releasing one a DELETE,
+# so replicas never have to read-modify-write a shared counter. The number
+# of references of a blob is the number of its markers.
+#
+# Releasing the last reference does not delete the blob; unreferenced blobs
+# are removed by the garbage collector after a grace period, so a blob that
+# is referenced again in the meantime is never lost.
+
+BLOB_PREFIX = "blobs"
+REFS_PREFIX = f"{BLOB_PREFIX}/refs"
+PREVIEWS_PREFIX = f"{BLOB_PREFIX}/previews"
+
+# Return the key of the blob holding an image with the given content hash
+def blob_key(content_hash, extension='png'):
+    return f"{BLOB_PREFIX}/{content_hash}.{extension}"
+
+# Return True for any key under the blob store prefix, including reference
+# markers and previews
+def in_blob_store(key):
+    return key.startswith(f"{BLOB_PREFIX}/")
+
+# Return True for image keys in the blob store, as opposed to the per-session
+# keys used before it existed. Reference markers and previews are not blobs.
+def is_blob_key(key):
+    return in_blob_store(key) and not key.startswith((f"{REFS_PREFIX}/", f"{PREVIEWS_PREFIX}/"))
+
+# Return the content hash of a blob key
+def blob_hash(image_key):
+    return posixpath.basename(image_key).rsplit('.', 1)[0]
+
+# Return the key of the marker recording that owner references a blob
+def ref_key(image_key, owner):
+    if not is_blob_key(image_key):
+        raise ValueError(f"Not a blob key: {image_key}")
+    return f"{REFS_PREFIX}/{blob_hash(image_key)}/{owner}"
+
+# Record that owner references a blob. The marker is written by the
+# write-behind queue; markers this process already wrote are skipped.
+def add_reference(image_key, owner):
+    marker_key = ref_key(image_key, owner)
+    if marker_key in get_known_keys():
+        return
+    get_write_behind().submit(marker_key, lambda: _put_marker(marker_key), pending={marker_key: b''})
+
+# Drop owner's reference to a blob
+def release_reference(image_key, owner):
+    marker_key = ref_key(image_key, owner)
+    get_known_keys().discard_many([marker_key])
+    get_write_behind().submit(marker_key, lambda: _delete_marker(marker_key))
+
+# Return the owners referencing a blob
+def list_references(image_key):
+    prefix = f"{REFS_PREFIX}/{blob_hash(image_key)}/"
+    return [obj.key[len(prefix):] for obj in get_storage().list(prefix)]
+
+def _put_marker(marker_key):
+    get_storage().put(marker_key, b'')
+    get_known_keys().add(marker_key)
+
+# The key is forgotten again once the delete has landed, in case a queued
+# add_reference() for it completed in the meantime
+def _delete_marker(marker_key):
+    get_storage().delete(marker_key)
+    get_known_keys().discard_many([marker_key])
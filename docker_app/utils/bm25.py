@@ -0,0 +1,60 @@
+import re
+import math
+import heapq
+from collections import Counter
+
+# Words too common to say anything about what a text is about
+STOP_WORDS = {
+    'a', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'can', 'do', 'does', 'for', 'from', 'how', 'i',
+    'if', 'in', 'is', 'it', 'its', 'me', 'my', 'of', 'on', 'or', 'so', 'that', 'the', 'their', 'this',
+    'to', 'use', 'what', 'when', 'which', 'with', 'you', 'your',
+}
+
+# Split text into lowercase terms, dropping stop words and a plural "s"
+def tokenize(text):
+    terms = []
+    for word in re.findall(r"[a-z0-9]+", text.lower()):
+        if word in STOP_WORDS:
+            continue
+        if len(word) > 3 and word.endswith('s') and not word.endswith('ss'):
+            word = word[:-1]
+        terms.append(word)
+    return terms
+
+# Okapi BM25 index over a fixed list of documents
+#
+# Built once from the documents' text; search() scores only the documents
+# that share a term with the query, through per-term posting lists, so a
+# query costs time proportional to the matching postings rather than to the
+# size of the collection.
+class BM25Index:
+    def __init__(self, documents, k1=1.5, b=0.75):
+        self._k1 = k1
+        self._b = b
+        self._lengths = []
+        self._postings = {}
+        for doc_id, text in enumerate(documents):
+            terms = tokenize(text)
+            self._lengths.append(len(terms))
+            for term, count in Counter(terms).items():
+                self._postings.setdefault(term, []).append((doc_id, count))
+        self._average_length = sum(self._lengths) / len(self._lengths) if self._lengths else 0.0
+        document_count = len(self._lengths)
+        self._idf = {
+            term: math.log(1 + (document_count - len(postings) + 0.5) / (len(postings) + 0.5))
+            for term, postings in self._postings.items()
+        }
+
+    # Return up to k (document index, score) pairs for the documents that
+    # best match the query, best first. Documents sharing no term with the
+    # query are not returned.
+    def search(self, query, k):
+        scores = {}
+        for term in set(tokenize(query)):
+            idf = self._idf.get(term)
+            if idf is None:
+                continue
+            for doc_id, count in self._postings[term]:
+                norm = self._k1 * (1 - self._b + self._b * self._lengths[doc_id] / self._average_length)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * count * (self._k1 + 1) / (count + norm)
+        return heapq.nlargest(k, scores.items(), key=lambda item: (item[1], -item[0]))
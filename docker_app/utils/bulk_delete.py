@@ -0,0 +1,89 @@
+import queue
+import threading
+import atexit
+from concurrent.futures import ThreadPoolExecutor
+from config_file import Config
+from utils.storage import get_storage
+from utils.write_behind import get_write_behind
+from utils.known_keys import get_known_keys
+
+# DeleteObjects accepts at most 1000 keys per request
+DELETE_BATCH_SIZE = 1000
+
+# Delete one batch of keys with a single request (DeleteObjects on S3) and
+# return the number of objects deleted
+def delete_batch(keys):
+    get_known_keys().discard_many(keys)
+    return get_storage().delete_many(keys)
+
+# Delete any number of keys, sending the batches concurrently
+def delete_keys(keys):
+    keys = list(keys)
+    batches = [keys[i:i + DELETE_BATCH_SIZE] for i in range(0, len(keys), DELETE_BATCH_SIZE)]
+    if not batches:
+        return 0
+    with ThreadPoolExecutor(max_workers=min(len(batches), Config.S3_MAX_WORKERS)) as executor:
+        return sum(executor.map(delete_batch, batches))
+
+# Delete every object under a prefix, following every page of the listing.
+# Each page holds up to 1000 keys, so its batch is sent while the next page
+# is being listed.
+def delete_prefix(prefix):
+    get_known_keys().discard_prefix(prefix)
+    with ThreadPoolExecutor(max_workers=Config.S3_MAX_WORKERS) as executor:
+        futures = []
+        for page in get_storage().list_pages(prefix):
+            keys = [obj.key for obj in page]
+            if keys:
+                futures.append(executor.submit(delete_batch, keys))
+        return sum(future.result() for future in futures)
+
+# Background queue that collects single-key deletes from the UI and sends
+# them as DeleteObjects batches, so click handlers never wait on S3
+class DeleteQueue:
+    def __init__(self):
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    # Queue a key for deletion
+    def put(self, key):
+        self._start()
+        self._queue.put(key)
+
+    # Block until every queued key has been processed
+    def join(self):
+        self._queue.join()
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="s3-delete-queue", daemon=True)
+                self._thread.start()
+                atexit.register(self.join)
+
+    def _run(self):
+        while True:
+            keys = [self._queue.get()]
+            while len(keys) < DELETE_BATCH_SIZE:
+                try:
+                    keys.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                # An image deleted right after it was generated may still be
+                # waiting to be uploaded
+                for key in keys:
+                    get_write_behind().wait_for_prefix(key)
+                delete_batch(keys)
+            except Exception as e:
+                print(f"Failed to delete {len(keys)} queued objects. Error: {str(e)}")
+            finally:
+                for _ in keys:
+                    self._queue.task_done()
+
+_delete_queue = DeleteQueue()
+
+# Queue an object for deletion by the background delete queue
+def queue_delete(key):
+    _delete_queue.put(key)
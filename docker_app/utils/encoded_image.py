@@ -0,0 +1,96 @@
+import io
+import base64
+from PIL import Image
+
+# Leading bytes of the encodings we recognise
+IMAGE_SIGNATURES = [
+    (b'\x89PNG\r\n\x1a\n', 'PNG'),
+    (b'\xff\xd8\xff', 'JPEG'),
+]
+
+# An image kept in its encoded form
+#
+# Model responses, uploads and stored images arrive as PNG, JPEG or WebP bytes.
+# Wrapping them in an EncodedImage keeps those bytes, so they can be hashed,
+# stored and sent back to a model without a decode and PNG re-encode. The
+# pixels are only decoded when something asks for them: attributes that are
+# not defined here (size, resize(), copy(), ...) are looked up on the decoded
+# PIL image, so an EncodedImage can be passed wherever a PIL image was.
+#
+# stored_key is set by save_image_to_s3 once the bytes have been saved, so
+# saving the same image again only adds a reference. Images live for one
+# script run, well within the garbage collector's grace period.
+class EncodedImage:
+    def __init__(self, data):
+        self.data = bytes(data)
+        self.stored_key = None
+        self._image = None
+
+    # Build an EncodedImage from a base64 string, e.g. a model response
+    @classmethod
+    def from_base64(cls, base64_string):
+        return cls(base64.b64decode(base64_string))
+
+    # Encode a PIL image as PNG. Used when the pixels have been changed.
+    @classmethod
+    def from_image(cls, img, format='PNG'):
+        buffered = io.BytesIO()
+        img.save(buffered, format=format)
+        return cls(buffered.getvalue())
+
+    # Encoding of the bytes ('PNG', 'JPEG', 'WEBP'), or None if unrecognised
+    @property
+    def format(self):
+        for signature, format in IMAGE_SIGNATURES:
+            if self.data.startswith(signature):
+                return format
+        if self.data[:4] == b'RIFF' and self.data[8:12] == b'WEBP':
+            return 'WEBP'
+        return None
+
+    # The decoded PIL image. Opening only parses the header; pixel data is
+    # decoded the first time it is used.
+    @property
+    def image(self):
+        if self._image is None:
+            self._image = Image.open(io.BytesIO(self.data))
+        return self._image
+
+    # Return the image as PNG bytes, re-encoding only if it is not PNG already
+    def to_png(self):
+        if self.format == 'PNG':
+            return self.data
+        return EncodedImage.from_image(self.image).data
+
+    # Return the PNG bytes as a base64 string for a model request
+    def to_base64(self):
+        return base64.b64encode(self.to_png()).decode('utf-8')
+
+    @property
+    def width(self):
+        return self.image.width
+
+    @property
+    def height(self):
+        return self.image.height
+
+    @property
+    def size(self):
+        return self.image.size
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return getattr(self.image, name)
+
+# Return the PNG bytes of a PIL image or EncodedImage
+def png_bytes(img):
+    if isinstance(img, EncodedImage):
+        return img.to_png()
+    return EncodedImage.from_image(img).data
+
+# Return the PIL image behind a PIL image or EncodedImage
+def pil_image(img):
+    if isinstance(img, EncodedImage):
+        return img.image
+    return img
@@ -0,0 +1,50 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from config_file import Config
+from models.bedrock import BedrockInvocationError
+
+_executor = None
+_executor_lock = threading.Lock()
+
+# Return the process-wide pool for model invocations. It bounds how many
+# Bedrock requests run at once across all browser sessions.
+def get_model_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=Config.BEDROCK_MAX_CONCURRENCY, thread_name_prefix="bedrock")
+    return _executor
+
+# Call fn once per tuple of arguments, concurrently, and return the results in
+# the order of the calls. A call that fails with BedrockInvocationError yields
+# None in its place, so one failed image does not lose the others; if every
+# call failed, the first error is raised. Other exceptions are raised as is.
+def fan_out(fn, calls):
+    calls = list(calls)
+    if len(calls) == 1:
+        futures = None
+    else:
+        executor = get_model_executor()
+        futures = [executor.submit(fn, *args) for args in calls]
+
+    results = []
+    errors = []
+    for i, args in enumerate(calls):
+        try:
+            results.append(fn(*args) if futures is None else futures[i].result())
+        except BedrockInvocationError as e:
+            errors.append(e)
+            results.append(None)
+    if errors and len(errors) == len(calls):
+        raise errors[0]
+    return results
+
+# Return `count` seeds for the images of one request. Each image gets its own
+# seed derived from the requested one, so a batch is reproducible. A seed of
+# 0 asks the model for a random seed and is passed on unchanged; derived seeds
+# wrap around from max_seed to 1, never to 0.
+def derive_seeds(seed, count, max_seed=4294967295):
+    if seed == 0:
+        return [0] * count
+    return [(seed - 1 + i) % max_seed + 1 for i in range(count)]
@@ -0,0 +1,152 @@
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from config_file import Config
+from utils.blob_store import release_reference
+from utils.image_cache import load_encoded_image
+from utils.s3_operations import save_images_to_s3
+
+# Request fields that carry base64 images, in the Stability and Titan APIs
+IMAGE_FIELDS = {'init_image', 'mask_image', 'image', 'maskImage', 'images'}
+
+# Blobs of cached results are referenced by owners under this prefix, one per
+# request fingerprint, so tools.gc_orphans keeps them while they are cached
+GENERATION_CACHE_OWNER = "generation_cache"
+
+# Return the canonical form of a request body: keys sorted, and the base64
+# images replaced by the SHA-256 of their bytes so the fingerprint does not
+# depend on how the image was encoded into the request
+def canonical_request(value, field=None):
+    if isinstance(value, dict):
+        return {key: canonical_request(item, key) for key, item in sorted(value.items()) if item is not None}
+    if isinstance(value, list):
+        return [canonical_request(item, field) for item in value]
+    if field in IMAGE_FIELDS and isinstance(value, str):
+        return f"sha256:{hashlib.sha256(value.encode('ascii')).hexdigest()}"
+    return value
+
+# Return the fingerprint of a request: the SHA-256 of the model ID and the
+# canonical body. The body holds the task type, prompts, parameters and seed.
+def request_fingerprint(model_id, body):
+    canonical = json.dumps([model_id, canonical_request(body)], sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+# Return the blob reference owner of a cached result
+def cache_owner(fingerprint):
+    return f"{GENERATION_CACHE_OWNER}/{fingerprint}"
+
+# In-process cache of generation results
+#
+# Image models are deterministic for a fixed non-zero seed, so a request that
+# was already answered does not need another Bedrock call. Results are kept as
+# the blob keys of the generated images, in order, together with how long the
+# original call took. Entries expire ttl seconds after they were stored and
+# the least recently used are dropped beyond max_entries; either way the
+# entry's blob references are released, so the garbage collector can reclaim
+# images no session holds.
+class GenerationCache:
+    def __init__(self, max_entries, ttl, clock=time.monotonic):
+        self._max_entries = max_entries
+        self._ttl = ttl
+        self._clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'stores': 0, 'evictions': 0, 'expirations': 0, 'seconds_saved': 0.0}
+
+    # Return the image keys stored for a fingerprint, or None
+    def get(self, fingerprint):
+        expired = None
+        with self._lock:
+            entry = self._entries.get(fingerprint)
+            if entry is not None and self._clock() - entry[2] > self._ttl:
+                expired = self._entries.pop(fingerprint)
+                self._stats['expirations'] += 1
+                entry = None
+            if entry is None:
+                self._stats['misses'] += 1
+            else:
+                self._entries.move_to_end(fingerprint)
+                self._stats['hits'] += 1
+                self._stats['seconds_saved'] += entry[1]
+        if expired is not None:
+            self._release(fingerprint, expired[0])
+        return None if entry is None else list(entry[0])
+
+    # Remember the image keys of a request that took `latency` seconds
+    def put(self, fingerprint, image_keys, latency):
+        evicted = []
+        with self._lock:
+            previous = self._entries.pop(fingerprint, None)
+            if previous is not None:
+                evicted.append((fingerprint, set(previous[0]) - set(image_keys)))
+            self._entries[fingerprint] = (list(image_keys), latency, self._clock())
+            self._stats['stores'] += 1
+            while len(self._entries) > self._max_entries:
+                evicted_fingerprint, entry = self._entries.popitem(last=False)
+                evicted.append((evicted_fingerprint, entry[0]))
+                self._stats['evictions'] += 1
+        for evicted_fingerprint, image_keys in evicted:
+            self._release(evicted_fingerprint, image_keys)
+
+    # Drop an entry whose images can no longer be read
+    def discard(self, fingerprint):
+        with self._lock:
+            entry = self._entries.pop(fingerprint, None)
+        if entry is not None:
+            self._release(fingerprint, entry[0])
+
+    # Return a copy of the counters, the hit rate and the number of entries
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['entries'] = len(self._entries)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+        return stats
+
+    def _release(self, fingerprint, image_keys):
+        for image_key in set(image_keys):
+            release_reference(image_key, cache_owner(fingerprint))
+
+_generation_cache = GenerationCache(Config.GENERATION_CACHE_MAX_ENTRIES, Config.GENERATION_CACHE_TTL)
+
+# Return the process-wide generation cache
+def get_generation_cache():
+    return _generation_cache
+
+# Return the images for a request, from the cache if it was answered before
+#
+# generate() makes the Bedrock call and returns the list of images; its
+# BedrockInvocationError reaches the caller uncached. Only requests whose seed the user set (fixed_seed) are cached:
+# the pages replace seed 0 with a random seed, and caching those requests
+# would store results that are never asked for again. Failed or empty
+# results are not cached either. A cached result whose images cannot be read
+# any more is dropped and generated again.
+#
+# New results are saved once, here; the images remember their keys, so the
+# page saving them to its session only adds its reference.
+def cached_generation(model_id, body, fixed_seed, generate):
+    if not fixed_seed or Config.GENERATION_CACHE_MAX_ENTRIES <= 0:
+        return generate()
+
+    cache = get_generation_cache()
+    fingerprint = request_fingerprint(model_id, body)
+    image_keys = cache.get(fingerprint)
+    if image_keys is not None:
+        try:
+            return [load_encoded_image(image_key) for image_key in image_keys]
+        except Exception as e:
+            print(f"Cached generation result is unreadable, generating again: {fingerprint}. Error: {str(e)}")
+            cache.discard(fingerprint)
+
+    start = time.perf_counter()
+    images = generate()
+    latency = time.perf_counter() - start
+    if images:
+        try:
+            cache.put(fingerprint, save_images_to_s3(images, cache_owner(fingerprint)), latency)
+        except Exception as e:
+            print(f"Failed to cache generation result: {fingerprint}. Error: {str(e)}")
+    return images
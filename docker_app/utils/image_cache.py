@@ -0,0 +1,215 @@
+import os
+import io
+import hashlib
+import threading
+from collections import OrderedDict
+from PIL import Image
+from config_file import Config
+from utils.write_behind import read_through_pending
+from utils.encoded_image import EncodedImage
+
+# Two-tier read-through cache for images in the storage backend
+#
+# Image keys are content hashes, so an object never changes once written and
+# cached entries never need to be invalidated. The first tier is an in-memory
+# LRU of decoded images bounded by their pixel size, the second an on-disk LRU
+# of the encoded bytes bounded by file size. Either tier is disabled by giving
+# it a budget of 0. A disk entry that cannot be decoded any more is dropped and
+# the object is fetched again.
+class ImageCache:
+    def __init__(self, fetch, memory_bytes, disk_bytes, disk_dir):
+        self._fetch = fetch
+        self._memory_bytes = memory_bytes
+        self._disk_bytes = disk_bytes
+        self._disk_dir = disk_dir
+        self._memory = OrderedDict()
+        self._memory_size = 0
+        self._disk = OrderedDict()
+        self._disk_size = 0
+        self._lock = threading.Lock()
+        self._stats = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0, 'evictions': 0}
+        if self._disk_bytes > 0:
+            self._load_disk_index()
+
+    # Return the decoded image for a key
+    def get_image(self, key):
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                self._memory.move_to_end(key)
+                self._stats['memory_hits'] += 1
+                return entry[0]
+
+        try:
+            img = self._decode(self.get_bytes(key))
+        except OSError:
+            if not self._discard_disk(key):
+                raise
+            print(f"Dropped damaged cache entry: {key}")
+            img = self._decode(self.get_bytes(key))
+        self._remember_image(key, img)
+        return img
+
+    # Return the encoded bytes for a key
+    def get_bytes(self, key):
+        data = self._read_disk(key)
+        if data is not None:
+            with self._lock:
+                self._stats['disk_hits'] += 1
+            return data
+
+        data = self._fetch(key)
+        with self._lock:
+            self._stats['misses'] += 1
+        self._write_disk(key, data)
+        return data
+
+    # Seed the cache with bytes that were just written, so the next read of
+    # the key does not go back to S3
+    def put_bytes(self, key, data):
+        self._write_disk(key, data)
+
+    # Return a copy of the hit/miss counters and current tier sizes
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['memory_bytes'] = self._memory_size
+            stats['memory_entries'] = len(self._memory)
+            stats['disk_bytes'] = self._disk_size
+            stats['disk_entries'] = len(self._disk)
+        return stats
+
+    def _decode(self, data):
+        img = Image.open(io.BytesIO(data))
+        img.load()
+        return img
+
+    def _remember_image(self, key, img):
+        size = img.width * img.height * len(img.getbands())
+        if size > self._memory_bytes:
+            return
+        with self._lock:
+            if key in self._memory:
+                return
+            self._memory[key] = (img, size)
+            self._memory_size += size
+            while self._memory_size > self._memory_bytes:
+                _, (_, evicted_size) = self._memory.popitem(last=False)
+                self._memory_size -= evicted_size
+                self._stats['evictions'] += 1
+
+    def _disk_path(self, key):
+        return os.path.join(self._disk_dir, hashlib.sha1(key.encode('utf-8')).hexdigest())
+
+    # Rebuild the LRU order of a cache directory left by a previous process
+    def _load_disk_index(self):
+        os.makedirs(self._disk_dir, exist_ok=True)
+        entries = []
+        for entry in os.scandir(self._disk_dir):
+            if entry.is_file() and not entry.name.endswith('.tmp'):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, entry.path, stat.st_size))
+        for _, path, size in sorted(entries):
+            self._disk[path] = size
+            self._disk_size += size
+
+    def _read_disk(self, key):
+        if self._disk_bytes <= 0:
+            return None
+        path = self._disk_path(key)
+        with self._lock:
+            size = self._disk.get(path)
+            if size is None:
+                return None
+            self._disk.move_to_end(path)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except OSError:
+            data = None
+        if data is None or len(data) != size:
+            self._discard_disk(key)
+            return None
+        return data
+
+    # Remove the disk entry of a key. Returns True if there was one.
+    def _discard_disk(self, key):
+        path = self._disk_path(key)
+        with self._lock:
+            size = self._disk.pop(path, None)
+            if size is None:
+                return False
+            self._disk_size -= size
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        return True
+
+    def _write_disk(self, key, data):
+        if self._disk_bytes <= 0 or len(data) > self._disk_bytes:
+            return
+        path = self._disk_path(key)
+        with self._lock:
+            if path in self._disk:
+                return
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Failed to cache image on disk: {key}. Error: {str(e)}")
+            return
+
+        evicted = []
+        with self._lock:
+            if path not in self._disk:
+                self._disk[path] = len(data)
+                self._disk_size += len(data)
+            while self._disk_size > self._disk_bytes:
+                evicted_path, evicted_size = self._disk.popitem(last=False)
+                self._disk_size -= evicted_size
+                self._stats['evictions'] += 1
+                evicted.append(evicted_path)
+        for evicted_path in evicted:
+            try:
+                os.remove(evicted_path)
+            except OSError:
+                pass
+
+# Read an object's bytes from the storage backend, including writes that are
+# still waiting in the write-behind queue
+def fetch_from_storage(key):
+    return read_through_pending(key)
+
+_image_cache = None
+_image_cache_lock = threading.Lock()
+
+# Return the process-wide image cache
+def get_image_cache():
+    global _image_cache
+    if _image_cache is None:
+        with _image_cache_lock:
+            if _image_cache is None:
+                _image_cache = ImageCache(
+                    fetch_from_storage,
+                    memory_bytes=Config.IMAGE_CACHE_MEMORY_BYTES,
+                    disk_bytes=Config.IMAGE_CACHE_DISK_BYTES,
+                    disk_dir=Config.IMAGE_CACHE_DIR
+                )
+    return _image_cache
+
+# Return the decoded image stored under a key, reading through the cache
+def load_image(image_key):
+    return get_image_cache().get_image(image_key)
+
+# Return the encoded bytes stored under a key, reading through the cache
+def load_image_bytes(image_key):
+    return get_image_cache().get_bytes(image_key)
+
+# Return the image stored under a key as an EncodedImage, reading through the
+# cache. Use this for images that are sent on to a model, so their bytes are
+# passed along without a decode and re-encode.
+def load_encoded_image(image_key):
+    return EncodedImage(get_image_cache().get_bytes(image_key))
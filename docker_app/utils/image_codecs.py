@@ -0,0 +1,59 @@
+import io
+import posixpath
+from config_file import Config
+from utils.encoded_image import EncodedImage, pil_image
+
+# File extension and content type of every encoding images are stored in
+IMAGE_EXTENSIONS = {'PNG': 'png', 'JPEG': 'jpg', 'WEBP': 'webp'}
+IMAGE_CONTENT_TYPES = {'png': 'image/png', 'jpg': 'image/jpeg', 'jpeg': 'image/jpeg', 'webp': 'image/webp'}
+
+# Storage codecs selected by Config.IMAGE_STORAGE_FORMAT
+#
+#   "png"       PNG at PNG_COMPRESS_LEVEL
+#   "webp"      lossless WebP
+#   "original"  the bytes the image arrived in (uploaded JPEGs stay JPEG),
+#               PNG for images that only exist as pixels
+#
+# Images that already arrived in the target encoding, such as the PNGs
+# returned by the models, are stored as they are rather than re-encoded.
+
+# Encode an image as PNG at the configured compression level
+def encode_png(img):
+    buffered = io.BytesIO()
+    pil_image(img).save(buffered, format='PNG', compress_level=Config.PNG_COMPRESS_LEVEL)
+    return buffered.getvalue()
+
+# Encode an image as lossless WebP
+def encode_webp(img):
+    buffered = io.BytesIO()
+    pil_image(img).save(buffered, format='WEBP', lossless=True, method=Config.WEBP_METHOD)
+    return buffered.getvalue()
+
+ENCODERS = {'PNG': encode_png, 'WEBP': encode_webp}
+STORAGE_FORMATS = {'png': 'PNG', 'webp': 'WEBP'}
+
+# Return (bytes, file extension, content type) to store an image with
+def encode_for_storage(img):
+    storage_format = Config.IMAGE_STORAGE_FORMAT
+    if storage_format not in STORAGE_FORMATS and storage_format != 'original':
+        raise ValueError(f"Unknown image storage format: {storage_format}")
+
+    encoded_format = img.format if isinstance(img, EncodedImage) else None
+    if encoded_format is not None and (storage_format == 'original' or STORAGE_FORMATS.get(storage_format) == encoded_format):
+        data = img.data
+    else:
+        encoded_format = STORAGE_FORMATS.get(storage_format, 'PNG')
+        data = ENCODERS[encoded_format](img)
+    extension = IMAGE_EXTENSIONS[encoded_format]
+    return data, extension, IMAGE_CONTENT_TYPES[extension]
+
+# Return the content type of a stored image from its key
+def image_content_type(image_key):
+    extension = posixpath.splitext(image_key)[1].lstrip('.').lower()
+    return IMAGE_CONTENT_TYPES.get(extension, 'application/octet-stream')
+
+# Return a download file name with the extension of the stored image, e.g.
+# download_file_name("blobs/<hash>.webp", "image_3") -> "image_3.webp"
+def download_file_name(image_key, base_name):
+    extension = posixpath.splitext(image_key)[1].lower() or '.png'
+    return f"{base_name}{extension}"
@@ -0,0 +1,74 @@
+import time
+import threading
+from collections import OrderedDict
+from config_file import Config
+
+# In-process index of object keys recently written to storage
+#
+# The index is filled from the writes this process makes, and lets
+# save_image_to_s3 skip storage entirely for images it has just stored. Each
+# key is remembered for ttl seconds after it was written. tools.gc_orphans
+# never deletes objects younger than GC_GRACE_HOURS, so as long as ttl stays
+# well below that grace period a known key is one the collector cannot have
+# deleted. Keys found in listings or session bodies are not added: their age
+# is unknown, so the collector may already have deleted them.
+#
+# Keys are kept in the order they were written, so expired keys are swept from
+# the front on every write and the index never holds more than max_entries
+# keys, dropping the oldest first.
+class KnownKeys:
+    def __init__(self, max_entries, ttl, clock=time.monotonic):
+        self._max_entries = max_entries
+        self._ttl = ttl
+        self._clock = clock
+        self._keys = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._keys)
+
+    # Return True if the key was written less than ttl seconds ago
+    def __contains__(self, key):
+        with self._lock:
+            written = self._keys.get(key)
+            if written is None:
+                return False
+            if self._clock() - written > self._ttl:
+                del self._keys[key]
+                return False
+            return True
+
+    # Record keys that were just written to storage
+    def add_many(self, keys):
+        now = self._clock()
+        with self._lock:
+            for key in keys:
+                self._keys[key] = now
+                self._keys.move_to_end(key)
+            while self._keys:
+                key, written = next(iter(self._keys.items()))
+                if now - written <= self._ttl and len(self._keys) <= self._max_entries:
+                    break
+                del self._keys[key]
+
+    # Record a key that was just written to storage
+    def add(self, key):
+        self.add_many([key])
+
+    # Forget keys that were deleted
+    def discard_many(self, keys):
+        with self._lock:
+            for key in keys:
+                self._keys.pop(key, None)
+
+    # Forget every key under a prefix
+    def discard_prefix(self, prefix):
+        with self._lock:
+            for key in [key for key in self._keys if key.startswith(prefix)]:
+                del self._keys[key]
+
+_known_keys = KnownKeys(Config.KNOWN_KEYS_MAX_ENTRIES, Config.KNOWN_KEYS_TTL)
+
+# Return the process-wide index of keys known to exist
+def get_known_keys():
+    return _known_keys
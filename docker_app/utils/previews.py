@@ -0,0 +1,55 @@
+import io
+import posixpath
+from PIL import Image
+from config_file import Config
+from utils.storage import get_storage, ObjectNotFound
+from utils.image_cache import get_image_cache
+
+PREVIEW_EXTENSIONS = {'WEBP': 'webp', 'JPEG': 'jpg'}
+PREVIEW_CONTENT_TYPES = {'WEBP': 'image/webp', 'JPEG': 'image/jpeg'}
+
+# Return the key of the preview belonging to a stored image, e.g.
+# stability_sessions/s1/base_images/<hash>.png ->
+# stability_sessions/s1/base_images/previews/<hash>.webp
+def preview_key(image_key):
+    folder, file_name = posixpath.split(image_key)
+    image_hash = file_name.rsplit('.', 1)[0]
+    return f"{folder}/previews/{image_hash}.{PREVIEW_EXTENSIONS[Config.PREVIEW_FORMAT]}"
+
+# Return True for keys that point to a preview rather than a full image
+def is_preview_key(key):
+    return '/previews/' in key
+
+# Encode a small preview of an image sized for the gallery grid
+def make_preview(img):
+    preview = img.copy()
+    preview.thumbnail((Config.PREVIEW_MAX_SIZE, Config.PREVIEW_MAX_SIZE), Image.LANCZOS)
+    if Config.PREVIEW_FORMAT == 'JPEG' or preview.mode not in ('RGB', 'RGBA'):
+        preview = preview.convert('RGB')
+    preview_byte_arr = io.BytesIO()
+    preview.save(preview_byte_arr, format=Config.PREVIEW_FORMAT, quality=Config.PREVIEW_QUALITY)
+    return preview_byte_arr.getvalue()
+
+# Write the preview of an image to S3 and return its encoded bytes
+def save_preview_to_s3(img, image_key):
+    preview_data = make_preview(img)
+    get_storage().put(preview_key(image_key), preview_data, content_type=PREVIEW_CONTENT_TYPES[Config.PREVIEW_FORMAT])
+    return preview_data
+
+# Return the decoded preview of a stored image. Images saved before previews
+# existed get their preview generated and stored on first display.
+def load_preview(image_key):
+    cache = get_image_cache()
+    try:
+        return cache.get_image(preview_key(image_key))
+    except ObjectNotFound:
+        preview_data = save_preview_to_s3(cache.get_image(image_key), image_key)
+        cache.put_bytes(preview_key(image_key), preview_data)
+        return Image.open(io.BytesIO(preview_data))
+
+# Generate the preview of an image already in S3. Used by the backfill
+# command, which runs it in worker processes.
+def generate_preview(image_key):
+    img_data = get_storage().get(image_key)
+    save_preview_to_s3(Image.open(io.BytesIO(img_data)), image_key)
+    return preview_key(image_key)
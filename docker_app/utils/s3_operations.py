@@ -1,79 +1,345 @@
-import boto3
 import pickle
-import io
+import json
 from config_file import Config
 from PIL import Image
 import numpy as np
 import hashlib
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from utils.bulk_delete import delete_prefix, queue_delete
+from utils.image_cache import get_image_cache
+from utils.previews import preview_key, make_preview, PREVIEW_CONTENT_TYPES
+from utils.session_store import SessionStore, IMAGE_TYPES
+from utils.storage import get_storage, ObjectNotFound
+from utils.write_behind import get_write_behind, read_through_pending
+from utils.known_keys import get_known_keys
+from utils.encoded_image import EncodedImage, pil_image
+from utils.image_codecs import encode_for_storage, image_content_type
+from utils.blob_store import blob_key, is_blob_key, in_blob_store, ref_key, add_reference, release_reference
+from utils.session_format import encode_document, decode_document, encode_session, decode_session, SESSION_FILE, LEGACY_SESSION_FILE
+
+# Presigned URLs by (key, download file name) -> (url, expiry time)
+_presigned_urls = {}
+_presigned_urls_lock = threading.Lock()
+PRESIGNED_URL_CACHE_SIZE = 10000
+
+# S3 prefixes that hold one object per session rather than a single document
+SESSION_KEYS = ['stability_sessions', 'titan_sessions', 'chat_image_editor_sessions']
 
 # Save an image to S3 and return its key
+#
+# img is a PIL image or an EncodedImage, stored in the encoding selected by
+# Config.IMAGE_STORAGE_FORMAT (see utils/image_codecs.py). Images are stored
+# once in the global blob store; key_prefix is the folder the image is saved
+# for and becomes the owner of a reference to the blob.
+# The key is returned as soon as the image and its preview are encoded; the
+# upload itself is made by the write-behind queue. Both are seeded into the
+# image cache, so the image can be displayed right away. Images this process
+# stored recently, or is storing, are not written again. The upload is queued
+# behind the reference marker, so the marker is in storage before the blob is
+# found to exist (see tools.gc_orphans). An EncodedImage that was saved
+# before only gets the new reference.
 def save_image_to_s3(img, key_prefix):
-    s3 = boto3.client('s3')
-    img_byte_arr = io.BytesIO()
-    img.save(img_byte_arr, format='PNG')
-    img_data = img_byte_arr.getvalue()
+    if isinstance(img, EncodedImage) and img.stored_key is not None:
+        add_reference(img.stored_key, key_prefix)
+        return img.stored_key
+    img_data, extension, content_type = encode_for_storage(img)
     img_hash = hashlib.md5(img_data).hexdigest()
-    image_key = f"{key_prefix}/{img_hash}.png"
-    
-    # Check if image already exists, save if it doesn't
-    try:
-        s3.head_object(Bucket=Config.S3_BUCKET_NAME, Key=image_key)
-    except:
-        # Image doesn't exist, so save it
-        s3.put_object(Bucket=Config.S3_BUCKET_NAME, Key=image_key, Body=img_data)
-    
+    image_key = blob_key(img_hash, extension)
+    add_reference(image_key, key_prefix)
+    if isinstance(img, EncodedImage):
+        img.stored_key = image_key
+    if image_key in get_known_keys() or get_write_behind().is_pending(image_key):
+        get_image_cache().put_bytes(image_key, img_data)
+        return image_key
+    image_preview_key = preview_key(image_key)
+    preview_data = make_preview(pil_image(img))
+
+    get_image_cache().put_bytes(image_key, img_data)
+    get_image_cache().put_bytes(image_preview_key, preview_data)
+    get_write_behind().submit(
+        ref_key(image_key, key_prefix),
+        partial(store_image, image_key, img_data, preview_data, content_type),
+        pending={image_key: img_data, image_preview_key: preview_data}
+    )
     return image_key
 
-# Delete an image from S3
-def delete_image_from_s3(image_key):
-    s3 = boto3.client('s3')
-    s3.delete_object(Bucket=Config.S3_BUCKET_NAME, Key=image_key)
+# Save several images to S3 concurrently and return their keys in order.
+# Encoding and preview generation are the slow part and release the GIL.
+def save_images_to_s3(images, key_prefix):
+    images = list(images)
+    if len(images) <= 1:
+        return [save_image_to_s3(img, key_prefix) for img in images]
+    with ThreadPoolExecutor(max_workers=min(len(images), Config.S3_MAX_WORKERS)) as executor:
+        return list(executor.map(lambda img: save_image_to_s3(img, key_prefix), images))
+
+# Upload an image and its preview unless the image already exists. The
+# existence check is a conditional put where the backend supports it, so a
+# new image costs one request instead of a HEAD followed by a PUT. Only images
+# written here are remembered as known: an existing blob may be old enough for
+# the garbage collector to delete, so the next save checks storage again.
+def store_image(image_key, img_data, preview_data, content_type='image/png'):
+    known_keys = get_known_keys()
+    if image_key in known_keys:
+        return
+    storage = get_storage()
+    if storage.put_if_absent(image_key, img_data, content_type=content_type):
+        storage.put(preview_key(image_key), preview_data, content_type=PREVIEW_CONTENT_TYPES[Config.PREVIEW_FORMAT])
+        known_keys.add_many([image_key, preview_key(image_key)])
+
+# Return (folder, image key) pairs for the stored images a session refers
+# to, where folder is the session subfolder the image was saved for
+def session_image_refs(session_data):
+    refs = [(image_type, img) for image_type in IMAGE_TYPES for img in session_data.get(image_type, [])]
+    refs += [('images', entry['content']) for entry in session_data.get('chat_history', []) if entry['type'] == 'image']
+    return [(folder, image_key) for folder, image_key in refs if isinstance(image_key, str)]
+
+# Remove an image from the folder it was saved for. Blobs only lose that
+# folder's reference; images saved before the blob store are deleted. Other
+# blob store keys, such as previews, are shared and left to the collector.
+def release_image(image_key, owner):
+    if is_blob_key(image_key):
+        release_reference(image_key, owner)
+    elif not in_blob_store(image_key):
+        queue_delete(image_key)
+        queue_delete(preview_key(image_key))
+
+# Return a presigned GET URL for an object, or None if the storage backend
+# cannot serve objects to browsers. URLs are cached per key and reused until
+# half of their lifetime has passed, so a rerun does not sign every image
+# again and the browser can keep its cached copy. Objects still waiting in the
+# write-behind queue get None as well, so they are served by the app.
+def get_presigned_url(key, file_name=None):
+    if get_write_behind().is_pending(key):
+        return None
+    cache_key = (key, file_name)
+    now = time.time()
+    with _presigned_urls_lock:
+        cached = _presigned_urls.get(cache_key)
+        if cached is not None and cached[1] - now > Config.PRESIGNED_URL_EXPIRY / 2:
+            return cached[0]
+
+    content_type = image_content_type(key) if file_name is not None else None
+    url = get_storage().presigned_url(key, Config.PRESIGNED_URL_EXPIRY, file_name=file_name, content_type=content_type)
+    if url is None:
+        return None
+
+    with _presigned_urls_lock:
+        if len(_presigned_urls) >= PRESIGNED_URL_CACHE_SIZE:
+            for expired_key in [k for k, v in _presigned_urls.items() if v[1] - now <= Config.PRESIGNED_URL_EXPIRY / 2]:
+                del _presigned_urls[expired_key]
+            if len(_presigned_urls) >= PRESIGNED_URL_CACHE_SIZE:
+                _presigned_urls.clear()
+        _presigned_urls[cache_key] = (url, now + Config.PRESIGNED_URL_EXPIRY)
+    return url
+
+# Return a presigned URL that downloads an object straight from S3. Nothing is
+# fetched by the app; the browser only requests the object when clicked.
+# Returns None for storage backends without presigned URLs.
+def get_download_url(image_key, file_name):
+    return get_presigned_url(image_key, file_name)
 
 # Save data to S3, handling both dictionaries and other data types
+#
+# Session stores are not written immediately: the save is recorded and merged
+# into a single flush_session_stores() call at the end of the script run.
+# Everything else is encoded now and written by the write-behind queue.
 def save_to_s3(data, key):
-    s3 = boto3.client('s3')
-    if isinstance(data, dict):
+    write_behind = get_write_behind()
+    if isinstance(data, SessionStore):
+        data.request_flush()
+    elif isinstance(data, dict):
         for session_name, session_data in data.items():
-            session_key = f"{key}/{session_name}/session_data.pkl"
-            session_data_copy = session_data.copy()
+            write_behind.put(f"{key}/{session_name}/{SESSION_FILE}", serialize_session(session_data, key, session_name))
+    else:
+        write_behind.put(f"{key}.json", encode_document(data))
 
-            for image_type in ['base_images', 'variation_images', 'editing_images']:
-                if image_type in session_data_copy:
-                    session_data_copy[image_type] = [img if isinstance(img, str) else save_image_to_s3(img, f"{key}/{session_name}/{image_type}") for img in session_data_copy[image_type]]
+# Encode a session, saving any in-memory images it still holds to S3 first
+def serialize_session(session_data, key, session_name):
+    session_data_copy = session_data.copy()
 
-            pickled_data = pickle.dumps(session_data_copy)
-            s3.put_object(Bucket=Config.S3_BUCKET_NAME, Key=session_key, Body=pickled_data)
-    else:
-        pickled_data = pickle.dumps(data)
-        s3.put_object(Bucket=Config.S3_BUCKET_NAME, Key=key, Body=pickled_data)
+    for image_type in IMAGE_TYPES:
+        if image_type in session_data_copy:
+            session_data_copy[image_type] = [img if isinstance(img, str) else save_image_to_s3(img, f"{key}/{session_name}/{image_type}") for img in session_data_copy[image_type]]
+
+    return encode_session(session_data_copy)
+
+# Write the sessions that changed since they were last persisted, then merge
+# their new summaries into the model's manifest
+#
+# Sessions are serialized here, so later changes in the script run cannot
+# leak into the write, and then persisted by the write-behind queue. A
+# session whose write fails for good is marked dirty again, so the next
+# flush retries it.
+def flush_session_store(store):
+    if not store.flush_requested:
+        return
+    write_behind = get_write_behind()
+    for session_name, session_data in store.loaded_items():
+        serialized = serialize_session(session_data, store.key, session_name)
+        if store.is_dirty(session_name, serialized):
+            legacy = session_name in store.legacy_sessions
+            session_key = f"{store.key}/{session_name}/{SESSION_FILE}"
+            write_behind.submit(
+                session_key,
+                partial(store_session, store.key, session_name, serialized, legacy),
+                pending={session_key: serialized},
+                on_failure=partial(store.mark_dirty, session_name)
+            )
+            store.mark_clean(session_name, serialized)
+            store.update_summary(session_name)
+            store.legacy_sessions.discard(session_name)
+
+    manifest_changes = store.pop_manifest_changes()
+    if manifest_changes:
+        write_behind.submit(f"{store.key}/manifest.json", partial(merge_manifest, store.key, manifest_changes))
+    store.flush_requested = False
+
+# Write one serialized session, removing the pickle it was migrated from
+def store_session(key, session_name, serialized, legacy):
+    storage = get_storage()
+    storage.put(f"{key}/{session_name}/{SESSION_FILE}", serialized)
+    if legacy:
+        storage.delete(f"{key}/{session_name}/{LEGACY_SESSION_FILE}")
 
-# Load data from S3, handling both session data and other data types
+# Apply manifest entry changes, where None removes a session. The manifest is
+# re-read first so sessions written by other browsers are kept. The write is
+# not conditional; an entry lost to a merge from another browser at the same
+# time is restored by the next load_sessions().
+def merge_manifest(key, manifest_changes):
+    manifest = load_manifest(key) or {}
+    for session_name, summary in manifest_changes.items():
+        if summary is None:
+            manifest.pop(session_name, None)
+        else:
+            manifest[session_name] = summary
+    save_manifest(key, manifest)
+
+# Flush every session store that was saved during the current script run
+def flush_session_stores(stores):
+    for store in stores:
+        if isinstance(store, SessionStore):
+            try:
+                flush_session_store(store)
+            except Exception as e:
+                print(f"Failed to save sessions: {store.key}. Error: {str(e)}")
+
+# Load data from S3, handling both session data and other data types.
+# Data saved before the versioned format existed is read from its pickle.
 def load_from_s3(key):
-    s3 = boto3.client('s3')
+    storage = get_storage()
     try:
-        if key in ['stability_sessions', 'titan_sessions', 'chat_image_editor_sessions']:
-            sessions = {}
-            response = s3.list_objects_v2(Bucket=Config.S3_BUCKET_NAME, Prefix=f"{key}/")
-            for obj in response.get('Contents', []):
-                if obj['Key'].endswith('session_data.pkl'):
-                    session_name = obj['Key'].split('/')[1]
-                    session_data = pickle.loads(s3.get_object(Bucket=Config.S3_BUCKET_NAME, Key=obj['Key'])['Body'].read())
-                    sessions[session_name] = session_data
-            return sessions
-        else:
-            response = s3.get_object(Bucket=Config.S3_BUCKET_NAME, Key=key)
-            return pickle.loads(response['Body'].read())
+        if key in SESSION_KEYS:
+            return load_sessions(key)
+        try:
+            return decode_document(read_through_pending(f"{key}.json"))
+        except ObjectNotFound:
+            return pickle.loads(storage.get(key))
     except Exception as e:
         print(f"Error loading from S3: {str(e)}")
         return None
 
+# List the session folders under a model prefix, following every page of the
+# listing. The delimiter groups keys by session folder, so image objects are
+# never returned individually.
+def list_session_names(key):
+    return [folder[len(key) + 1:].rstrip('/') for folder in get_storage().list_prefixes(f"{key}/")]
+
+# Fetch and decode a single session, returning None if it has no session data.
+# Returns the session and whether it was read from a legacy pickle.
+def load_session(key, session_name):
+    storage = get_storage()
+    try:
+        return decode_session(read_through_pending(f"{key}/{session_name}/{SESSION_FILE}")), False
+    except ObjectNotFound:
+        pass
+    try:
+        pickled_data = storage.get(f"{key}/{session_name}/{LEGACY_SESSION_FILE}")
+    except ObjectNotFound:
+        return None
+    return pickle.loads(pickled_data), True
+
+# Session loader used by SessionStore when a session is first opened.
+# Legacy sessions get no serialized form, so the next flush rewrites them in
+# the current format.
+def load_session_body(key, session_name):
+    loaded = load_session(key, session_name)
+    if loaded is None:
+        return None
+    session_data, legacy = loaded
+    serialized = None if legacy else serialize_session(session_data, key, session_name)
+    return session_data, serialized, legacy
+
+# Read the manifest of session summaries for a model, or None if there is none yet
+def load_manifest(key):
+    try:
+        manifest_data = get_storage().get(f"{key}/manifest.json")
+    except ObjectNotFound:
+        return None
+    return json.loads(manifest_data)['sessions']
+
+# Write the manifest of session summaries for a model
+def save_manifest(key, manifest):
+    body = json.dumps({'sessions': manifest}).encode('utf-8')
+    get_storage().put(f"{key}/manifest.json", body, content_type='application/json')
+
+# Load the sessions of a model
+#
+# The manifest and the delimited listing of session folders are read;
+# session bodies are fetched when a session is opened. Manifest merges from
+# two browsers at the same time can lose each other's entries, so sessions
+# the listing has but the manifest lacks are loaded and merged back into it.
+# Buckets written before the manifest existed are indexed once that way,
+# loading every session concurrently. Manifest entries whose folder is not
+# listed yet are kept, as their session may still be on its way to storage.
+def load_sessions(key):
+    loader = partial(load_session_body, key)
+    manifest = load_manifest(key)
+    sessions = SessionStore(key, manifest=manifest, loader=loader)
+    missing = [session_name for session_name in list_session_names(key) if session_name not in sessions]
+    if manifest is not None and not missing:
+        return sessions
+
+    with ThreadPoolExecutor(max_workers=Config.S3_MAX_WORKERS) as executor:
+        loaded = executor.map(lambda session_name: load_session_body(key, session_name), missing)
+        for session_name, session_body in zip(missing, loaded):
+            if session_body is not None:
+                sessions.add_loaded(session_name, *session_body)
+    sessions.pop_manifest_changes()
+    if manifest is None:
+        save_manifest(key, sessions.summaries())
+    else:
+        merge_manifest(key, {session_name: sessions.summary(session_name) for session_name in missing if session_name in sessions})
+    return sessions
+
 # Delete data from S3
+#
+# Removes every object under the key's folder using batched deletes,
+# however many objects the folder holds. Queued writes to the folder are
+# waited for first, so they cannot recreate objects after the delete. When
+# the folder is a session, its references to blobs are released as well.
 def delete_from_s3(key):
-    s3 = boto3.client('s3')
     try:
-        response = s3.list_objects_v2(Bucket=Config.S3_BUCKET_NAME, Prefix=key)
-        for obj in response.get('Contents', []):
-            s3.delete_object(Bucket=Config.S3_BUCKET_NAME, Key=obj['Key'])
-        print(f"Successfully deleted: {key}")
+        prefix = f"{key.rstrip('/')}/"
+        get_write_behind().wait_for_prefix(prefix)
+        release_session_references(key.rstrip('/'))
+        deleted = delete_prefix(prefix)
+        print(f"Successfully deleted: {key} ({deleted} objects)")
     except Exception as e:
-        print(f"Failed to delete: {key}. Error: {str(e)}")
\ No newline at end of file
+        print(f"Failed to delete: {key}. Error: {str(e)}")
+
+# Release the blob references held by a stored session, given its folder
+# such as stability_sessions/<session name>. Other folders are ignored.
+def release_session_references(session_folder):
+    key, _, session_name = session_folder.partition('/')
+    if key not in SESSION_KEYS or not session_name or '/' in session_name:
+        return
+    loaded = load_session(key, session_name)
+    if loaded is None:
+        return
+    session_data, _ = loaded
+    for folder, image_key in set(session_image_refs(session_data)):
+        if is_blob_key(image_key):
+            release_reference(image_key, f"{session_folder}/{folder}")
@@ -0,0 +1,70 @@
+import json
+from config_file import Config
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Versioned JSON format for session data and chat history
+#
+# Documents are stored as compact JSON of the form
+#   {"version": 1, "data": <session or chat history>}
+# optionally compressed with zstd. Compressed documents are recognised by the
+# zstd frame header, so both kinds can be read whatever the current setting.
+# Unlike pickle, reading a document never executes code from the bucket.
+
+FORMAT_VERSION = 1
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+
+SESSION_FILE = "session_data.json"
+LEGACY_SESSION_FILE = "session_data.pkl"
+
+# Raised when a stored document does not match the schema
+class SessionFormatError(ValueError):
+    pass
+
+# Encode session data or chat history as a versioned document
+def encode_document(data):
+    raw = json.dumps({'version': FORMAT_VERSION, 'data': data}, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+    if Config.SESSION_COMPRESSION == "zstd":
+        if zstandard is None:
+            raise RuntimeError("SESSION_COMPRESSION is 'zstd' but the zstandard package is not installed")
+        raw = zstandard.ZstdCompressor(level=Config.SESSION_COMPRESSION_LEVEL).compress(raw)
+    return raw
+
+# Decode a document written by encode_document
+def decode_document(raw):
+    if raw[:4] == ZSTD_MAGIC:
+        if zstandard is None:
+            raise RuntimeError("Found a zstd compressed document but the zstandard package is not installed")
+        raw = zstandard.ZstdDecompressor().decompress(raw)
+    document = json.loads(raw)
+    if not isinstance(document, dict) or 'data' not in document:
+        raise SessionFormatError("Not a session document")
+    if document.get('version') != FORMAT_VERSION:
+        raise SessionFormatError(f"Unsupported session format version: {document.get('version')}")
+    return document['data']
+
+# Check that a session has the shape the pages expect
+def validate_session(session_data):
+    if not isinstance(session_data, dict):
+        raise SessionFormatError("Session must be an object")
+    if not isinstance(session_data.get('timestamp', ''), str):
+        raise SessionFormatError("Session timestamp must be a string")
+    for image_type in ['base_images', 'variation_images', 'editing_images']:
+        images = session_data.get(image_type, [])
+        if not isinstance(images, list) or not all(isinstance(image_key, str) for image_key in images):
+            raise SessionFormatError(f"Session {image_type} must be a list of image keys")
+    for entry in session_data.get('chat_history', []):
+        if not isinstance(entry, dict) or 'type' not in entry or 'content' not in entry:
+            raise SessionFormatError("Session chat history entries need a type and content")
+    return session_data
+
+# Encode a session
+def encode_session(session_data):
+    return encode_document(validate_session(session_data))
+
+# Decode a session
+def decode_session(raw):
+    return validate_session(decode_document(raw))
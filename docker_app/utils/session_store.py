@@ -0,0 +1,132 @@
+import hashlib
+from collections.abc import MutableMapping
+
+# Image lists kept by the Stability and Titan sessions
+IMAGE_TYPES = ['base_images', 'variation_images', 'editing_images']
+
+# Build the compact manifest entry for a session
+def summarize_session(session_data):
+    summary = {
+        'timestamp': session_data.get('timestamp', ''),
+        'step': session_data.get('step'),
+    }
+    for image_type in IMAGE_TYPES:
+        if image_type in session_data:
+            summary[image_type] = len(session_data[image_type])
+    if 'chat_history' in session_data:
+        summary['images'] = sum(1 for entry in session_data['chat_history'] if entry['type'] == 'image')
+    return summary
+
+# Change-tracking container for the sessions of one model
+#
+# Behaves like the plain dict of session name -> session data that the pages
+# used before, but is backed by a manifest of compact per-session summaries.
+# Session bodies are only fetched through the loader when a session is first
+# accessed, so listing and sorting sessions never touches their bodies.
+#
+# The store also remembers a digest of what was last persisted for every
+# loaded session. Saving a store only requests a flush; the flush at the end
+# of the script run then writes just the sessions whose serialized form
+# changed, so several save_to_s3() calls in one run collapse into a single
+# write per mutated session.
+class SessionStore(MutableMapping):
+    def __init__(self, key, sessions=None, manifest=None, loader=None):
+        self.key = key
+        self._sessions = dict(sessions or {})
+        self._manifest = dict(manifest or {})
+        self._loader = loader
+        self._digests = {}
+        self._manifest_changes = {}
+        self.legacy_sessions = set()
+        self.flush_requested = False
+        for session_name, session_data in self._sessions.items():
+            self._manifest.setdefault(session_name, summarize_session(session_data))
+
+    def __getitem__(self, session_name):
+        if session_name in self._sessions:
+            return self._sessions[session_name]
+        if session_name not in self._manifest or self._loader is None:
+            raise KeyError(session_name)
+
+        loaded = self._loader(session_name)
+        if loaded is None:
+            # Listed in the manifest, but the body is gone
+            del self._manifest[session_name]
+            self._manifest_changes[session_name] = None
+            raise KeyError(session_name)
+        self.add_loaded(session_name, *loaded)
+        return self._sessions[session_name]
+
+    def __setitem__(self, session_name, session_data):
+        self._sessions[session_name] = session_data
+        self.update_summary(session_name)
+
+    def __delitem__(self, session_name):
+        if session_name not in self._manifest:
+            raise KeyError(session_name)
+        del self._manifest[session_name]
+        self._sessions.pop(session_name, None)
+        self._digests.pop(session_name, None)
+        self._manifest_changes[session_name] = None
+
+    def __contains__(self, session_name):
+        return session_name in self._manifest
+
+    def __iter__(self):
+        return iter(list(self._manifest))
+
+    def __len__(self):
+        return len(self._manifest)
+
+    # Add a session body read from storage. `serialized` is its stored form,
+    # or None if it must be rewritten on the next flush; `legacy` marks
+    # sessions read from an old-format object that the flush should remove.
+    def add_loaded(self, session_name, session_data, serialized, legacy=False):
+        self._sessions[session_name] = session_data
+        self._manifest.setdefault(session_name, summarize_session(session_data))
+        if serialized is not None:
+            self.mark_clean(session_name, serialized)
+        if legacy:
+            self.legacy_sessions.add(session_name)
+
+    # Return the manifest entry of a session without loading its body
+    def summary(self, session_name):
+        return self._manifest[session_name]
+
+    # Return the manifest entries of all sessions
+    def summaries(self):
+        return dict(self._manifest)
+
+    # Return the sessions whose bodies have been loaded or created in memory
+    def loaded_items(self):
+        return list(self._sessions.items())
+
+    # Refresh the manifest entry of a loaded session
+    def update_summary(self, session_name):
+        summary = summarize_session(self._sessions[session_name])
+        if self._manifest.get(session_name) != summary:
+            self._manifest[session_name] = summary
+            self._manifest_changes[session_name] = summary
+
+    # Return and clear the manifest entries changed since the last call.
+    # Removed sessions map to None.
+    def pop_manifest_changes(self):
+        changes = self._manifest_changes
+        self._manifest_changes = {}
+        return changes
+
+    # Ask for the store to be persisted at the end of the current script run
+    def request_flush(self):
+        self.flush_requested = True
+
+    # Return True if the serialized session differs from what was last persisted
+    def is_dirty(self, session_name, serialized):
+        return self._digests.get(session_name) != hashlib.md5(serialized).hexdigest()
+
+    # Record the serialized form of a session as persisted
+    def mark_clean(self, session_name, serialized):
+        self._digests[session_name] = hashlib.md5(serialized).hexdigest()
+
+    # Forget what was persisted for a session, so the next flush writes it
+    def mark_dirty(self, session_name):
+        self._digests.pop(session_name, None)
@@ -0,0 +1,345 @@
+import os
+import time
+import threading
+from abc import ABC, abstractmethod
+from collections import namedtuple
+from datetime import datetime, timezone
+from config_file import Config
+from utils.aws_clients import get_client
+
+# Metadata returned by listings and head()
+ObjectInfo = namedtuple('ObjectInfo', ['key', 'size', 'last_modified'])
+
+# Raised by get() when an object does not exist
+class ObjectNotFound(KeyError):
+    pass
+
+# Object storage interface used by every module that reads or writes session
+# data and images. Keys are '/'-separated paths, as in S3. Backends implement
+# the abstract methods; the others have defaults built on them.
+class Storage(ABC):
+    # Number of keys returned per listing page and accepted by delete_many()
+    PAGE_SIZE = 1000
+
+    # Write an object, replacing any existing one
+    @abstractmethod
+    def put(self, key, data, content_type=None):
+        pass
+
+    # Write an object only if the key does not exist yet. Returns True if it
+    # was written and False if an object was already there. Backends without
+    # a conditional write check with head() first, which is not atomic.
+    def put_if_absent(self, key, data, content_type=None):
+        if self.head(key) is not None:
+            return False
+        self.put(key, data, content_type=content_type)
+        return True
+
+    # Return the bytes of an object, raising ObjectNotFound if it is missing
+    @abstractmethod
+    def get(self, key):
+        pass
+
+    # Return the ObjectInfo of an object, or None if it is missing
+    @abstractmethod
+    def head(self, key):
+        pass
+
+    # Yield the objects under a prefix in pages of up to PAGE_SIZE ObjectInfos
+    @abstractmethod
+    def list_pages(self, prefix):
+        pass
+
+    # Yield the "folders" directly under a prefix, each ending with the delimiter
+    @abstractmethod
+    def list_prefixes(self, prefix, delimiter='/'):
+        pass
+
+    # Delete an object; deleting a missing object is not an error
+    @abstractmethod
+    def delete(self, key):
+        pass
+
+    # Delete up to PAGE_SIZE objects and return the number deleted
+    def delete_many(self, keys):
+        for key in keys:
+            self.delete(key)
+        return len(keys)
+
+    # Return a URL the browser can fetch the object from directly, or None if
+    # the backend cannot serve objects to browsers
+    def presigned_url(self, key, expires_in, file_name=None, content_type=None):
+        return None
+
+    # Yield every object under a prefix
+    def list(self, prefix):
+        for page in self.list_pages(prefix):
+            yield from page
+
+# Amazon S3 storage in the configured bucket
+class S3Storage(Storage):
+    def __init__(self, bucket_name):
+        self.bucket_name = bucket_name
+        self._conditional_puts = None
+
+    def put(self, key, data, content_type=None):
+        s3 = get_client('s3')
+        kwargs = {'ContentType': content_type} if content_type else {}
+        s3.put_object(Bucket=self.bucket_name, Key=key, Body=data, **kwargs)
+
+    # Uses a conditional PutObject (If-None-Match: *) in a single round-trip
+    # when the installed botocore knows the parameter, and falls back to
+    # HEAD + PUT on older versions
+    def put_if_absent(self, key, data, content_type=None):
+        s3 = get_client('s3')
+        if self._conditional_puts is None:
+            input_shape = s3.meta.service_model.operation_model('PutObject').input_shape
+            self._conditional_puts = 'IfNoneMatch' in input_shape.members
+        if not self._conditional_puts:
+            return super().put_if_absent(key, data, content_type=content_type)
+
+        kwargs = {'ContentType': content_type} if content_type else {}
+        try:
+            s3.put_object(Bucket=self.bucket_name, Key=key, Body=data, IfNoneMatch='*', **kwargs)
+        except s3.exceptions.ClientError as e:
+            # 412 when the object exists; 409 when a concurrent conditional
+            # write to the same key won the race
+            if e.response['Error']['Code'] in ('PreconditionFailed', 'ConditionalRequestConflict'):
+                return False
+            raise
+        return True
+
+    def get(self, key):
+        s3 = get_client('s3')
+        try:
+            return s3.get_object(Bucket=self.bucket_name, Key=key)['Body'].read()
+        except s3.exceptions.NoSuchKey:
+            raise ObjectNotFound(key)
+
+    def head(self, key):
+        s3 = get_client('s3')
+        try:
+            response = s3.head_object(Bucket=self.bucket_name, Key=key)
+        except s3.exceptions.ClientError as e:
+            if e.response['Error']['Code'] in ('404', 'NoSuchKey', 'NotFound'):
+                return None
+            raise
+        return ObjectInfo(key, response['ContentLength'], response['LastModified'])
+
+    def list_pages(self, prefix):
+        s3 = get_client('s3')
+        paginator = s3.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket_name, Prefix=prefix):
+            yield [ObjectInfo(obj['Key'], obj['Size'], obj['LastModified']) for obj in page.get('Contents', [])]
+
+    def list_prefixes(self, prefix, delimiter='/'):
+        s3 = get_client('s3')
+        paginator = s3.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket_name, Prefix=prefix, Delimiter=delimiter):
+            for common_prefix in page.get('CommonPrefixes', []):
+                yield common_prefix['Prefix']
+
+    def delete(self, key):
+        s3 = get_client('s3')
+        s3.delete_object(Bucket=self.bucket_name, Key=key)
+
+    def delete_many(self, keys):
+        s3 = get_client('s3')
+        response = s3.delete_objects(
+            Bucket=self.bucket_name,
+            Delete={'Objects': [{'Key': key} for key in keys], 'Quiet': True}
+        )
+        errors = response.get('Errors', [])
+        for error in errors:
+            print(f"Failed to delete: {error['Key']}. Error: {error['Code']} - {error['Message']}")
+        return len(keys) - len(errors)
+
+    def presigned_url(self, key, expires_in, file_name=None, content_type=None):
+        s3 = get_client('s3')
+        params = {'Bucket': self.bucket_name, 'Key': key}
+        if file_name is not None:
+            params['ResponseContentDisposition'] = f'attachment; filename="{file_name}"'
+        if content_type is not None:
+            params['ResponseContentType'] = content_type
+        return s3.generate_presigned_url('get_object', Params=params, ExpiresIn=expires_in)
+
+# Storage in a local directory, one file per object
+class FileSystemStorage(Storage):
+    def __init__(self, root):
+        self.root = root
+
+    def _path(self, key):
+        return os.path.join(self.root, *key.split('/'))
+
+    def put(self, key, data, content_type=None):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    # The object is created with a hard link, which fails atomically if the
+    # file already exists
+    def put_if_absent(self, key, data, content_type=None):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        try:
+            os.link(tmp_path, path)
+        except FileExistsError:
+            return False
+        finally:
+            os.remove(tmp_path)
+        return True
+
+    def get(self, key):
+        try:
+            with open(self._path(key), 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            raise ObjectNotFound(key)
+
+    def head(self, key):
+        try:
+            stat = os.stat(self._path(key))
+        except FileNotFoundError:
+            return None
+        return ObjectInfo(key, stat.st_size, datetime.fromtimestamp(stat.st_mtime, timezone.utc))
+
+    def list_pages(self, prefix):
+        page = []
+        for key in sorted(self._walk()):
+            if key.startswith(prefix):
+                info = self.head(key)
+                if info is not None:
+                    page.append(info)
+                if len(page) == self.PAGE_SIZE:
+                    yield page
+                    page = []
+        if page:
+            yield page
+
+    def list_prefixes(self, prefix, delimiter='/'):
+        seen = set()
+        for key in sorted(self._walk()):
+            if key.startswith(prefix) and delimiter in key[len(prefix):]:
+                folder = key[:key.index(delimiter, len(prefix)) + len(delimiter)]
+                if folder not in seen:
+                    seen.add(folder)
+                    yield folder
+
+    def delete(self, key):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def _walk(self):
+        for dirpath, _, file_names in os.walk(self.root):
+            for file_name in file_names:
+                if not file_name.endswith('.tmp'):
+                    path = os.path.relpath(os.path.join(dirpath, file_name), self.root)
+                    yield path.replace(os.sep, '/')
+
+# In-process storage for offline profiling and load tests. Every request
+# sleeps for `latency` seconds to stand in for a network round-trip.
+class MemoryStorage(Storage):
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self._objects = {}
+        self._lock = threading.Lock()
+
+    def _round_trip(self):
+        if self.latency > 0:
+            time.sleep(self.latency)
+
+    def put(self, key, data, content_type=None):
+        self._round_trip()
+        with self._lock:
+            self._objects[key] = (bytes(data), datetime.now(timezone.utc))
+
+    def put_if_absent(self, key, data, content_type=None):
+        self._round_trip()
+        with self._lock:
+            if key in self._objects:
+                return False
+            self._objects[key] = (bytes(data), datetime.now(timezone.utc))
+        return True
+
+    def get(self, key):
+        self._round_trip()
+        with self._lock:
+            if key not in self._objects:
+                raise ObjectNotFound(key)
+            return self._objects[key][0]
+
+    def head(self, key):
+        self._round_trip()
+        with self._lock:
+            if key not in self._objects:
+                return None
+            data, last_modified = self._objects[key]
+        return ObjectInfo(key, len(data), last_modified)
+
+    def list_pages(self, prefix):
+        with self._lock:
+            infos = [ObjectInfo(key, len(data), last_modified) for key, (data, last_modified) in sorted(self._objects.items()) if key.startswith(prefix)]
+        for i in range(0, len(infos), self.PAGE_SIZE):
+            self._round_trip()
+            yield infos[i:i + self.PAGE_SIZE]
+
+    def list_prefixes(self, prefix, delimiter='/'):
+        self._round_trip()
+        with self._lock:
+            keys = sorted(self._objects)
+        seen = set()
+        for key in keys:
+            if key.startswith(prefix) and delimiter in key[len(prefix):]:
+                folder = key[:key.index(delimiter, len(prefix)) + len(delimiter)]
+                if folder not in seen:
+                    seen.add(folder)
+                    yield folder
+
+    def delete(self, key):
+        self._round_trip()
+        with self._lock:
+            self._objects.pop(key, None)
+
+    def delete_many(self, keys):
+        self._round_trip()
+        with self._lock:
+            for key in keys:
+                self._objects.pop(key, None)
+        return len(keys)
+
+_storage = None
+_storage_lock = threading.Lock()
+
+# Create the storage backend selected by Config.STORAGE_BACKEND
+def create_storage(backend):
+    if backend == "s3":
+        return S3Storage(Config.S3_BUCKET_NAME)
+    if backend == "filesystem":
+        return FileSystemStorage(Config.STORAGE_ROOT)
+    if backend == "memory":
+        return MemoryStorage(latency=Config.STORAGE_LATENCY)
+    raise ValueError(f"Unknown storage backend: {backend}")
+
+# Return the process-wide storage backend
+def get_storage():
+    global _storage
+    if _storage is None:
+        with _storage_lock:
+            if _storage is None:
+                _storage = create_storage(Config.STORAGE_BACKEND)
+    return _storage
+
+# Replace the process-wide storage backend, e.g. with a MemoryStorage in a
+# benchmark or load test
+def set_storage(storage):
+    global _storage
+    with _storage_lock:
+        _storage = storage
@@ -0,0 +1,159 @@
+import time
+import zlib
+import queue
+import atexit
+import threading
+from config_file import Config
+from utils.storage import get_storage
+
+# Run a write, retrying failures with exponential backoff. If the write still
+# fails after `retries` retries, the error is printed and on_failure called.
+def call_with_retries(order_key, fn, on_failure, retries, backoff):
+    for attempt in range(retries + 1):
+        try:
+            fn()
+            return
+        except Exception as e:
+            if attempt == retries:
+                print(f"Write failed after {attempt + 1} attempts: {order_key}. Error: {str(e)}")
+                if on_failure is not None:
+                    on_failure()
+                return
+            time.sleep(backoff * 2 ** attempt)
+
+# Background persister for images and sessions
+#
+# Writes are handed to a small pool of worker threads so the script run that
+# produced them can render its result straight away. Work is routed to a
+# worker by its order key, so writes to the same object are always applied
+# in the order they were submitted. Each worker has a bounded queue; when it
+# is full, submit() blocks, which keeps memory bounded if storage falls
+# behind. Failed writes are retried with exponential backoff, and the queues
+# are drained when the process exits.
+#
+# The bytes of every queued write stay readable through pending_bytes() until
+# the write has landed, so anything the current session wrote can be read
+# back before it reaches storage.
+class WriteBehindQueue:
+    def __init__(self, workers, max_pending, retries, backoff):
+        self._queues = [queue.Queue(maxsize=max(1, max_pending // workers)) for _ in range(workers)]
+        self._retries = retries
+        self._backoff = backoff
+        self._pending = {}
+        self._pending_changed = threading.Condition()
+        self._threads = []
+        self._lock = threading.Lock()
+
+    # Queue fn to run in the background. `pending` maps the keys fn writes to
+    # their bytes; on_failure is called if fn still fails after every retry.
+    def submit(self, order_key, fn, pending=None, on_failure=None):
+        pending = pending or {}
+        self._start()
+        with self._pending_changed:
+            for key, data in pending.items():
+                count = self._pending[key][1] if key in self._pending else 0
+                self._pending[key] = (data, count + 1)
+        worker_queue = self._queues[zlib.crc32(order_key.encode('utf-8')) % len(self._queues)]
+        worker_queue.put((order_key, fn, list(pending), on_failure))
+
+    # Queue a write of one object
+    def put(self, key, data, content_type=None, on_failure=None):
+        self.submit(key, lambda: get_storage().put(key, data, content_type=content_type), {key: data}, on_failure)
+
+    # Return the bytes of a queued write that has not landed yet, or None
+    def pending_bytes(self, key):
+        with self._pending_changed:
+            entry = self._pending.get(key)
+        return entry[0] if entry is not None else None
+
+    # Return True while a write to the key is queued or in flight
+    def is_pending(self, key):
+        with self._pending_changed:
+            return key in self._pending
+
+    # Block until no write to a key under the prefix is queued or in flight
+    def wait_for_prefix(self, prefix):
+        with self._pending_changed:
+            self._pending_changed.wait_for(lambda: not any(key.startswith(prefix) for key in self._pending))
+
+    # Block until every queued write has been processed
+    def flush(self):
+        for worker_queue in self._queues:
+            worker_queue.join()
+
+    def _start(self):
+        with self._lock:
+            if not self._threads:
+                for index, worker_queue in enumerate(self._queues):
+                    thread = threading.Thread(target=self._run, args=(worker_queue,), name=f"write-behind-{index}", daemon=True)
+                    thread.start()
+                    self._threads.append(thread)
+                atexit.register(self.flush)
+
+    def _run(self, worker_queue):
+        while True:
+            order_key, fn, keys, on_failure = worker_queue.get()
+            try:
+                call_with_retries(order_key, fn, on_failure, self._retries, self._backoff)
+            finally:
+                with self._pending_changed:
+                    for key in keys:
+                        data, count = self._pending[key]
+                        if count > 1:
+                            self._pending[key] = (data, count - 1)
+                        else:
+                            del self._pending[key]
+                    self._pending_changed.notify_all()
+                worker_queue.task_done()
+
+# Runs every write in the calling thread. Used when WRITE_BEHIND is off.
+# Failures are retried and reported exactly as by WriteBehindQueue.
+class SynchronousWrites:
+    def __init__(self, retries, backoff):
+        self._retries = retries
+        self._backoff = backoff
+
+    def submit(self, order_key, fn, pending=None, on_failure=None):
+        call_with_retries(order_key, fn, on_failure, self._retries, self._backoff)
+
+    def put(self, key, data, content_type=None, on_failure=None):
+        self.submit(key, lambda: get_storage().put(key, data, content_type=content_type), on_failure=on_failure)
+
+    def pending_bytes(self, key):
+        return None
+
+    def is_pending(self, key):
+        return False
+
+    def wait_for_prefix(self, prefix):
+        pass
+
+    def flush(self):
+        pass
+
+_write_behind = None
+_write_behind_lock = threading.Lock()
+
+# Return the process-wide write-behind queue
+def get_write_behind():
+    global _write_behind
+    if _write_behind is None:
+        with _write_behind_lock:
+            if _write_behind is None:
+                if Config.WRITE_BEHIND:
+                    _write_behind = WriteBehindQueue(
+                        workers=Config.WRITE_BEHIND_WORKERS,
+                        max_pending=Config.WRITE_BEHIND_MAX_PENDING,
+                        retries=Config.WRITE_BEHIND_RETRIES,
+                        backoff=Config.WRITE_BEHIND_BACKOFF
+                    )
+                else:
+                    _write_behind = SynchronousWrites(retries=Config.WRITE_BEHIND_RETRIES, backoff=Config.WRITE_BEHIND_BACKOFF)
+    return _write_behind
+
+# Read an object, seeing writes that are still queued
+def read_through_pending(key):
+    data = get_write_behind().pending_bytes(key)
+    if data is not None:
+        return data
+    return get_storage().get(key)
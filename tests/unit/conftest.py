@@ -0,0 +1,42 @@
+import os
+import sys
+import pytest
+
+# The app imports its modules relative to docker_app, as when it is run there
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'docker_app'))
+
+from config_file import Config
+from utils import storage as storage_module
+from utils import known_keys as known_keys_module
+from utils import write_behind as write_behind_module
+from utils import image_cache as image_cache_module
+from utils.storage import MemoryStorage
+from utils.known_keys import KnownKeys
+from utils.write_behind import SynchronousWrites
+from utils.image_cache import ImageCache, fetch_from_storage
+
+# Clock that only moves when a test advances it
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+# Give every test its own in-memory storage and fresh process-wide state.
+# Writes are made synchronously unless a test installs a WriteBehindQueue.
+@pytest.fixture(autouse=True)
+def storage(monkeypatch, tmp_path, clock):
+    memory_storage = MemoryStorage()
+    monkeypatch.setattr(storage_module, '_storage', memory_storage)
+    monkeypatch.setattr(known_keys_module, '_known_keys', KnownKeys(Config.KNOWN_KEYS_MAX_ENTRIES, Config.KNOWN_KEYS_TTL, clock=clock))
+    monkeypatch.setattr(write_behind_module, '_write_behind', SynchronousWrites(retries=0, backoff=0))
+    monkeypatch.setattr(image_cache_module, '_image_cache', ImageCache(fetch_from_storage, 64 * 1024 * 1024, 0, str(tmp_path)))
+    return memory_storage
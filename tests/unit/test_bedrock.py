@@ -0,0 +1,263 @@
+import io
+import json
+import time
+import types
+import threading
+import pytest
+from botocore.exceptions import ClientError, ConnectTimeoutError, ReadTimeoutError
+from config_file import Config
+from models import bedrock
+from models.bedrock import AdaptiveBackoff, BedrockInvoker, BedrockInvocationError, SingleFlight
+from models.stability import StabilityModel
+from models.titan import TitanModel
+from models.chat_image_editor import ChatImageEditor
+from models.claude_chatbot import ClaudeChatbot
+from models.claude_prompt_checker import ClaudePromptChecker
+
+MODEL_ID = "stability.stable-diffusion-xl-v1"
+
+def client_error(code):
+    return ClientError({'Error': {'Code': code, 'Message': f"{code} message"}}, 'InvokeModel')
+
+# bedrock-runtime client that answers each call with the next outcome, an
+# exception to raise or a response body
+class FakeClient:
+    def __init__(self, outcomes):
+        self.outcomes = list(outcomes)
+        self.calls = []
+
+    def invoke_model(self, modelId, body, contentType=None, accept=None):
+        self.calls.append(json.loads(body))
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return {'body': io.BytesIO(json.dumps(outcome).encode('utf-8'))}
+
+# Build invokers on fake clients, with no backoff delays, and record the
+# options every client was created with
+@pytest.fixture
+def clients(monkeypatch):
+    monkeypatch.setattr(Config, 'BEDROCK_RETRY_BASE_DELAY', 0)
+    monkeypatch.setattr(Config, 'BEDROCK_RETRY_MAX_DELAY', 0)
+    monkeypatch.setattr(Config, 'BEDROCK_MAX_ATTEMPTS', 4)
+    monkeypatch.setattr(bedrock, '_backoffs', {})
+    created = []
+    def get_client(service_name, region_name=None, **config_options):
+        created.append(dict(config_options, service_name=service_name))
+        return None
+    monkeypatch.setattr(bedrock, 'get_client', get_client)
+    return created
+
+def invoker(outcomes, model_id=MODEL_ID):
+    bedrock_invoker = BedrockInvoker(model_id)
+    bedrock_invoker.client = FakeClient(outcomes)
+    return bedrock_invoker
+
+def test_throttled_request_is_retried(clients):
+    bedrock_invoker = invoker([client_error('ThrottlingException'), client_error('ThrottlingException'), {'artifacts': []}])
+
+    result = bedrock_invoker.invoke({'seed': 1})
+
+    assert result.body == {'artifacts': []}
+    assert result.attempts == 3
+    assert len(bedrock_invoker.client.calls) == 3
+
+def test_throttling_fails_after_max_attempts(clients):
+    bedrock_invoker = invoker([client_error('ThrottlingException')] * 4)
+
+    with pytest.raises(BedrockInvocationError) as raised:
+        bedrock_invoker.invoke({'seed': 1})
+
+    assert raised.value.code == 'ThrottlingException'
+    assert raised.value.attempts == 4
+    assert len(bedrock_invoker.client.calls) == 4
+
+def test_validation_error_is_not_retried(clients):
+    bedrock_invoker = invoker([client_error('ValidationException')])
+
+    with pytest.raises(BedrockInvocationError) as raised:
+        bedrock_invoker.invoke({'seed': 1})
+
+    assert raised.value.code == 'ValidationException'
+    assert not raised.value.retryable
+    assert len(bedrock_invoker.client.calls) == 1
+
+def test_connect_timeout_is_retried(clients):
+    bedrock_invoker = invoker([ConnectTimeoutError(endpoint_url='https://bedrock'), {'completion': 'hi'}])
+
+    assert bedrock_invoker.invoke({'prompt': 'hello'}).attempts == 2
+
+def test_read_timeout_is_not_retried(clients):
+    # The model may already be working on the request, so it is not resent
+    bedrock_invoker = invoker([ReadTimeoutError(endpoint_url='https://bedrock'), {'completion': 'hi'}])
+
+    with pytest.raises(BedrockInvocationError) as raised:
+        bedrock_invoker.invoke({'prompt': 'hello'})
+
+    assert raised.value.code == 'ReadTimeoutError'
+    assert len(bedrock_invoker.client.calls) == 1
+
+def test_clients_use_the_configured_timeouts(clients, monkeypatch):
+    monkeypatch.setattr(Config, 'BEDROCK_TIMEOUTS', {MODEL_ID: (3, 90)})
+    monkeypatch.setattr(Config, 'BEDROCK_DEFAULT_TIMEOUTS', (2, 30))
+
+    BedrockInvoker(MODEL_ID)
+    BedrockInvoker("anthropic.claude-v2")
+
+    assert [(options['connect_timeout'], options['read_timeout']) for options in clients] == [(3, 90), (2, 30)]
+    assert all(options['retries']['total_max_attempts'] == 1 for options in clients)
+
+def test_throttling_slows_down_later_requests(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(bedrock.time, 'sleep', sleeps.append)
+    backoff = AdaptiveBackoff(base_delay=1, max_delay=4)
+
+    backoff.wait()
+    assert sleeps == []
+
+    for _ in range(5):
+        backoff.throttled()
+    backoff.wait()
+    assert 2 <= sleeps[-1] <= 4
+
+    # Every success halves the penalty until it drops below the base delay
+    for _ in range(4):
+        backoff.succeeded()
+    backoff.wait()
+    assert len(sleeps) == 1
+
+def test_retry_delay_is_capped():
+    backoff = AdaptiveBackoff(base_delay=0.5, max_delay=2)
+    for attempt in range(1, 10):
+        assert 0 <= backoff.retry_delay(attempt) <= min(2, 0.5 * 2 ** attempt)
+
+# Run fn in n threads and return the threads
+def start_threads(n, fn):
+    threads = [threading.Thread(target=fn) for _ in range(n)]
+    for thread in threads:
+        thread.start()
+    return threads
+
+# Wait until the single-flight group has seen `calls` calls
+def wait_for_calls(single_flight, calls):
+    deadline = time.monotonic() + 5
+    while single_flight.stats()['calls'] < calls and time.monotonic() < deadline:
+        time.sleep(0.001)
+
+def test_identical_calls_in_flight_run_once():
+    single_flight = SingleFlight()
+    release = threading.Event()
+    executions = []
+    results = []
+    def call():
+        executions.append(1)
+        release.wait()
+        return {'artifacts': ['image']}
+
+    threads = start_threads(5, lambda: results.append(single_flight.do('key', call)))
+    wait_for_calls(single_flight, 5)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert len(executions) == 1
+    assert results == [{'artifacts': ['image']}] * 5
+    assert single_flight.stats() == {'calls': 5, 'executions': 1, 'coalesced': 4, 'in_flight': 0}
+
+def test_error_reaches_every_caller():
+    single_flight = SingleFlight()
+    release = threading.Event()
+    errors = []
+    def call():
+        release.wait()
+        raise BedrockInvocationError(MODEL_ID, 'ThrottlingException', 'Too many requests', 6)
+    def caller():
+        try:
+            single_flight.do('key', call)
+        except BedrockInvocationError as e:
+            errors.append(e.code)
+
+    threads = start_threads(3, caller)
+    wait_for_calls(single_flight, 3)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert errors == ['ThrottlingException'] * 3
+    assert single_flight.stats()['executions'] == 1
+
+def test_finished_and_different_calls_are_not_coalesced():
+    single_flight = SingleFlight()
+
+    assert single_flight.do('a', lambda: 1) == 1
+    assert single_flight.do('a', lambda: 2) == 2
+    assert single_flight.do('b', lambda: 3) == 3
+    assert single_flight.stats()['coalesced'] == 0
+
+# bedrock-runtime client whose calls block until released
+class BlockingClient:
+    def __init__(self):
+        self.release = threading.Event()
+        self.calls = 0
+
+    def invoke_model(self, modelId, body, contentType=None, accept=None):
+        self.calls += 1
+        self.release.wait()
+        return {'body': io.BytesIO(b'{"artifacts": []}')}
+
+@pytest.mark.parametrize('coalesce, expected_calls', [(True, 1), (False, 3)])
+def test_invoker_coalesces_identical_requests(clients, monkeypatch, coalesce, expected_calls):
+    single_flight = SingleFlight()
+    monkeypatch.setattr(bedrock, '_single_flight', single_flight)
+    bedrock_invoker = BedrockInvoker(MODEL_ID)
+    bedrock_invoker.client = BlockingClient()
+    body = {'text_prompts': [{'text': 'a lighthouse'}], 'seed': 42}
+
+    threads = start_threads(3, lambda: bedrock_invoker.invoke(dict(body), coalesce=coalesce))
+    deadline = time.monotonic() + 5
+    while bedrock_invoker.client.calls < expected_calls and time.monotonic() < deadline:
+        time.sleep(0.001)
+    if coalesce:
+        wait_for_calls(single_flight, 3)
+    bedrock_invoker.client.release.set()
+    for thread in threads:
+        thread.join()
+
+    assert bedrock_invoker.client.calls == expected_calls
+
+def model(model_class, outcomes):
+    instance = model_class(types.SimpleNamespace(meta=types.SimpleNamespace(region_name="us-east-1")), None, None)
+    instance.invoker.client = FakeClient(outcomes)
+    return instance
+
+@pytest.mark.parametrize('model_class, call', [
+    (StabilityModel, lambda m: m.invoke_text_to_image("a lighthouse", "", 1024, 1024, None, "NONE", 0, 7, 30, None)),
+    (TitanModel, lambda m: m.invoke_titan_text_to_image("a lighthouse", "", 1, 1024, 1024, 0, 8.0)),
+    (ChatImageEditor, lambda m: m.generate_image("a lighthouse")),
+    (ClaudeChatbot, lambda m: m.get_chatbot_response("hello", [], "answer_questions")),
+    (ClaudePromptChecker, lambda m: m.check_prompt("a lighthouse")),
+])
+def test_models_raise_invocation_errors(clients, model_class, call):
+    with pytest.raises(BedrockInvocationError) as raised:
+        call(model(model_class, [client_error('ValidationException')]))
+
+    assert raised.value.code == 'ValidationException'
+    assert raised.value.user_message == "The model request failed: ValidationException message"
+
+def test_retryable_error_asks_to_try_again():
+    assert "try again" in BedrockInvocationError(MODEL_ID, 'ThrottlingException', 'Too many requests', 6).user_message
+
+def test_chat_editor_coalesces_repeated_clicks(clients, monkeypatch):
+    single_flight = SingleFlight()
+    monkeypatch.setattr(bedrock, '_single_flight', single_flight)
+    editor = model(ChatImageEditor, [])
+    editor.invoker.client = BlockingClient()
+
+    threads = start_threads(3, lambda: editor.generate_image("a lighthouse"))
+    wait_for_calls(single_flight, 3)
+    editor.invoker.client.release.set()
+    for thread in threads:
+        thread.join()
+
+    assert editor.invoker.client.calls == 1
+    assert single_flight.stats()['coalesced'] == 2
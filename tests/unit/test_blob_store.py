@@ -0,0 +1,89 @@
+import pytest
+from PIL import Image
+from utils import bulk_delete
+from utils.blob_store import is_blob_key, list_references, ref_key
+from utils.previews import preview_key
+from utils.s3_operations import save_image_to_s3, save_to_s3, release_image, delete_from_s3, session_image_refs
+
+def make_image(color):
+    return Image.new('RGB', (8, 8), color)
+
+def test_image_is_stored_once_with_a_reference_per_owner(storage):
+    first = save_image_to_s3(make_image('red'), 'stability_sessions/s1/base_images')
+    second = save_image_to_s3(make_image('red'), 'titan_sessions/s2/variation_images')
+
+    assert first == second
+    assert is_blob_key(first)
+    assert sorted(list_references(first)) == ['stability_sessions/s1/base_images', 'titan_sessions/s2/variation_images']
+    assert len([obj for obj in storage.list('blobs/') if is_blob_key(obj.key)]) == 1
+
+def test_release_drops_only_that_owners_reference(storage):
+    image_key = save_image_to_s3(make_image('red'), 'stability_sessions/s1/base_images')
+    save_image_to_s3(make_image('red'), 'stability_sessions/s2/base_images')
+
+    release_image(image_key, 'stability_sessions/s1/base_images')
+
+    assert list_references(image_key) == ['stability_sessions/s2/base_images']
+    assert storage.head(image_key) is not None
+
+def test_releasing_the_last_reference_leaves_the_blob(storage):
+    image_key = save_image_to_s3(make_image('red'), 'stability_sessions/s1/base_images')
+
+    release_image(image_key, 'stability_sessions/s1/base_images')
+
+    assert list_references(image_key) == []
+    assert storage.head(image_key) is not None
+
+def test_reference_can_be_added_again_after_release(storage):
+    image_key = save_image_to_s3(make_image('red'), 'stability_sessions/s1/base_images')
+    release_image(image_key, 'stability_sessions/s1/base_images')
+
+    save_image_to_s3(make_image('red'), 'stability_sessions/s1/base_images')
+
+    assert storage.head(ref_key(image_key, 'stability_sessions/s1/base_images')) is not None
+
+def test_deleting_a_session_releases_its_references(storage):
+    kept = save_image_to_s3(make_image('red'), 'stability_sessions/s1/base_images')
+    released = save_image_to_s3(make_image('blue'), 'stability_sessions/s2/base_images')
+    save_to_s3({'s2': {'timestamp': '2024-01-01', 'base_images': [released]}}, 'stability_sessions')
+
+    delete_from_s3('stability_sessions/s2')
+
+    assert list_references(kept) == ['stability_sessions/s1/base_images']
+    assert list_references(released) == []
+    assert list(storage.list('stability_sessions/s2/')) == []
+
+def test_legacy_image_is_deleted_on_release(storage):
+    storage.put('stability_sessions/s1/base_images/abc.png', b'image')
+
+    release_image('stability_sessions/s1/base_images/abc.png', 'stability_sessions/s1/base_images')
+    bulk_delete._delete_queue.join()
+
+    assert storage.head('stability_sessions/s1/base_images/abc.png') is None
+
+def test_session_image_refs_include_chat_images():
+    session_data = {
+        'base_images': ['blobs/a.png'],
+        'editing_images': ['blobs/b.png'],
+        'chat_history': [{'type': 'user', 'content': 'a lighthouse'}, {'type': 'image', 'content': 'blobs/c.png'}],
+    }
+    assert session_image_refs(session_data) == [('base_images', 'blobs/a.png'), ('editing_images', 'blobs/b.png'), ('images', 'blobs/c.png')]
+
+def test_previews_and_markers_are_not_blobs():
+    assert is_blob_key('blobs/abc.png')
+    assert not is_blob_key('blobs/previews/abc.webp')
+    assert not is_blob_key('blobs/refs/abc/stability_sessions/s1/base_images')
+    assert not is_blob_key('stability_sessions/s1/base_images/abc.png')
+
+def test_previews_cannot_be_referenced():
+    with pytest.raises(ValueError):
+        ref_key('blobs/previews/abc.webp', 'stability_sessions/s1/base_images')
+
+def test_releasing_a_blob_preview_deletes_nothing(storage):
+    image_key = save_image_to_s3(make_image('red'), 'stability_sessions/s1/base_images')
+
+    release_image(preview_key(image_key), 'stability_sessions/s1/base_images')
+    bulk_delete._delete_queue.join()
+
+    assert storage.head(preview_key(image_key)) is not None
+    assert list_references(image_key) == ['stability_sessions/s1/base_images']
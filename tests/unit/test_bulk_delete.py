@@ -0,0 +1,108 @@
+import pytest
+from utils import storage as storage_module
+from utils.bulk_delete import DeleteQueue, delete_keys, delete_prefix, DELETE_BATCH_SIZE
+from utils.known_keys import get_known_keys
+from utils.storage import S3Storage
+
+# Record the size of every delete_many request
+@pytest.fixture
+def batches(storage, monkeypatch):
+    sizes = []
+    delete_many = storage.delete_many
+    def recording_delete_many(keys):
+        sizes.append(len(keys))
+        return delete_many(keys)
+    monkeypatch.setattr(storage, 'delete_many', recording_delete_many)
+    return sizes
+
+def put_objects(storage, prefix, count):
+    keys = [f"{prefix}{index:05d}.png" for index in range(count)]
+    for key in keys:
+        storage.put(key, b'x')
+    return keys
+
+def test_keys_are_deleted_in_batches_of_1000(storage, batches):
+    keys = put_objects(storage, 'stability_sessions/s1/base_images/', 2500)
+
+    assert delete_keys(keys) == 2500
+
+    assert sorted(batches) == [500, DELETE_BATCH_SIZE, DELETE_BATCH_SIZE]
+    assert list(storage.list('stability_sessions/')) == []
+
+def test_no_keys_sends_no_request(batches):
+    assert delete_keys([]) == 0
+    assert batches == []
+
+def test_prefix_is_deleted_page_by_page(storage, batches):
+    put_objects(storage, 'stability_sessions/s1/', 2100)
+    kept = put_objects(storage, 'stability_sessions/s10/', 3)
+    get_known_keys().add('stability_sessions/s1/00000.png')
+
+    assert delete_prefix('stability_sessions/s1/') == 2100
+
+    assert max(batches) <= DELETE_BATCH_SIZE
+    assert sum(batches) == 2100
+    assert [obj.key for obj in storage.list('stability_sessions/')] == kept
+    assert 'stability_sessions/s1/00000.png' not in get_known_keys()
+
+# s3 client whose DeleteObjects fails for some keys
+class FakeS3Client:
+    def __init__(self, failing_keys):
+        self.failing_keys = failing_keys
+        self.requests = []
+
+    def delete_objects(self, Bucket, Delete):
+        self.requests.append(Delete)
+        errors = [{'Key': obj['Key'], 'Code': 'AccessDenied', 'Message': 'Access Denied'} for obj in Delete['Objects'] if obj['Key'] in self.failing_keys]
+        return {'Errors': errors} if errors else {}
+
+def test_s3_per_key_errors_are_not_counted(monkeypatch, capsys):
+    client = FakeS3Client({'blobs/b.png'})
+    monkeypatch.setattr(storage_module, 'get_client', lambda service_name: client)
+
+    deleted = S3Storage('bucket').delete_many(['blobs/a.png', 'blobs/b.png', 'blobs/c.png'])
+
+    assert deleted == 2
+    assert len(client.requests) == 1
+    assert client.requests[0]['Quiet'] is True
+    assert "blobs/b.png" in capsys.readouterr().out
+
+def test_failed_keys_lower_the_deleted_count(monkeypatch):
+    monkeypatch.setattr(storage_module, '_storage', S3Storage('bucket'))
+    monkeypatch.setattr(storage_module, 'get_client', lambda service_name: FakeS3Client({'blobs/00001.png', 'blobs/01500.png'}))
+
+    assert delete_keys([f"blobs/{index:05d}.png" for index in range(2000)]) == 1998
+
+def test_queued_deletes_are_drained(storage, batches):
+    keys = put_objects(storage, 'titan_sessions/s1/base_images/', 1500)
+    delete_queue = DeleteQueue()
+
+    for key in keys:
+        delete_queue.put(key)
+    delete_queue.join()
+
+    assert list(storage.list('titan_sessions/')) == []
+    assert sum(batches) == 1500
+    assert max(batches) <= DELETE_BATCH_SIZE
+
+def test_queue_keeps_going_after_a_failed_batch(storage, monkeypatch):
+    delete_many = storage.delete_many
+    failures = []
+    def failing_once(keys):
+        if not failures:
+            failures.append(keys)
+            raise OSError("connection reset")
+        return delete_many(keys)
+    monkeypatch.setattr(storage, 'delete_many', failing_once)
+    delete_queue = DeleteQueue()
+    [first] = put_objects(storage, 'a/', 1)
+    [second] = put_objects(storage, 'b/', 1)
+
+    delete_queue.put(first)
+    delete_queue.join()
+    delete_queue.put(second)
+    delete_queue.join()
+
+    assert failures == [[first]]
+    assert storage.head(first) is not None
+    assert storage.head(second) is None
@@ -0,0 +1,63 @@
+from utils.bm25 import BM25Index, tokenize
+from models.chatbot_knowledge import (
+    KNOWLEDGE_SECTIONS, DEFAULT_SECTION_TITLES, PRINCIPLES, MODEL_INFO,
+    select_sections, select_context, format_section, estimate_tokens,
+)
+
+DOCUMENTS = [
+    "Negative prompts list what should not appear in the image",
+    "The seed makes a generation repeatable",
+    "Titan supports resolutions up to 1408 pixels",
+    "Inpainting edits the masked area of an image, outpainting extends it",
+]
+
+def titles(sections):
+    return [title for _, title, _ in sections]
+
+def test_tokenize_drops_stop_words_and_plurals():
+    assert tokenize("What are the Negative Prompts for my images?") == ['negative', 'prompt', 'image']
+    assert tokenize("glass") == ['glass']
+
+def test_best_match_comes_first():
+    index = BM25Index(DOCUMENTS)
+
+    assert index.search("how do negative prompts work", k=2)[0][0] == 0
+    assert index.search("repeatable seed", k=2)[0][0] == 1
+    assert [doc_id for doc_id, _ in index.search("outpainting", k=4)] == [3]
+
+def test_rare_terms_outweigh_common_ones():
+    index = BM25Index(DOCUMENTS)
+
+    # "image" is in two documents, "masked" in one
+    assert index.search("image masked", k=1)[0][0] == 3
+
+def test_search_returns_at_most_k_matching_documents():
+    index = BM25Index(DOCUMENTS)
+
+    assert len(index.search("image seed titan negative outpainting", k=2)) == 2
+    assert index.search("spaceship", k=3) == []
+    assert BM25Index([]).search("image", k=3) == []
+
+def test_sections_match_the_question():
+    assert 'Feature comparison: Image Resolution' in titles(select_sections("What is the maximum resolution of Titan?", top_k=3))
+    assert 'Prompt engineering principle: Utilize Negative Prompts' in titles(select_sections("How do negative prompts work?", top_k=3))
+
+def test_sections_keep_their_original_order():
+    selected = select_sections("negative prompt seed steps sampler", top_k=6)
+    assert selected == [section for section in KNOWLEDGE_SECTIONS if section in selected]
+
+def test_unmatched_query_gets_default_sections():
+    assert titles(select_sections("yes", top_k=3)) == list(DEFAULT_SECTION_TITLES)
+
+def test_top_k_zero_selects_everything():
+    assert select_sections("anything", top_k=0) == KNOWLEDGE_SECTIONS
+
+def test_context_is_split_by_source_and_smaller_than_everything():
+    principles, model_info = select_context("How do negative prompts work?", top_k=3)
+    everything = select_context("", top_k=0)
+
+    assert 'Utilize Negative Prompts' in principles
+    assert 'Feature comparison: Negative Prompt' in model_info
+    assert estimate_tokens(principles + model_info) < estimate_tokens("".join(everything)) / 4
+    assert all(format_section(section) in everything[0] for section in KNOWLEDGE_SECTIONS if section[0] == PRINCIPLES)
+    assert all(format_section(section) in everything[1] for section in KNOWLEDGE_SECTIONS if section[0] == MODEL_INFO)
@@ -0,0 +1,87 @@
+import types
+import pytest
+from botocore.exceptions import ClientError
+from config_file import Config
+from models import bedrock
+from models.bedrock import BedrockInvocationError, StreamStats
+from models.local_bedrock import LocalBedrockClient, LOCAL_COMPLETION
+from models.claude_chatbot import ClaudeChatbot
+from models.claude_prompt_checker import ClaudePromptChecker
+
+FIRST_TOKEN_DELAY = 0.05
+
+# Requests go to LocalBedrockClient, with a short wait for the first chunk
+@pytest.fixture
+def stream_stats(monkeypatch):
+    monkeypatch.setattr(Config, 'BEDROCK_BACKEND', 'local')
+    monkeypatch.setattr(Config, 'BEDROCK_LOCAL_FIRST_TOKEN_DELAY', FIRST_TOKEN_DELAY)
+    monkeypatch.setattr(Config, 'BEDROCK_LOCAL_CHUNK_DELAY', 0)
+    stats = StreamStats()
+    monkeypatch.setattr(bedrock, '_stream_stats', stats)
+    return stats
+
+def model(model_class):
+    return model_class(types.SimpleNamespace(meta=types.SimpleNamespace(region_name="us-east-1")), None, None)
+
+# The completion LocalBedrockClient sends for max_tokens_to_sample of 800
+def local_completion():
+    return (LOCAL_COMPLETION * (3200 // len(LOCAL_COMPLETION) + 1))[:3200]
+
+# Local client whose stream fails after a few chunks
+class FailingLocalClient(LocalBedrockClient):
+    def _timed_chunks(self, text):
+        chunks = super()._timed_chunks(text)
+        for _ in range(3):
+            yield next(chunks)
+        raise ClientError({'Error': {'Code': 'ModelStreamErrorException', 'Message': 'stream broke'}}, 'InvokeModelWithResponseStream')
+
+def test_prompt_feedback_arrives_in_order(stream_stats):
+    chunks = list(model(ClaudePromptChecker).stream_check_prompt("a lighthouse at dusk"))
+
+    assert len(chunks) == 3200 // 16
+    assert all(len(chunk) == 16 for chunk in chunks)
+    assert "".join(chunks) == local_completion()
+
+def test_chatbot_stream_matches_the_blocking_response(stream_stats):
+    chatbot = model(ClaudeChatbot)
+    history = [{"role": "user", "content": "hello"}, {"role": "assistant", "content": "hi"}]
+
+    streamed = "".join(chatbot.stream_chatbot_response("What is a seed?", history, "answer_questions"))
+
+    assert streamed == local_completion()
+    assert chatbot.get_chatbot_response("What is a seed?", history, "answer_questions") == streamed
+
+def test_time_to_first_token_is_recorded(stream_stats):
+    stream = model(ClaudePromptChecker).invoke_stream("a lighthouse")
+    assert stream.first_token_latency is None
+
+    chunks = iter(stream)
+    next(chunks)
+    assert stream.first_token_latency >= FIRST_TOKEN_DELAY
+    assert stream.latency is None
+    list(chunks)
+
+    assert stream.latency >= stream.first_token_latency
+    stats = stream_stats.stats()
+    assert stats['streams'] == 1
+    assert stats['first_token_mean'] == pytest.approx(stream.first_token_latency)
+    assert stats['first_token_mean'] <= stats['total_mean']
+
+def test_error_in_the_middle_of_a_stream_is_raised(stream_stats):
+    checker = model(ClaudePromptChecker)
+    checker.invoker.client = FailingLocalClient(0, 0)
+    received = []
+
+    with pytest.raises(BedrockInvocationError) as raised:
+        for chunk in checker.stream_check_prompt("a lighthouse"):
+            received.append(chunk)
+
+    assert raised.value.code == 'ModelStreamErrorException'
+    assert "".join(received) == local_completion()[:48]
+    assert stream_stats.stats()['streams'] == 0
+
+def test_local_client_rejects_image_models(stream_stats):
+    with pytest.raises(BedrockInvocationError) as raised:
+        bedrock.BedrockInvoker("amazon.titan-image-generator-v1").invoke({'taskType': 'TEXT_IMAGE'})
+
+    assert raised.value.code == 'ValidationException'
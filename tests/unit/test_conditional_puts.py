@@ -0,0 +1,118 @@
+import threading
+import pytest
+from PIL import Image
+from config_file import Config
+from utils.storage import Storage, MemoryStorage, FileSystemStorage
+from utils.known_keys import KnownKeys, get_known_keys
+from utils.previews import preview_key
+from utils.s3_operations import save_image_to_s3, store_image
+
+@pytest.fixture(params=['memory', 'filesystem'])
+def backend(request, tmp_path):
+    if request.param == 'memory':
+        return MemoryStorage()
+    return FileSystemStorage(str(tmp_path))
+
+def test_put_if_absent_writes_only_new_keys(backend):
+    assert backend.put_if_absent('blobs/a.png', b'first')
+    assert not backend.put_if_absent('blobs/a.png', b'second')
+    assert backend.get('blobs/a.png') == b'first'
+
+def test_concurrent_put_if_absent_has_one_winner(backend):
+    results = []
+    barrier = threading.Barrier(8)
+    def put(index):
+        barrier.wait()
+        results.append(backend.put_if_absent('blobs/a.png', f"writer {index}".encode()))
+
+    threads = [threading.Thread(target=put, args=(index,)) for index in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(results) == [False] * 7 + [True]
+
+def test_image_is_stored_once(storage, clock, monkeypatch):
+    puts = []
+    put_if_absent = storage.put_if_absent
+    def recording_put_if_absent(key, data, content_type=None):
+        puts.append(key)
+        return put_if_absent(key, data, content_type=content_type)
+    monkeypatch.setattr(storage, 'put_if_absent', recording_put_if_absent)
+
+    image = Image.new('RGB', (8, 8), 'red')
+    image_key = save_image_to_s3(image, 'stability_sessions/s1/base_images')
+    assert save_image_to_s3(image, 'stability_sessions/s2/base_images') == image_key
+    assert puts == [image_key]
+
+    # Once the key is forgotten, storage is asked again and answers that the
+    # image is already there
+    clock.advance(Config.KNOWN_KEYS_TTL + 1)
+    save_image_to_s3(image, 'stability_sessions/s3/base_images')
+    assert puts == [image_key, image_key]
+    assert image_key not in get_known_keys()
+
+def test_existing_image_keeps_its_preview(storage):
+    storage.put('blobs/a.png', b'image')
+    storage.put(preview_key('blobs/a.png'), b'preview')
+
+    store_image('blobs/a.png', b'image', b'new preview')
+
+    assert storage.get(preview_key('blobs/a.png')) == b'preview'
+
+def test_known_keys_expire(clock):
+    known_keys = KnownKeys(max_entries=10, ttl=60, clock=clock)
+    known_keys.add('blobs/a.png')
+    clock.advance(60)
+    assert 'blobs/a.png' in known_keys
+    clock.advance(1)
+    assert 'blobs/a.png' not in known_keys
+
+def test_known_keys_drop_the_oldest_keys(clock):
+    known_keys = KnownKeys(max_entries=3, ttl=60, clock=clock)
+    known_keys.add_many(['s1/a.png', 's1/b.png'])
+    known_keys.add('s2/a.png')
+    known_keys.add('s1/a.png')
+    known_keys.add('s3/a.png')
+
+    assert 's1/a.png' in known_keys
+    assert 's1/b.png' not in known_keys
+    assert 's2/a.png' in known_keys
+    assert 's3/a.png' in known_keys
+
+def test_known_keys_stay_bounded_in_one_folder(clock, monkeypatch):
+    monkeypatch.setattr(Config, 'KNOWN_KEYS_MAX_ENTRIES', 100)
+    known_keys = KnownKeys(Config.KNOWN_KEYS_MAX_ENTRIES, Config.KNOWN_KEYS_TTL, clock=clock)
+
+    for index in range(1000):
+        known_keys.add(f"blobs/{index:064x}.png")
+
+    assert len(known_keys) == 100
+    assert f"blobs/{999:064x}.png" in known_keys
+    assert f"blobs/{899:064x}.png" not in known_keys
+
+def test_expired_keys_are_swept_on_write(clock):
+    known_keys = KnownKeys(max_entries=10, ttl=60, clock=clock)
+    known_keys.add_many(['blobs/a.png', 'blobs/b.png'])
+    clock.advance(61)
+
+    known_keys.add('blobs/c.png')
+
+    assert len(known_keys) == 1
+
+def test_known_keys_forget_deleted_prefix(clock):
+    known_keys = KnownKeys(max_entries=10, ttl=60, clock=clock)
+    known_keys.add_many(['stability_sessions/s1/a.png', 'stability_sessions/s10/a.png'])
+    known_keys.discard_prefix('stability_sessions/s1/')
+
+    assert 'stability_sessions/s1/a.png' not in known_keys
+    assert 'stability_sessions/s10/a.png' in known_keys
+
+def test_incomplete_backend_cannot_be_created():
+    class WriteOnlyStorage(Storage):
+        def put(self, key, data, content_type=None):
+            pass
+
+    with pytest.raises(TypeError, match="get"):
+        WriteOnlyStorage()
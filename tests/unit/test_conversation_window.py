@@ -0,0 +1,70 @@
+import random
+import pytest
+from models.chatbot_knowledge import estimate_tokens
+from models.conversation_window import ConversationWindow, format_message, compact_message
+
+# Return a message of up to max_words words
+def random_message(rng, max_words):
+    words = ["prompt", "lighthouse", "seed", "watercolor", "negative", "titan", "sdxl", "composition", "dusk"]
+    return " ".join(rng.choice(words) for _ in range(rng.randint(1, max_words)))
+
+@pytest.mark.parametrize('token_budget, recent_messages, compacted_chars', [(2000, 6, 200), (300, 4, 50), (120, 1, 20), (50, 10, 0)])
+def test_window_never_exceeds_its_budget(token_budget, recent_messages, compacted_chars):
+    rng = random.Random(token_budget)
+    window = ConversationWindow(token_budget, recent_messages, compacted_chars)
+    # Messages up to about half the budget, as the newest one is always kept whole
+    max_words = token_budget * 4 // 2 // 12
+    for turn in range(400):
+        window.append("user" if turn % 2 == 0 else "assistant", random_message(rng, max_words))
+        assert estimate_tokens(window.formatted()) <= token_budget
+        assert window.tokens == estimate_tokens(window.formatted())
+
+def test_short_chat_is_kept_verbatim():
+    messages = [("user", "Draw a lighthouse"), ("assistant", "Try adding the time of day"), ("user", "At dusk")]
+    window = ConversationWindow(2000, 6, 200)
+    for role, content in messages:
+        window.append(role, content)
+
+    assert window.formatted() == "".join(format_message(role, content) for role, content in messages)
+
+def test_older_messages_are_compacted_then_dropped():
+    window = ConversationWindow(token_budget=70, recent_messages=2, compacted_chars=10)
+    for index in range(10):
+        window.append("user", f"message number {index} " + "detail " * 10)
+
+    formatted = window.formatted()
+    assert formatted.startswith("[")
+    assert "earlier messages omitted]" in formatted
+    assert format_message("user", "message number 9 " + "detail " * 10) in formatted
+    assert format_message("user", "message number 8 " + "detail " * 10) in formatted
+    assert format_message("user", compact_message("message number 7 " + "detail " * 10, 10)) in formatted
+    assert "message number 0" not in formatted
+
+def test_newest_message_is_kept_whole_even_over_budget():
+    window = ConversationWindow(token_budget=20, recent_messages=6, compacted_chars=10)
+    window.append("user", "short question")
+    long_answer = "word " * 100
+    window.append("assistant", long_answer)
+
+    assert window.formatted().endswith(format_message("assistant", long_answer))
+    assert "short question" not in window.formatted()
+
+def test_from_messages_matches_appending():
+    messages = [{"role": "user" if index % 2 == 0 else "assistant", "content": f"message {index} " * 20} for index in range(30)]
+    window = ConversationWindow(300, 4, 40)
+    for message in messages:
+        window.append(message["role"], message["content"])
+
+    assert ConversationWindow.from_messages(messages, token_budget=300, recent_messages=4, compacted_chars=40).formatted() == window.formatted()
+
+def test_recent_user_messages():
+    window = ConversationWindow(2000, 3, 200)
+    for index, role in enumerate(["user", "assistant", "user", "assistant", "user"]):
+        window.append(role, f"message {index}")
+
+    assert window.recent_user_messages(2) == ["message 2", "message 4"]
+    assert window.recent_user_messages(0) == []
+
+def test_compact_message():
+    assert compact_message("a  short\nmessage", 20) == "a short message"
+    assert compact_message("a longer message to cut", 8) == "a longer..."
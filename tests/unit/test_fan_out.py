@@ -0,0 +1,93 @@
+import time
+import types
+import threading
+import pytest
+from config_file import Config
+from models.bedrock import BedrockInvocationError
+from models.stability import StabilityModel
+from utils.fan_out import fan_out, derive_seeds
+
+def throttled(model_id="stability.stable-diffusion-xl-v1"):
+    return BedrockInvocationError(model_id, 'ThrottlingException', 'Too many requests', 6)
+
+def test_results_keep_the_order_of_the_calls():
+    # Later calls finish first
+    def call(index, delay):
+        time.sleep(delay)
+        return index
+
+    assert fan_out(call, [(index, 0.05 - index * 0.01) for index in range(5)]) == [0, 1, 2, 3, 4]
+
+def test_calls_run_concurrently():
+    barrier = threading.Barrier(3, timeout=5)
+    # Each call waits for the others, so this only returns if they overlap
+    def call(index):
+        barrier.wait()
+        return index
+
+    assert fan_out(call, [(0,), (1,), (2,)]) == [0, 1, 2]
+
+def test_single_call_runs_in_the_calling_thread():
+    assert fan_out(lambda: threading.current_thread(), [()]) == [threading.current_thread()]
+
+def test_failed_call_leaves_a_gap():
+    def call(index):
+        if index == 1:
+            raise throttled()
+        return index
+
+    assert fan_out(call, [(0,), (1,), (2,)]) == [0, None, 2]
+
+def test_first_error_is_raised_when_every_call_failed():
+    def call(index):
+        raise BedrockInvocationError("model", f"Error{index}", "failed", 1)
+
+    with pytest.raises(BedrockInvocationError) as raised:
+        fan_out(call, [(0,), (1,)])
+
+    assert raised.value.code == 'Error0'
+
+def test_other_exceptions_are_not_swallowed():
+    def call(index):
+        if index == 1:
+            raise KeyError('artifacts')
+        return index
+
+    with pytest.raises(KeyError):
+        fan_out(call, [(0,), (1,)])
+
+def test_derived_seeds():
+    assert derive_seeds(42, 3) == [42, 43, 44]
+    assert derive_seeds(0, 3) == [0, 0, 0]
+    assert derive_seeds(9, 3, max_seed=10) == [9, 10, 1]
+
+@pytest.fixture
+def stability_model(monkeypatch):
+    monkeypatch.setattr(Config, 'BEDROCK_BACKEND', 'local')
+    return StabilityModel(types.SimpleNamespace(meta=types.SimpleNamespace(region_name="us-east-1")), None, None)
+
+def test_stability_batch_gets_one_request_per_seed(stability_model, monkeypatch):
+    requests = []
+    def invoke(input_params, fixed_seed):
+        requests.append((input_params['seed'], fixed_seed))
+        return f"image {input_params['seed']}"
+    monkeypatch.setattr(stability_model, 'invoke_stability_model', invoke)
+
+    images = stability_model.invoke_stability_model_batch({'seed': 7, 'steps': 30}, 3, fixed_seed=True)
+
+    assert images == ["image 7", "image 8", "image 9"]
+    assert sorted(requests) == [(7, True), (8, True), (9, True)]
+
+def test_stability_batch_drops_failed_images(stability_model, monkeypatch):
+    def invoke(input_params, fixed_seed):
+        if input_params['seed'] == 8:
+            raise throttled()
+        return f"image {input_params['seed']}"
+    monkeypatch.setattr(stability_model, 'invoke_stability_model', invoke)
+
+    assert stability_model.invoke_stability_model_batch({'seed': 7}, 3) == ["image 7", "image 9"]
+
+@pytest.mark.parametrize('num_images', [0, Config.STABILITY_MAX_IMAGES + 1])
+def test_stability_batch_size_is_capped(stability_model, num_images):
+    with pytest.raises(ValueError):
+        stability_model.invoke_stability_model_batch({'seed': 7}, num_images)
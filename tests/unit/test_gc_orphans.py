@@ -0,0 +1,132 @@
+from datetime import timedelta
+from PIL import Image
+from config_file import Config
+from tools import gc_orphans
+from tools.gc_orphans import collect_garbage, find_garbage
+from utils import known_keys as known_keys_module
+from utils.known_keys import KnownKeys
+from utils.blob_store import add_reference, release_reference, ref_key, list_references
+from utils.previews import preview_key
+from utils.s3_operations import save_image_to_s3, save_to_s3
+
+# With no grace period every object written before the run is old enough
+NO_GRACE = timedelta(0)
+
+def make_image(color):
+    return Image.new('RGB', (8, 8), color)
+
+def save_session(session_name, session_data):
+    save_to_s3({session_name: session_data}, 'stability_sessions')
+
+# Run the collector as tools.gc_orphans does, in a process of its own whose
+# deletes do not reach the app's index of known keys. The app's clock is
+# moved past the grace period first, as objects only become garbage then.
+def run_collector(clock, grace_period=NO_GRACE):
+    clock.advance(Config.GC_GRACE_HOURS * 60 * 60)
+    app_known_keys = known_keys_module._known_keys
+    known_keys_module._known_keys = KnownKeys(Config.KNOWN_KEYS_MAX_ENTRIES, Config.KNOWN_KEYS_TTL)
+    try:
+        return collect_garbage(grace_period, workers=2)
+    finally:
+        known_keys_module._known_keys = app_known_keys
+
+def test_deletes_orphans_and_keeps_referenced_blobs(storage, clock):
+    kept = save_image_to_s3(make_image('red'), 'stability_sessions/s1/base_images')
+    save_session('s1', {'timestamp': '2024-01-01', 'base_images': [kept]})
+    orphan = save_image_to_s3(make_image('blue'), 'stability_sessions/s2/base_images')
+    release_reference(orphan, 'stability_sessions/s2/base_images')
+
+    report = run_collector(clock)
+
+    assert [obj.key for obj in report['orphans']] == sorted([orphan, preview_key(orphan)])
+    assert storage.head(orphan) is None
+    assert storage.head(preview_key(orphan)) is None
+    assert storage.head(kept) is not None
+    assert storage.head(preview_key(kept)) is not None
+
+def test_blob_referenced_by_other_owner_is_kept(storage, clock):
+    image_key = save_image_to_s3(make_image('green'), 'chat_image_editor_sessions/s1/images')
+    add_reference(image_key, 'generation_cache/abc')
+    release_reference(image_key, 'chat_image_editor_sessions/s1/images')
+
+    report = run_collector(clock)
+
+    assert report['orphans'] == []
+    assert storage.head(image_key) is not None
+
+def test_marker_the_session_does_not_hold_is_stale(storage, clock):
+    image_key = save_image_to_s3(make_image('red'), 'stability_sessions/s1/base_images')
+    save_session('s1', {'timestamp': '2024-01-01', 'base_images': []})
+
+    report = run_collector(clock)
+
+    assert [obj.key for obj in report['stale_markers']] == [ref_key(image_key, 'stability_sessions/s1/base_images')]
+    assert list_references(image_key) == []
+    assert storage.head(image_key) is None
+
+def test_missing_marker_of_session_image_is_written(storage, clock):
+    image_key = save_image_to_s3(make_image('red'), 'stability_sessions/s1/base_images')
+    save_session('s1', {'timestamp': '2024-01-01', 'base_images': [image_key]})
+    storage.delete(ref_key(image_key, 'stability_sessions/s1/base_images'))
+
+    report = run_collector(clock)
+
+    assert report['missing_markers'] == [ref_key(image_key, 'stability_sessions/s1/base_images')]
+    assert list_references(image_key) == ['stability_sessions/s1/base_images']
+    assert storage.head(image_key) is not None
+
+def test_objects_within_grace_period_are_kept(storage, clock):
+    image_key = save_image_to_s3(make_image('blue'), 'stability_sessions/s1/base_images')
+    release_reference(image_key, 'stability_sessions/s1/base_images')
+
+    report = run_collector(clock, timedelta(hours=1))
+
+    assert report['orphans'] == []
+    assert storage.head(image_key) is not None
+
+def test_image_saved_again_after_collection_is_uploaded(storage, clock):
+    image_key = save_image_to_s3(make_image('blue'), 'stability_sessions/s1/base_images')
+    release_reference(image_key, 'stability_sessions/s1/base_images')
+    run_collector(clock)
+    assert storage.head(image_key) is None
+
+    assert save_image_to_s3(make_image('blue'), 'stability_sessions/s2/base_images') == image_key
+
+    assert storage.head(image_key) is not None
+    assert storage.head(preview_key(image_key)) is not None
+    assert list_references(image_key) == ['stability_sessions/s2/base_images']
+
+def test_image_saved_again_during_collection_is_kept(storage, clock, monkeypatch):
+    image_key = save_image_to_s3(make_image('blue'), 'stability_sessions/s1/base_images')
+    release_reference(image_key, 'stability_sessions/s1/base_images')
+
+    # The image is saved again after the collector listed the bucket
+    def find_garbage_then_save(grace_period, workers):
+        report = find_garbage(grace_period, workers)
+        save_image_to_s3(make_image('blue'), 'stability_sessions/s2/base_images')
+        return report
+    monkeypatch.setattr(gc_orphans, 'find_garbage', find_garbage_then_save)
+
+    report = run_collector(clock)
+
+    assert report['kept'] == 1
+    assert storage.head(image_key) is not None
+    assert storage.head(preview_key(image_key)) is not None
+
+def test_blob_referenced_while_being_deleted_is_restored(storage, clock, monkeypatch):
+    image_key = save_image_to_s3(make_image('blue'), 'stability_sessions/s1/base_images')
+    release_reference(image_key, 'stability_sessions/s1/base_images')
+    data = storage.get(image_key)
+
+    # A reference appears between the recheck and the delete
+    delete_keys = gc_orphans.delete_keys
+    def delete_keys_after_reference(keys):
+        if image_key in keys:
+            add_reference(image_key, 'stability_sessions/s2/base_images')
+        return delete_keys(keys)
+    monkeypatch.setattr(gc_orphans, 'delete_keys', delete_keys_after_reference)
+
+    report = run_collector(clock)
+
+    assert report['restored'] == 1
+    assert storage.get(image_key) == data
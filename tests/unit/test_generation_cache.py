@@ -0,0 +1,73 @@
+import io
+import pytest
+from PIL import Image
+from utils import generation_cache as generation_cache_module
+from utils import s3_operations
+from utils.generation_cache import GenerationCache, cached_generation, request_fingerprint, cache_owner
+from utils.blob_store import list_references
+from utils.encoded_image import EncodedImage
+from utils.s3_operations import save_images_to_s3
+
+MODEL_ID = "stability.stable-diffusion-xl-v1"
+
+def png(color):
+    buffered = io.BytesIO()
+    Image.new('RGB', (8, 8), color).save(buffered, format='PNG')
+    return buffered.getvalue()
+
+@pytest.fixture
+def cache(monkeypatch, clock):
+    generation_cache = GenerationCache(max_entries=10, ttl=3600, clock=clock)
+    monkeypatch.setattr(generation_cache_module, '_generation_cache', generation_cache)
+    return generation_cache
+
+# Stand-in for a Bedrock call that counts how often it runs
+class Generator:
+    def __init__(self, color='red'):
+        self.color = color
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return [EncodedImage(png(self.color))]
+
+def test_request_with_a_seed_set_by_the_user_is_cached(cache):
+    body = {'text_prompts': [{'text': 'a lighthouse'}], 'seed': 42}
+    generate = Generator()
+
+    first = cached_generation(MODEL_ID, body, True, generate)
+    second = cached_generation(MODEL_ID, dict(body), True, generate)
+
+    assert generate.calls == 1
+    assert second[0].data == first[0].data
+    assert cache.stats()['hits'] == 1
+
+def test_random_seed_request_is_not_cached(cache, storage):
+    generate = Generator()
+
+    for seed in [123, 456]:
+        cached_generation(MODEL_ID, {'text_prompts': [{'text': 'a lighthouse'}], 'seed': seed}, False, generate)
+
+    assert generate.calls == 2
+    assert cache.stats()['stores'] == 0
+    assert list(storage.list('blobs/')) == []
+
+def test_failed_result_is_not_cached(cache):
+    body = {'seed': 42}
+    assert cached_generation(MODEL_ID, body, True, lambda: None) is None
+    assert cache.stats()['stores'] == 0
+
+def test_new_result_is_saved_once(cache, monkeypatch):
+    encodes = []
+    encode_for_storage = s3_operations.encode_for_storage
+    def counting_encode_for_storage(img):
+        encodes.append(1)
+        return encode_for_storage(img)
+    monkeypatch.setattr(s3_operations, 'encode_for_storage', counting_encode_for_storage)
+    body = {'seed': 42}
+
+    images = cached_generation(MODEL_ID, body, True, Generator())
+    image_keys = save_images_to_s3(images, 'stability_sessions/s1/base_images')
+
+    assert len(encodes) == 1
+    assert sorted(list_references(image_keys[0])) == [cache_owner(request_fingerprint(MODEL_ID, body)), 'stability_sessions/s1/base_images']
@@ -0,0 +1,141 @@
+import io
+import os
+import pytest
+from PIL import Image
+from utils.image_cache import ImageCache
+
+# 8x8 RGB images take 192 bytes decoded
+DECODED_SIZE = 8 * 8 * 3
+
+def png(color):
+    buffered = io.BytesIO()
+    Image.new('RGB', (8, 8), color).save(buffered, format='PNG')
+    return buffered.getvalue()
+
+OBJECTS = {f"blobs/{color}.png": png(color) for color in ['red', 'green', 'blue', 'white']}
+
+# Storage stand-in that counts the reads of every key
+class Fetcher:
+    def __init__(self):
+        self.reads = []
+
+    def __call__(self, key):
+        self.reads.append(key)
+        return OBJECTS[key]
+
+@pytest.fixture
+def fetch():
+    return Fetcher()
+
+def disk_files(directory):
+    return sorted(os.listdir(directory))
+
+def test_memory_tier_evicts_the_least_recently_used_image(fetch, tmp_path):
+    cache = ImageCache(fetch, memory_bytes=2 * DECODED_SIZE, disk_bytes=0, disk_dir=str(tmp_path))
+
+    cache.get_image('blobs/red.png')
+    cache.get_image('blobs/green.png')
+    cache.get_image('blobs/red.png')
+    cache.get_image('blobs/blue.png')
+
+    stats = cache.stats()
+    assert stats['memory_entries'] == 2
+    assert stats['memory_bytes'] == 2 * DECODED_SIZE
+    assert stats['memory_hits'] == 1
+    assert stats['evictions'] == 1
+    cache.get_image('blobs/red.png')
+    cache.get_image('blobs/green.png')
+    assert fetch.reads == ['blobs/red.png', 'blobs/green.png', 'blobs/blue.png', 'blobs/green.png']
+
+def test_image_larger_than_the_memory_budget_is_not_kept(fetch, tmp_path):
+    cache = ImageCache(fetch, memory_bytes=DECODED_SIZE - 1, disk_bytes=0, disk_dir=str(tmp_path))
+
+    cache.get_image('blobs/red.png')
+    cache.get_image('blobs/red.png')
+
+    assert cache.stats()['memory_entries'] == 0
+    assert fetch.reads == ['blobs/red.png', 'blobs/red.png']
+
+def test_disk_tier_evicts_the_least_recently_used_file(fetch, tmp_path):
+    budget = 2 * max(len(data) for data in OBJECTS.values())
+    cache = ImageCache(fetch, memory_bytes=0, disk_bytes=budget, disk_dir=str(tmp_path))
+
+    cache.get_bytes('blobs/red.png')
+    cache.get_bytes('blobs/green.png')
+    cache.get_bytes('blobs/red.png')
+    cache.get_bytes('blobs/blue.png')
+
+    stats = cache.stats()
+    assert stats['disk_hits'] == 1
+    assert stats['misses'] == 3
+    assert stats['disk_bytes'] <= budget
+    assert len(disk_files(tmp_path)) == stats['disk_entries'] == 2
+    assert cache.get_bytes('blobs/red.png') == OBJECTS['blobs/red.png']
+    assert fetch.reads == ['blobs/red.png', 'blobs/green.png', 'blobs/blue.png']
+
+def test_memory_hit_skips_the_disk(fetch, tmp_path):
+    cache = ImageCache(fetch, memory_bytes=10 * DECODED_SIZE, disk_bytes=10 ** 6, disk_dir=str(tmp_path))
+
+    first = cache.get_image('blobs/red.png')
+    second = cache.get_image('blobs/red.png')
+
+    assert second is first
+    assert cache.stats()['memory_hits'] == 1
+    assert cache.stats()['disk_hits'] == 0
+
+def test_budget_zero_disables_both_tiers(fetch, tmp_path):
+    cache = ImageCache(fetch, memory_bytes=0, disk_bytes=0, disk_dir=str(tmp_path / 'cache'))
+
+    for _ in range(3):
+        assert cache.get_image('blobs/red.png').getpixel((0, 0)) == (255, 0, 0)
+    cache.put_bytes('blobs/green.png', OBJECTS['blobs/green.png'])
+
+    assert len(fetch.reads) == 3
+    assert cache.stats()['misses'] == 3
+    assert not (tmp_path / 'cache').exists()
+
+def test_put_bytes_seeds_the_disk_tier(fetch, tmp_path):
+    cache = ImageCache(fetch, memory_bytes=0, disk_bytes=10 ** 6, disk_dir=str(tmp_path))
+
+    cache.put_bytes('blobs/red.png', OBJECTS['blobs/red.png'])
+
+    assert cache.get_bytes('blobs/red.png') == OBJECTS['blobs/red.png']
+    assert fetch.reads == []
+
+def test_disk_tier_survives_a_restart(fetch, tmp_path):
+    ImageCache(fetch, memory_bytes=0, disk_bytes=10 ** 6, disk_dir=str(tmp_path)).get_bytes('blobs/red.png')
+
+    cache = ImageCache(fetch, memory_bytes=0, disk_bytes=10 ** 6, disk_dir=str(tmp_path))
+
+    assert cache.get_bytes('blobs/red.png') == OBJECTS['blobs/red.png']
+    assert cache.stats()['disk_hits'] == 1
+    assert fetch.reads == ['blobs/red.png']
+
+def test_corrupted_disk_entry_is_fetched_again(fetch, tmp_path):
+    ImageCache(fetch, memory_bytes=0, disk_bytes=10 ** 6, disk_dir=str(tmp_path)).get_bytes('blobs/red.png')
+    [file_name] = disk_files(tmp_path)
+    with open(tmp_path / file_name, 'wb') as f:
+        f.write(b'not an image')
+    cache = ImageCache(fetch, memory_bytes=10 * DECODED_SIZE, disk_bytes=10 ** 6, disk_dir=str(tmp_path))
+
+    assert cache.get_image('blobs/red.png').getpixel((0, 0)) == (255, 0, 0)
+
+    assert fetch.reads == ['blobs/red.png', 'blobs/red.png']
+    with open(tmp_path / file_name, 'rb') as f:
+        assert f.read() == OBJECTS['blobs/red.png']
+
+def test_truncated_disk_entry_is_fetched_again(fetch, tmp_path):
+    cache = ImageCache(fetch, memory_bytes=0, disk_bytes=10 ** 6, disk_dir=str(tmp_path))
+    cache.get_bytes('blobs/red.png')
+    [file_name] = disk_files(tmp_path)
+    with open(tmp_path / file_name, 'r+b') as f:
+        f.truncate(10)
+
+    assert cache.get_bytes('blobs/red.png') == OBJECTS['blobs/red.png']
+    assert cache.stats()['disk_bytes'] == len(OBJECTS['blobs/red.png'])
+
+def test_unreadable_object_raises(tmp_path):
+    cache = ImageCache(lambda key: b'not an image', memory_bytes=10 ** 6, disk_bytes=0, disk_dir=str(tmp_path))
+
+    with pytest.raises(OSError):
+        cache.get_image('blobs/red.png')
@@ -0,0 +1,112 @@
+import io
+import random
+import pytest
+from PIL import Image, ImageChops, features
+from config_file import Config
+from utils.encoded_image import EncodedImage, png_bytes
+from utils.image_codecs import encode_for_storage, image_content_type, download_file_name
+
+needs_webp = pytest.mark.skipif(not features.check('webp'), reason="Pillow built without WebP")
+
+# Image of random pixels, so lossy or wrong encodings show up as differences
+def noise(mode='RGB', size=(32, 24)):
+    rng = random.Random(size[0] * size[1])
+    return Image.frombytes(mode, size, bytes(rng.randrange(256) for _ in range(size[0] * size[1] * len(mode))))
+
+def encoded(img, format, **options):
+    buffered = io.BytesIO()
+    img.save(buffered, format=format, **options)
+    return EncodedImage(buffered.getvalue())
+
+def decode(data):
+    img = Image.open(io.BytesIO(data))
+    img.load()
+    return img
+
+def same_pixels(a, b):
+    return a.mode == b.mode and a.size == b.size and ImageChops.difference(a, b).getbbox() is None
+
+@pytest.fixture
+def storage_format(monkeypatch):
+    def set_format(storage_format):
+        monkeypatch.setattr(Config, 'IMAGE_STORAGE_FORMAT', storage_format)
+    return set_format
+
+def test_model_png_is_stored_as_it_is(storage_format):
+    storage_format('png')
+    model_png = encoded(noise(), 'PNG', compress_level=1)
+
+    data, extension, content_type = encode_for_storage(model_png)
+
+    assert data == model_png.data
+    assert (extension, content_type) == ('png', 'image/png')
+
+@pytest.mark.parametrize('mode', ['RGB', 'RGBA', 'L'])
+def test_pixels_are_stored_as_lossless_png(storage_format, mode):
+    storage_format('png')
+    img = noise(mode)
+
+    data, extension, _ = encode_for_storage(img)
+
+    assert extension == 'png'
+    assert same_pixels(decode(data), img)
+
+def test_jpeg_is_re_encoded_as_png(storage_format):
+    storage_format('png')
+    jpeg = encoded(noise(), 'JPEG')
+
+    data, extension, _ = encode_for_storage(jpeg)
+
+    assert extension == 'png'
+    assert data != jpeg.data
+    assert same_pixels(decode(data), decode(jpeg.data))
+
+@needs_webp
+@pytest.mark.parametrize('mode', ['RGB', 'RGBA'])
+def test_webp_storage_is_lossless(storage_format, mode):
+    storage_format('webp')
+    model_png = encoded(noise(mode), 'PNG')
+
+    data, extension, content_type = encode_for_storage(model_png)
+
+    assert (extension, content_type) == ('webp', 'image/webp')
+    assert EncodedImage(data).format == 'WEBP'
+    assert same_pixels(decode(data), decode(model_png.data))
+
+@needs_webp
+def test_webp_is_stored_as_it_is(storage_format):
+    storage_format('webp')
+    webp = encoded(noise(), 'WEBP', lossless=True)
+
+    assert encode_for_storage(webp)[0] == webp.data
+
+def test_original_keeps_uploaded_jpeg(storage_format):
+    storage_format('original')
+    jpeg = encoded(noise(), 'JPEG')
+
+    assert encode_for_storage(jpeg) == (jpeg.data, 'jpg', 'image/jpeg')
+    assert encode_for_storage(noise())[1] == 'png'
+
+def test_unknown_storage_format_is_rejected(storage_format):
+    storage_format('gif')
+    with pytest.raises(ValueError):
+        encode_for_storage(noise())
+
+def test_png_bytes_only_re_encode_other_formats():
+    model_png = encoded(noise(), 'PNG')
+    jpeg = encoded(noise(), 'JPEG')
+
+    assert png_bytes(model_png) == model_png.data
+    assert EncodedImage(png_bytes(jpeg)).format == 'PNG'
+    assert same_pixels(decode(png_bytes(jpeg)), decode(jpeg.data))
+
+def test_encoded_image_formats():
+    assert encoded(noise(), 'PNG').format == 'PNG'
+    assert encoded(noise(), 'JPEG').format == 'JPEG'
+    assert EncodedImage(b'not an image').format is None
+
+def test_stored_key_names():
+    assert image_content_type('blobs/abc.webp') == 'image/webp'
+    assert image_content_type('blobs/abc') == 'application/octet-stream'
+    assert download_file_name('blobs/abc.webp', 'image_3') == 'image_3.webp'
+    assert download_file_name('legacy/abc', 'image_3') == 'image_3.png'
@@ -0,0 +1,107 @@
+import json
+import pickle
+import pytest
+from PIL import Image
+from config_file import Config
+from utils import session_format
+from utils.blob_store import is_blob_key
+from utils.session_format import (
+    encode_document, decode_document, encode_session, decode_session, validate_session,
+    SessionFormatError, SESSION_FILE, LEGACY_SESSION_FILE, ZSTD_MAGIC,
+)
+from utils.s3_operations import load_from_s3, save_to_s3, flush_session_stores
+
+SESSION = {
+    'timestamp': '2024-01-01 10:00:00',
+    'step': 'editing',
+    'base_images': ['blobs/a.png'],
+    'variation_images': [],
+    'editing_images': ['blobs/b.png'],
+    'chat_history': [{'type': 'user', 'content': 'a lighthouse'}, {'type': 'image', 'content': 'blobs/a.png'}],
+    'prompt': 'a lighthouse at dusk, été',
+}
+
+@pytest.fixture
+def uncompressed(monkeypatch):
+    monkeypatch.setattr(Config, 'SESSION_COMPRESSION', None)
+
+def test_session_round_trip(uncompressed):
+    raw = encode_session(SESSION)
+
+    assert json.loads(raw) == {'version': 1, 'data': SESSION}
+    assert decode_session(raw) == SESSION
+
+def test_chat_history_round_trip(uncompressed):
+    history = [{'role': 'user', 'content': 'hello'}, {'role': 'assistant', 'content': 'hi'}]
+    assert decode_document(encode_document(history)) == history
+
+def test_compressed_session_round_trip(monkeypatch):
+    pytest.importorskip('zstandard')
+    monkeypatch.setattr(Config, 'SESSION_COMPRESSION', 'zstd')
+
+    raw = encode_session(SESSION)
+
+    assert raw[:4] == ZSTD_MAGIC
+    assert decode_session(raw) == SESSION
+    monkeypatch.setattr(Config, 'SESSION_COMPRESSION', None)
+    assert decode_session(raw) == SESSION
+
+def test_compression_without_zstandard_fails_loudly(monkeypatch):
+    monkeypatch.setattr(session_format, 'zstandard', None)
+    monkeypatch.setattr(Config, 'SESSION_COMPRESSION', 'zstd')
+
+    with pytest.raises(RuntimeError):
+        encode_session(SESSION)
+    with pytest.raises(RuntimeError):
+        decode_session(ZSTD_MAGIC + b'compressed')
+
+@pytest.mark.parametrize('raw', [
+    b'{"version": 2, "data": {}}',
+    b'{"data": {}}',
+])
+def test_unknown_version_is_rejected(raw):
+    with pytest.raises(SessionFormatError, match="version"):
+        decode_document(raw)
+
+@pytest.mark.parametrize('raw', [b'[1, 2]', b'{"version": 1}'])
+def test_non_document_is_rejected(raw):
+    with pytest.raises(SessionFormatError):
+        decode_document(raw)
+
+@pytest.mark.parametrize('session_data', [
+    ['not', 'a', 'dict'],
+    {'timestamp': 20240101},
+    {'base_images': 'blobs/a.png'},
+    {'editing_images': ['blobs/a.png', None]},
+    {'chat_history': [{'type': 'user'}]},
+    {'chat_history': ['hello']},
+])
+def test_invalid_sessions_are_rejected(session_data):
+    with pytest.raises(SessionFormatError):
+        validate_session(session_data)
+
+def test_invalid_session_is_not_encoded(uncompressed):
+    with pytest.raises(SessionFormatError):
+        encode_session({'base_images': [Image.new('RGB', (8, 8))]})
+
+def test_legacy_pickle_is_read_and_migrated(storage, uncompressed):
+    legacy_session = dict(SESSION, base_images=['blobs/a.png', Image.new('RGB', (8, 8), 'red')])
+    storage.put(f"stability_sessions/s1/{LEGACY_SESSION_FILE}", pickle.dumps(legacy_session))
+
+    store = load_from_s3('stability_sessions')
+    assert store['s1']['prompt'] == SESSION['prompt']
+    assert isinstance(store['s1']['base_images'][1], Image.Image)
+    save_to_s3(store, 'stability_sessions')
+    flush_session_stores([store])
+
+    assert storage.head(f"stability_sessions/s1/{LEGACY_SESSION_FILE}") is None
+    migrated = decode_session(storage.get(f"stability_sessions/s1/{SESSION_FILE}"))
+    assert migrated['base_images'][0] == 'blobs/a.png'
+    assert is_blob_key(migrated['base_images'][1])
+    assert migrated['chat_history'] == SESSION['chat_history']
+
+def test_current_format_wins_over_a_leftover_pickle(storage, uncompressed):
+    storage.put(f"stability_sessions/s1/{LEGACY_SESSION_FILE}", pickle.dumps(dict(SESSION, prompt='old')))
+    storage.put(f"stability_sessions/s1/{SESSION_FILE}", encode_session(SESSION))
+
+    assert load_from_s3('stability_sessions')['s1']['prompt'] == SESSION['prompt']
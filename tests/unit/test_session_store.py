@@ -0,0 +1,126 @@
+import pytest
+from utils.session_store import SessionStore, summarize_session
+from utils.session_format import SESSION_FILE
+from utils.s3_operations import save_to_s3, flush_session_stores, load_from_s3, load_manifest, save_manifest
+
+def session(timestamp, base_images=()):
+    return {'timestamp': timestamp, 'step': 'base', 'base_images': list(base_images)}
+
+# Record the keys written to storage
+@pytest.fixture
+def writes(storage, monkeypatch):
+    written = []
+    put = storage.put
+    def recording_put(key, data, content_type=None):
+        written.append(key)
+        put(key, data, content_type=content_type)
+    monkeypatch.setattr(storage, 'put', recording_put)
+    return written
+
+def stored_store(key, sessions):
+    store = SessionStore(key)
+    for session_name, session_data in sessions.items():
+        store[session_name] = session_data
+    save_to_s3(store, key)
+    flush_session_stores([store])
+    return load_from_s3(key)
+
+def test_listing_does_not_load_bodies():
+    loaded = []
+    def loader(session_name):
+        loaded.append(session_name)
+        return session('2024-01-01'), None, False
+    manifest = {'s1': summarize_session(session('2024-01-01')), 's2': summarize_session(session('2024-01-02'))}
+    store = SessionStore('stability_sessions', manifest=manifest, loader=loader)
+
+    assert sorted(store) == ['s1', 's2']
+    assert len(store) == 2
+    assert 's1' in store
+    assert store.summary('s2')['timestamp'] == '2024-01-02'
+    assert loaded == []
+
+    store['s1']
+    store['s1']
+    assert loaded == ['s1']
+
+def test_session_missing_from_storage_is_dropped():
+    store = SessionStore('stability_sessions', manifest={'s1': {'timestamp': ''}}, loader=lambda session_name: None)
+
+    with pytest.raises(KeyError):
+        store['s1']
+
+    assert 's1' not in store
+    assert store.pop_manifest_changes() == {'s1': None}
+
+def test_flush_writes_only_changed_sessions(writes):
+    store = stored_store('stability_sessions', {'s1': session('2024-01-01'), 's2': session('2024-01-02')})
+    store['s1']
+    store['s2']
+    writes.clear()
+
+    store['s1']['step'] = 'variation'
+    save_to_s3(store, 'stability_sessions')
+    flush_session_stores([store])
+
+    assert writes == [f"stability_sessions/s1/{SESSION_FILE}", "stability_sessions/manifest.json"]
+
+def test_saves_in_one_run_are_written_once(writes):
+    store = stored_store('stability_sessions', {'s1': session('2024-01-01')})
+    store['s1']
+    writes.clear()
+
+    for step in ['variation', 'editing']:
+        store['s1']['step'] = step
+        save_to_s3(store, 'stability_sessions')
+    flush_session_stores([store])
+    flush_session_stores([store])
+
+    assert writes == [f"stability_sessions/s1/{SESSION_FILE}", "stability_sessions/manifest.json"]
+
+def test_unchanged_store_is_not_written(writes):
+    store = stored_store('stability_sessions', {'s1': session('2024-01-01')})
+    store['s1']
+    writes.clear()
+
+    save_to_s3(store, 'stability_sessions')
+    flush_session_stores([store])
+
+    assert writes == []
+
+def test_deleted_session_is_removed_from_manifest():
+    store = stored_store('stability_sessions', {'s1': session('2024-01-01'), 's2': session('2024-01-02')})
+
+    del store['s1']
+    save_to_s3(store, 'stability_sessions')
+    flush_session_stores([store])
+
+    assert sorted(load_manifest('stability_sessions')) == ['s2']
+
+def test_sessions_missing_from_manifest_are_restored(storage):
+    stored_store('stability_sessions', {'s1': session('2024-01-01'), 's2': session('2024-01-02'), 's3': session('2024-01-03')})
+    # Two browsers merged the manifest at the same time and one lost
+    save_manifest('stability_sessions', {'s1': summarize_session(session('2024-01-01'))})
+
+    store = load_from_s3('stability_sessions')
+
+    assert sorted(store) == ['s1', 's2', 's3']
+    assert store.summary('s3')['timestamp'] == '2024-01-03'
+    assert sorted(load_manifest('stability_sessions')) == ['s1', 's2', 's3']
+
+def test_manifest_entry_without_a_stored_body_is_kept_until_opened(storage):
+    stored_store('stability_sessions', {'s1': session('2024-01-01')})
+    # s2 is listed in the manifest while its body is still being written
+    save_manifest('stability_sessions', {**load_manifest('stability_sessions'), 's2': summarize_session(session('2024-01-02'))})
+
+    store = load_from_s3('stability_sessions')
+
+    assert sorted(store) == ['s1', 's2']
+
+def test_bucket_without_manifest_is_indexed(storage):
+    stored_store('stability_sessions', {'s1': session('2024-01-01'), 's2': session('2024-01-02')})
+    storage.delete('stability_sessions/manifest.json')
+
+    store = load_from_s3('stability_sessions')
+
+    assert sorted(store) == ['s1', 's2']
+    assert sorted(load_manifest('stability_sessions')) == ['s1', 's2']
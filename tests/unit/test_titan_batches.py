@@ -0,0 +1,62 @@
+import types
+import pytest
+from config_file import Config
+from models.bedrock import BedrockInvocationError
+from models.titan import TitanModel, plan_image_batches, MAX_IMAGES_PER_REQUEST, MAX_SEED
+
+@pytest.mark.parametrize('num_images, counts', [
+    (1, [1]),
+    (5, [5]),
+    (6, [5, 1]),
+    (12, [5, 5, 2]),
+    (15, [5, 5, 5]),
+])
+def test_jobs_are_split_into_requests_of_at_most_five(num_images, counts):
+    assert [count for count, _ in plan_image_batches(num_images, 42)] == counts
+
+def test_largest_job_is_planned_in_full():
+    batches = plan_image_batches(Config.TITAN_MAX_IMAGES, 42)
+
+    assert sum(count for count, _ in batches) == Config.TITAN_MAX_IMAGES
+    assert all(count <= MAX_IMAGES_PER_REQUEST for count, _ in batches)
+
+def test_each_request_gets_the_next_seed():
+    assert [seed for _, seed in plan_image_batches(12, 42)] == [42, 43, 44]
+    assert [seed for _, seed in plan_image_batches(12, MAX_SEED)] == [MAX_SEED, 1, 2]
+
+def test_random_seed_stays_random():
+    assert plan_image_batches(7, 0) == [(5, 0), (2, 0)]
+
+@pytest.fixture
+def titan_model(monkeypatch):
+    monkeypatch.setattr(Config, 'BEDROCK_BACKEND', 'local')
+    return TitanModel(types.SimpleNamespace(meta=types.SimpleNamespace(region_name="us-east-1")), None, None)
+
+def request(num_images, seed):
+    return {"taskType": "TEXT_IMAGE", "textToImageParams": {"text": "a lighthouse"},
+            "imageGenerationConfig": {"numberOfImages": num_images, "seed": seed, "cfgScale": 8.0}}
+
+def test_batch_images_are_merged_in_plan_order(titan_model, monkeypatch):
+    def invoke(input_params, fixed_seed):
+        config = input_params["imageGenerationConfig"]
+        return [f"{config['seed']}-{index}" for index in range(config["numberOfImages"])]
+    monkeypatch.setattr(titan_model, 'invoke_titan_model', invoke)
+
+    images = titan_model.invoke_titan_model_batches(request(7, 42), 7)
+
+    assert images == ["42-0", "42-1", "42-2", "42-3", "42-4", "43-0", "43-1"]
+
+def test_failed_batch_is_left_out(titan_model, monkeypatch):
+    def invoke(input_params, fixed_seed):
+        config = input_params["imageGenerationConfig"]
+        if config['seed'] == 43:
+            raise BedrockInvocationError(titan_model.model_id, 'ThrottlingException', 'Too many requests', 6)
+        return [config['seed']] * config["numberOfImages"]
+    monkeypatch.setattr(titan_model, 'invoke_titan_model', invoke)
+
+    assert titan_model.invoke_titan_model_batches(request(12, 42), 12) == [42] * 5 + [44] * 2
+
+@pytest.mark.parametrize('num_images', [0, Config.TITAN_MAX_IMAGES + 1])
+def test_job_size_is_capped(titan_model, num_images):
+    with pytest.raises(ValueError):
+        titan_model.invoke_titan_model_batches(request(num_images, 42), num_images)
@@ -0,0 +1,111 @@
+import threading
+import pytest
+from utils import write_behind as write_behind_module
+from utils.write_behind import WriteBehindQueue, SynchronousWrites, read_through_pending
+
+@pytest.fixture
+def queue(monkeypatch):
+    write_behind = WriteBehindQueue(workers=4, max_pending=64, retries=2, backoff=0)
+    monkeypatch.setattr(write_behind_module, '_write_behind', write_behind)
+    yield write_behind
+    write_behind.flush()
+
+def test_writes_to_one_key_land_in_order(queue, storage):
+    applied = []
+    lock = threading.Lock()
+    def write(key, value):
+        with lock:
+            applied.append((key, value))
+        storage.put(key, str(value).encode())
+
+    for value in range(50):
+        for key in ['a', 'b', 'c']:
+            queue.submit(key, lambda key=key, value=value: write(key, value))
+    queue.flush()
+
+    for key in ['a', 'b', 'c']:
+        assert [value for applied_key, value in applied if applied_key == key] == list(range(50))
+        assert storage.get(key) == b'49'
+
+def test_queued_write_is_readable_before_it_lands(queue, storage):
+    release = threading.Event()
+    def write():
+        release.wait()
+        storage.put('sessions/s1.json', b'new')
+    queue.submit('sessions/s1.json', write, pending={'sessions/s1.json': b'new'})
+
+    assert queue.is_pending('sessions/s1.json')
+    assert read_through_pending('sessions/s1.json') == b'new'
+    assert storage.head('sessions/s1.json') is None
+
+    release.set()
+    queue.flush()
+    assert not queue.is_pending('sessions/s1.json')
+    assert queue.pending_bytes('sessions/s1.json') is None
+    assert read_through_pending('sessions/s1.json') == b'new'
+
+def test_failed_write_is_retried(queue, storage):
+    attempts = []
+    def flaky_write():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise IOError("connection reset")
+        storage.put('key', b'data')
+
+    queue.submit('key', flaky_write)
+    queue.flush()
+
+    assert len(attempts) == 3
+    assert storage.get('key') == b'data'
+
+# The background queue and the synchronous writes used when WRITE_BEHIND is off
+@pytest.fixture(params=['queue', 'synchronous'])
+def writes(request):
+    if request.param == 'queue':
+        writes = WriteBehindQueue(workers=2, max_pending=8, retries=2, backoff=0)
+    else:
+        writes = SynchronousWrites(retries=2, backoff=0)
+    yield writes
+    writes.flush()
+
+def test_on_failure_is_called_once_retries_are_exhausted(writes):
+    attempts = []
+    failures = []
+    def failing_write():
+        attempts.append(1)
+        raise IOError("access denied")
+
+    writes.submit('key', failing_write, pending={'key': b'data'}, on_failure=lambda: failures.append('key'))
+    writes.flush()
+
+    assert len(attempts) == 3
+    assert failures == ['key']
+    assert not writes.is_pending('key')
+
+def test_failed_put_is_reported_the_same_way(writes, storage, monkeypatch):
+    def failing_put(key, data, content_type=None):
+        raise IOError("access denied")
+    monkeypatch.setattr(storage, 'put', failing_put)
+    failures = []
+
+    writes.put('key', b'data', on_failure=lambda: failures.append('key'))
+    writes.flush()
+
+    assert failures == ['key']
+
+def test_wait_for_prefix_waits_for_queued_writes(queue, storage):
+    release = threading.Event()
+    def write():
+        release.wait()
+        storage.put('stability_sessions/s1/session_data.json', b'data')
+    queue.submit('stability_sessions/s1/session_data.json', write, pending={'stability_sessions/s1/session_data.json': b'data'})
+
+    waiter = threading.Thread(target=queue.wait_for_prefix, args=('stability_sessions/s1/',))
+    waiter.start()
+    waiter.join(timeout=0.1)
+    assert waiter.is_alive()
+
+    release.set()
+    waiter.join(timeout=5)
+    assert not waiter.is_alive()
+    assert storage.head('stability_sessions/s1/session_data.json') is not None